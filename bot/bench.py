@@ -0,0 +1,244 @@
+"""Render benchmark for every document template, with JSON baselines for regression checks.
+
+Each ``DocumentDefinition`` is rendered to PDF and DOCX using the ``example`` value of every
+question. Jinja rendering, layout and serialisation are timed separately::
+
+    python -m bot.bench --iterations 30 --output bench_baseline.json
+    python -m bot.bench --compare bench_baseline.json --threshold 0.15
+    python -m bot.bench --formats pdf --pdf-profiles compact,standard,archival
+
+For PDF, "serialize" is the time spent in ``Canvas.save`` (writing the PDF file). "layout" is the
+rest of ``doc.build``: flowable wrapping, pagination and drawing page content.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from reportlab.pdfgen.canvas import Canvas
+
+from .handlers.documents import DOCUMENTS, TEMPLATE_LOADER, DocumentDefinition
+from .services.docx_builder import DocxBuilder
+from .services.pdf_builder import PDF_PROFILES, PdfBuilder
+
+STAGES = ("jinja", "layout", "serialize", "total")
+FORMATS = ("pdf", "docx")
+
+
+class _TimedCanvas(Canvas):
+    save_seconds = 0.0
+
+    def save(self) -> None:
+        started = time.perf_counter()
+        super().save()
+        _TimedCanvas.save_seconds = time.perf_counter() - started
+
+
+def _p95(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def _render_pdf(
+    builder: PdfBuilder, document: DocumentDefinition, context: Dict[str, str], profile: Optional[str] = None
+) -> Tuple[Dict[str, float], int]:
+    started = time.perf_counter()
+    rendered = builder.template_loader.render(document.template, context)
+    jinja = time.perf_counter() - started
+
+    started = time.perf_counter()
+    output = builder.build_rendered(
+        document.template, rendered, canvasmaker=_TimedCanvas, profile=profile, title=document.title
+    )
+    build = time.perf_counter() - started
+    serialize = _TimedCanvas.save_seconds
+    return {"jinja": jinja, "layout": build - serialize, "serialize": serialize}, len(output.getvalue())
+
+
+def _render_docx(builder: DocxBuilder, document: DocumentDefinition, context: Dict[str, str]) -> Tuple[Dict[str, float], int]:
+    started = time.perf_counter()
+    rendered = builder.template_loader.render(document.template, context)
+    jinja = time.perf_counter() - started
+
+    started = time.perf_counter()
+    docx_document = builder.build_document(rendered)
+    layout = time.perf_counter() - started
+
+    started = time.perf_counter()
+    output = builder.save(docx_document)
+    serialize = time.perf_counter() - started
+    return {"jinja": jinja, "layout": layout, "serialize": serialize}, len(output.getvalue())
+
+
+def _peak_allocation(render: Callable[[], Any], iterations: int) -> int:
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            render()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+        return int(statistics.mean(peaks))
+    finally:
+        tracemalloc.stop()
+
+
+def bench_template(
+    document: DocumentDefinition,
+    fmt: str,
+    iterations: int,
+    warmup: int = 2,
+    alloc_iterations: int = 3,
+    pdf_builder: Optional[PdfBuilder] = None,
+    pdf_profile: Optional[str] = None,
+) -> Dict[str, Any]:
+    context = document.example_context()
+    if fmt == "pdf":
+        builder = pdf_builder or PdfBuilder(TEMPLATE_LOADER)
+        render = lambda: _render_pdf(builder, document, context, pdf_profile)  # noqa: E731
+    else:
+        docx_builder = DocxBuilder(TEMPLATE_LOADER)
+        render = lambda: _render_docx(docx_builder, document, context)  # noqa: E731
+
+    for _ in range(warmup):
+        render()
+    samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    size = 0
+    for _ in range(iterations):
+        timings, size = render()
+        timings["total"] = sum(timings.values())
+        for stage in STAGES:
+            samples[stage].append(timings[stage] * 1000)
+
+    result: Dict[str, Any] = {
+        stage: {"mean_ms": round(statistics.mean(values), 3), "p95_ms": round(_p95(values), 3)}
+        for stage, values in samples.items()
+    }
+    result["size_bytes"] = size
+    result["alloc_peak_bytes"] = _peak_allocation(render, alloc_iterations) if alloc_iterations else 0
+    return result
+
+
+def run(
+    iterations: int,
+    formats: List[str],
+    codes: Optional[List[str]] = None,
+    alloc_iterations: int = 3,
+    pdf_builder: Optional[PdfBuilder] = None,
+    pdf_profiles: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    documents = [document for document in DOCUMENTS if not codes or document.code in codes]
+    results: Dict[str, Any] = {}
+    for document in documents:
+        for fmt in formats:
+            variants = [(f"{document.code}.{fmt}", None)]
+            if fmt == "pdf" and pdf_profiles:
+                variants = [(f"{document.code}.pdf:{profile}", profile) for profile in pdf_profiles]
+            for name, profile in variants:
+                results[name] = bench_template(
+                    document,
+                    fmt,
+                    iterations,
+                    alloc_iterations=alloc_iterations,
+                    pdf_builder=pdf_builder,
+                    pdf_profile=profile,
+                )
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "iterations": iterations,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Return regressions where mean total time or output size grew by more than ``threshold``."""
+
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for metric, now, before in (
+            ("total mean", result["total"]["mean_ms"], previous["total"]["mean_ms"]),
+            ("size", result["size_bytes"], previous["size_bytes"]),
+        ):
+            if before and (now - before) / before > threshold:
+                regressions.append(f"{name}: {metric} {before} → {now} (+{(now - before) / before:.0%})")
+    return regressions
+
+
+def print_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"{'template':<34} {'jinja':>7} {'layout':>8} {'serial':>8} {'total':>8} {'p95':>8} {'size KB':>8} {'alloc KB':>9}"
+    if baseline:
+        header += f" {'Δ total':>8}"
+    print(header)
+    for name, result in report["results"].items():
+        line = (
+            f"{name:<34} {result['jinja']['mean_ms']:>7.2f} {result['layout']['mean_ms']:>8.2f} "
+            f"{result['serialize']['mean_ms']:>8.2f} {result['total']['mean_ms']:>8.2f} "
+            f"{result['total']['p95_ms']:>8.2f} {result['size_bytes'] / 1024:>8.1f} "
+            f"{result['alloc_peak_bytes'] / 1024:>9.0f}"
+        )
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous and previous["total"]["mean_ms"]:
+            delta = result["total"]["mean_ms"] / previous["total"]["mean_ms"] - 1
+            line += f" {delta:>+8.0%}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк рендера шаблонов в PDF и DOCX")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--formats", default="pdf,docx", help="pdf,docx")
+    parser.add_argument("--templates", help="коды документов через запятую (по умолчанию все)")
+    parser.add_argument("--pdf-profiles", help="профили PDF через запятую: " + ",".join(PDF_PROFILES))
+    parser.add_argument("--alloc-iterations", type=int, default=3, help="0 — не замерять аллокации")
+    parser.add_argument("--output", help="сохранить результаты в JSON (новый baseline)")
+    parser.add_argument("--compare", help="JSON baseline для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост, доля (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    formats = [fmt for fmt in args.formats.split(",") if fmt in FORMATS]
+    codes = args.templates.split(",") if args.templates else None
+    pdf_profiles = args.pdf_profiles.split(",") if args.pdf_profiles else None
+    for profile in pdf_profiles or ():
+        PdfBuilder.get_profile(profile)
+    report = run(args.iterations, formats, codes, alloc_iterations=args.alloc_iterations, pdf_profiles=pdf_profiles)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    print_table(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+    if baseline:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nРегрессии (порог {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nРегрессий нет (порог {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
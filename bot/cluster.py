@@ -0,0 +1,405 @@
+"""Supervisor mode: one update intake (polling or webhook), N dispatcher worker processes.
+
+Updates are routed by a consistent hash of the chat ID, so FSM state and ``StorageService``
+entries of a chat always live in the same worker. Download buttons carry signed tokens that
+point into the shared ``document_store`` SQLite file, so any worker can serve them.
+
+Benchmark: ``python -m bot.cluster --bench --max-workers 4 --jobs 200``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import queue
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .config import Settings, load_settings
+
+HEARTBEAT_INTERVAL = 1.0
+MONITOR_INTERVAL = 2.0
+RESTART_BACKOFF = 1.0
+
+_ROUTING_KEYS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach): minimal remapping when ``buckets`` changes."""
+
+    key &= 0xFFFFFFFFFFFFFFFF
+    result, candidate = -1, 0
+    while candidate < buckets:
+        result = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((result + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return result
+
+
+def routing_key(update: Dict[str, Any]) -> int:
+    for name in _ROUTING_KEYS:
+        payload = update.get(name)
+        if not payload:
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return int(chat["id"])
+        user = payload.get("from") or payload.get("user")
+        if user:
+            return int(user["id"])
+    return int(update.get("update_id", 0))
+
+
+@dataclass
+class WorkerHandle:
+    index: int
+    process: mp.Process
+    inbox: Any
+    started_at: float = field(default_factory=time.time)
+    restarts: int = 0
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        size: int,
+        target: Callable[..., None],
+        args: Sequence[Any] = (),
+        heartbeat_timeout: float = 30.0,
+    ) -> None:
+        self.size = size
+        self.target = target
+        self.args = tuple(args)
+        self.heartbeat_timeout = heartbeat_timeout
+        self._ctx = mp.get_context("spawn")
+        self.heartbeats = self._ctx.Array("d", size, lock=False)
+        self.workers: List[Optional[WorkerHandle]] = [None] * size
+        self.dispatched = [0] * size
+
+    def _spawn(self, index: int, restarts: int = 0) -> WorkerHandle:
+        inbox = self._ctx.Queue()
+        self.heartbeats[index] = time.time()
+        process = self._ctx.Process(
+            target=self.target,
+            args=(index, inbox, self.heartbeats, *self.args),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        handle = WorkerHandle(index=index, process=process, inbox=inbox, restarts=restarts)
+        self.workers[index] = handle
+        return handle
+
+    def start(self) -> None:
+        for index in range(self.size):
+            self._spawn(index)
+
+    def dispatch(self, key: int, item: Any) -> int:
+        index = jump_hash(key, self.size)
+        self.workers[index].inbox.put(item)
+        self.dispatched[index] += 1
+        return index
+
+    def check(self) -> None:
+        now = time.time()
+        for handle in self.workers:
+            if handle is None:
+                continue
+            alive = handle.process.is_alive()
+            stalled = alive and now - self.heartbeats[handle.index] > self.heartbeat_timeout
+            if alive and not stalled:
+                continue
+            if now - handle.started_at < RESTART_BACKOFF:
+                continue
+            if stalled:
+                logging.error("Воркер %s не отвечает, перезапускаем", handle.index)
+                handle.process.kill()
+                handle.process.join(timeout=5)
+            else:
+                logging.error(
+                    "Воркер %s завершился с кодом %s, перезапускаем", handle.index, handle.process.exitcode
+                )
+            self._restart(handle)
+
+    def _restart(self, handle: WorkerHandle) -> None:
+        backlog: List[Any] = []
+        while True:
+            try:
+                backlog.append(handle.inbox.get_nowait())
+            except (queue.Empty, OSError, ValueError, EOFError):
+                break
+        replacement = self._spawn(handle.index, restarts=handle.restarts + 1)
+        for item in backlog:
+            if item is not None:
+                replacement.inbox.put(item)
+
+    def health(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [
+            {
+                "index": handle.index,
+                "pid": handle.process.pid,
+                "alive": handle.process.is_alive(),
+                "heartbeat_age": round(now - self.heartbeats[handle.index], 2),
+                "restarts": handle.restarts,
+                "dispatched": self.dispatched[handle.index],
+            }
+            for handle in self.workers
+            if handle is not None
+        ]
+
+    def stop(self, timeout: float = 10.0) -> None:
+        for handle in self.workers:
+            if handle is not None:
+                handle.inbox.put(None)
+        deadline = time.time() + timeout
+        for handle in self.workers:
+            if handle is None:
+                continue
+            handle.process.join(timeout=max(0.0, deadline - time.time()))
+            if handle.process.is_alive():
+                handle.process.kill()
+
+
+def _next_item(inbox: Any) -> Any:
+    try:
+        return inbox.get(timeout=HEARTBEAT_INTERVAL)
+    except queue.Empty:
+        return ...
+
+
+async def _worker_loop(index: int, inbox: Any, heartbeats: Any, process: Callable[[Any], Any]) -> None:
+    loop = asyncio.get_running_loop()
+    pending: set[asyncio.Task] = set()
+    while True:
+        heartbeats[index] = time.time()
+        item = await loop.run_in_executor(None, _next_item, inbox)
+        if item is ...:
+            continue
+        if item is None:
+            break
+        task = asyncio.create_task(process(item))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _bot_worker(index: int, inbox: Any, heartbeats: Any) -> None:
+    # Останавливает воркер только супервизор (сигналом None в очереди), чтобы тот успел дослать работу.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_run_bot_worker(index, inbox, heartbeats))
+
+
+async def _run_bot_worker(index: int, inbox: Any, heartbeats: Any) -> None:
+    from .main import build_dispatcher, create_bot
+    from .services.counters import SharedCounterStore
+    from .services.payment_events import INBOX_PATH
+    from .services.snapshot import SNAPSHOT_PATH
+
+    settings = load_settings()
+    if settings.metrics_port > 0:
+        # Каждый воркер отдаёт свои метрики на отдельном порту: METRICS_PORT + номер воркера.
+        settings = settings.model_copy(update={"metrics_port": settings.metrics_port + index})
+    # Общие SQLite-файлы обслуживает один воркер, локальное состояние — каждый свой.
+    settings = settings.model_copy(update={"maintenance_shared": index == 0})
+    logging.basicConfig(
+        level=logging.INFO if settings.enable_logging else logging.WARNING,
+        format=f"%(asctime)s [worker-{index}] %(levelname)s %(name)s: %(message)s",
+    )
+    bot = create_bot(settings)
+    snapshot_path = (settings.data_path("state_snapshot.json.gz") or SNAPSHOT_PATH).with_name(
+        f"state_snapshot_worker{index}.json.gz"
+    )
+    # Профили Pro живут в памяти воркера, поэтому и платёжные события каждый обрабатывает свои.
+    payment_inbox_path = (settings.data_path("payment_events.db") or INBOX_PATH).with_name(
+        f"payment_events_worker{index}.db"
+    )
+    dp = build_dispatcher(
+        settings,
+        counters=SharedCounterStore(db_path=settings.data_path("shared_counters.db", shared=True)),
+        snapshot_path=snapshot_path,
+        payment_inbox_path=payment_inbox_path,
+    )
+    await dp.emit_startup(bot=bot)
+
+    async def process(update: Dict[str, Any]) -> None:
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception:  # pragma: no cover - ошибка одного апдейта не должна ронять воркер
+            logging.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+
+    try:
+        await _worker_loop(index, inbox, heartbeats, process)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+
+async def _monitor(pool: WorkerPool) -> None:
+    while True:
+        await asyncio.sleep(MONITOR_INTERVAL)
+        pool.check()
+
+
+async def _poll_updates(bot: Any, pool: WorkerPool) -> None:
+    offset: Optional[int] = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30)
+        except Exception:
+            logging.exception("Ошибка получения апдейтов, повтор через 5 секунд")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            raw = update.model_dump(mode="json", exclude_none=True)
+            pool.dispatch(routing_key(raw), raw)
+            offset = update.update_id + 1
+
+
+async def _serve_webhook(bot: Any, pool: WorkerPool, settings: Settings) -> None:
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        if settings.webhook_secret and (
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token") != settings.webhook_secret
+        ):
+            return web.Response(status=401)
+        raw = await request.json()
+        pool.dispatch(routing_key(raw), raw)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(pool.health())
+
+    app = web.Application()
+    app.router.add_post(settings.webhook_path, handle)
+    app.router.add_get("/health", health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+    await bot.set_webhook(
+        settings.webhook_url,
+        secret_token=settings.webhook_secret,
+        drop_pending_updates=True,
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_supervisor(settings: Settings) -> None:
+    from .main import create_bot
+
+    pool = WorkerPool(settings.workers, _bot_worker, heartbeat_timeout=settings.worker_heartbeat_timeout)
+    pool.start()
+    logging.info("Запущено воркеров: %s", settings.workers)
+
+    bot = create_bot(settings)
+    monitor = asyncio.create_task(_monitor(pool))
+    if settings.webhook_url:
+        intake = asyncio.create_task(_serve_webhook(bot, pool, settings))
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        intake = asyncio.create_task(_poll_updates(bot, pool))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await asyncio.wait([intake, asyncio.create_task(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+        if intake.done():
+            intake.result()
+    finally:
+        logging.info("Остановка: прекращаем приём апдейтов и ждём воркеры")
+        intake.cancel()
+        monitor.cancel()
+        await asyncio.gather(intake, monitor, return_exceptions=True)
+        # Воркеры дорабатывают свои очереди и пишут снимки состояния; даём им запас сверх shutdown_timeout.
+        await asyncio.to_thread(pool.stop, settings.shutdown_timeout + 10)
+        await bot.session.close()
+
+
+def _bench_worker(index: int, inbox: Any, heartbeats: Any, results: Any) -> None:
+    from .handlers.documents import DOCUMENTS_BY_CODE, TEMPLATES_DIR
+    from .services.pdf_builder import PdfBuilder
+    from .services.templates_loader import TemplateLoader
+
+    builder = PdfBuilder(TemplateLoader(TEMPLATES_DIR))
+
+    async def process(code: str) -> None:
+        document = DOCUMENTS_BY_CODE[code]
+        size = len(builder.build(document.template, document.example_context()).getvalue())
+        results.put((index, size))
+
+    asyncio.run(_worker_loop(index, inbox, heartbeats, process))
+
+
+def run_benchmark(max_workers: int, jobs: int) -> List[Dict[str, float]]:
+    from .handlers.documents import DOCUMENTS
+
+    codes = [document.code for document in DOCUMENTS]
+    rows: List[Dict[str, float]] = []
+    for size in range(1, max_workers + 1):
+        results = mp.get_context("spawn").Queue()
+        pool = WorkerPool(size, _bench_worker, args=(results,))
+        pool.start()
+        # Прогрев: импорт модулей и регистрация шрифтов в каждом воркере.
+        for index in range(size * 4):
+            pool.dispatch(index, codes[index % len(codes)])
+        for _ in range(size * 4):
+            results.get()
+        started = time.perf_counter()
+        for job in range(jobs):
+            pool.dispatch(job, codes[job % len(codes)])
+        for _ in range(jobs):
+            results.get()
+        elapsed = time.perf_counter() - started
+        pool.stop()
+        rows.append({"workers": size, "seconds": round(elapsed, 3), "renders_per_sec": round(jobs / elapsed, 1)})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Супервизор воркеров CLEAN DOC BOT")
+    parser.add_argument("--bench", action="store_true", help="замерить масштабирование рендера от 1 до N воркеров")
+    parser.add_argument("--max-workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--jobs", type=int, default=200)
+    args = parser.parse_args()
+
+    if not args.bench:
+        settings = load_settings()
+        logging.basicConfig(level=logging.INFO if settings.enable_logging else logging.WARNING)
+        asyncio.run(run_supervisor(settings))
+        return
+
+    baseline: Optional[float] = None
+    print(f"{'workers':>8} {'seconds':>9} {'renders/s':>10} {'speedup':>8}")
+    for row in run_benchmark(args.max_workers, args.jobs):
+        baseline = baseline or row["renders_per_sec"]
+        speedup = row["renders_per_sec"] / baseline
+        print(f"{row['workers']:>8} {row['seconds']:>9} {row['renders_per_sec']:>10} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,135 @@
-from typing import List
+from pathlib import Path
+from typing import List, Literal
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class BotConfig(BaseModel):
+    """An extra bot served by the same process; unset fields are taken from the main settings."""
+
+    name: str = Field(..., pattern=r"^[a-z0-9_-]+$", description="Имя бота — каталог его данных в bot/data/tenants")
+    bot_token: str
+    main_channel_id: int | None = None
+    main_channel_username: str | None = None
+    admin_ids: List[int] | None = None
+    monthly_document_limit: int | None = None
+    document_free_edits: int | None = None
+    download_token_secret: str | None = None
+
 
 class Settings(BaseSettings):
     bot_token: str = Field(..., description="Telegram bot token")
     admin_ids: List[int] = Field(default_factory=list, env="ADMIN_IDS")
     enable_logging: bool = True
     monthly_document_limit: int = Field(default=10, description="Documents per month limit")
+    document_free_edits: int = Field(default=3, description="Правок одного поля готового документа без списания лимита")
     main_channel_id: int = Field(..., description="ID обязательного канала")
     main_channel_username: str = Field(..., description="Username канала без https://t.me/")
+    workers: int = Field(default=1, description="Количество воркер-процессов (1 — без супервизора)")
+    worker_heartbeat_timeout: float = Field(default=30.0, description="Секунд без heartbeat до перезапуска воркера")
+    webhook_url: str | None = Field(default=None, description="Публичный URL вебхука (если не задан — polling)")
+    webhook_path: str = "/webhook"
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: str | None = None
+    telegram_pool_size: int = Field(default=50, description="Соединений с Bot API для обычных запросов")
+    telegram_upload_pool_size: int = Field(default=4, description="Отдельный пул соединений для загрузки файлов")
+    telegram_keepalive: float = Field(default=30.0, description="Keep-alive простаивающих соединений, сек")
+    telegram_timeout: float = Field(default=15.0, description="Таймаут запроса к Bot API, сек")
+    telegram_upload_timeout: float = Field(default=120.0, description="Таймаут загрузки файла, сек")
+    telegram_retries: int = Field(default=3, description="Повторов при 429 и сетевых ошибках идемпотентных запросов")
+    render_concurrency: int = Field(default=2, description="Одновременных рендеров PDF/DOCX")
+    render_queue_size: int = Field(default=100, description="Максимальная длина очереди рендера")
+    render_slo_seconds: float = Field(default=20.0, description="Ожидание в очереди, после которого Free-задачи сбрасываются")
+    render_status_interval: float = Field(
+        default=3.0, description="Не чаще одного обновления статуса очереди у пользователя за N секунд"
+    )
+    render_status_rate: float = Field(default=10.0, description="Обновлений статуса очереди в секунду на весь процесс")
+    payment_batch_size: int = Field(default=200, description="Платёжных событий за одну пачку обработки")
+    payment_batch_window: float = Field(
+        default=0.2, description="Сколько секунд копить платёжные события перед обработкой пачки"
+    )
+    payment_duplicate_deliveries: int = Field(
+        default=0, description="Повторных доставок каждого события демо-провайдером (проверка идемпотентности)"
+    )
+    pro_render_weight: int = Field(default=3, description="Сколько Pro-рендеров обслуживается на один Free")
+    flood_rate: float = Field(default=1.0, description="Апдейтов в секунду на пользователя (0 — антифлуд выключен)")
+    flood_burst: int = Field(default=8, description="Запас дешёвых действий подряд")
+    flood_expensive_rate: float = Field(default=0.2, description="Дорогих действий в секунду (рендер, подписка, SQLite)")
+    flood_expensive_burst: int = Field(default=3, description="Запас дорогих действий подряд")
+    flood_max_delay: float = Field(default=2.0, description="Максимальная задержка апдейта вместо отбрасывания, сек")
+    flood_notice_interval: float = Field(default=10.0, description="Не чаще одного предупреждения о флуде за N секунд")
+    pdf_profile: Literal["compact", "standard", "archival"] = Field(
+        default="standard", description="Профиль PDF: compact — минимальный размер, archival — с метаданными"
+    )
+    last_documents_max_entries: int = Field(default=5000, description="Последних документов в RAM")
+    last_documents_ttl: int = Field(default=3600, description="Секунд простоя до выгрузки контекста на диск")
+    last_documents_compress: bool = True
+    last_documents_disk_ttl_days: int = Field(default=30, description="Срок хранения контекстов на диске")
+    artifact_archive_max_mb: int = Field(default=500, description="Объём архива готовых файлов, МБ (сжатых)")
+    artifact_archive_per_user: int = Field(default=20, description="Файлов в архиве на пользователя")
+    download_ttl_days: int = Field(default=30, description="Срок действия кнопок повторного скачивания, дней")
+    download_token_secret: str | None = Field(
+        default=None, description="Ключ подписи кнопок скачивания (по умолчанию выводится из токена бота)"
+    )
+    saved_fields_ttl_days: int = Field(
+        default=180, description="Сколько дней помнить данные сторон для автозаполнения (0 — не сохранять)"
+    )
+    feedback_digest_interval: int = Field(default=0, description="Собирать отзывы в дайджест раз в N секунд (0 — сразу)")
+    feedback_send_rate: float = Field(default=20.0, description="Сообщений администраторам в секунду")
+    feedback_max_attempts: int = 5
+    metrics_port: int = Field(default=0, description="Порт HTTP /metrics в формате Prometheus (0 — выключено)")
+    metrics_host: str = Field(default="127.0.0.1", description="Адрес HTTP /metrics")
+    shutdown_timeout: float = Field(default=25.0, description="Секунд на завершение текущих апдейтов и рендеров при остановке")
+    state_snapshot: bool = Field(default=True, description="Сохранять профили, аналитику и FSM на диск при остановке")
+    memory_report_interval: int = Field(default=600, description="Период лога памяти в секундах (0 — выключено)")
+    memory_tracemalloc: bool = Field(default=False, description="Включить tracemalloc для отчёта о росте аллокаций")
+    maintenance_enabled: bool = Field(default=True, description="Запускать периодические задачи обслуживания")
+    maintenance_shared: bool = Field(
+        default=True, description="Обслуживать общие SQLite-файлы в этом процессе (в кластере — только воркер 0)"
+    )
+    maintenance_jitter: float = Field(default=0.1, description="Разброс интервалов задач обслуживания (доля)")
+    usage_raw_retention_days: int = Field(
+        default=90, description="Дней хранить построчный учёт документов до свёртки в помесячные итоги"
+    )
+    analytics_max_events: int = Field(default=50000, description="Событий аналитики в памяти до выгрузки в файл")
+    analytics_log_keep: int = Field(
+        default=10, description="Сколько файлов выгруженной аналитики хранить; более старые события удаляются"
+    )
+    fsm_idle_ttl_hours: int = Field(default=48, description="Часов без изменений до сброса незавершённого мастера")
+    bots: List[BotConfig] = Field(
+        default_factory=list, description="Дополнительные боты в этом же процессе (JSON-список BotConfig)"
+    )
+    tenant: str = Field(default="", description="Имя бота из BOTS, которому принадлежат эти настройки")
+    data_dir: Path | None = Field(default=None, description="Каталог данных вместо bot/data (например, для бенчмарков)")
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
+    def for_bot(self, bot: BotConfig) -> "Settings":
+        """Settings of an extra bot: its own overrides on top of these, with no nested bots.
+
+        Extra bots share the main bot's ``/metrics`` endpoint instead of opening their own.
+        """
+
+        overrides = bot.model_dump(exclude_none=True, exclude={"name"})
+        return self.model_copy(update={**overrides, "tenant": bot.name, "bots": [], "metrics_port": 0})
+
+    def data_path(self, filename: str, shared: bool = False) -> Path | None:
+        """Data file of this bot, or of the whole process when ``shared``.
+
+        Extra bots keep their own files under ``tenants/<name>``. ``None`` means the service's default
+        path under ``bot/data``; ``data_dir`` moves every file elsewhere.
+        """
+
+        if self.tenant and not shared:
+            return (self.data_dir or DATA_DIR) / "tenants" / self.tenant / filename
+        if self.data_dir is not None:
+            return self.data_dir / filename
+        return None
+
 
 settings = Settings()
 
@@ -1,32 +1,80 @@
+import html
+import os
 from datetime import datetime
 
-from aiogram import Router
-from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram import Bot, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import FSInputFile, Message
 
 from ..config import Settings
 from ..services.analytics import AnalyticsService
+from ..services.export import FORMATS, KINDS, export_to_file, parse_date
+from ..services.feedback_queue import FeedbackQueue
+from ..services.http_session import TelegramSession
+from ..services.maintenance import MaintenanceScheduler
+from ..services.memory import MemoryReporter, format_bytes
+from ..services.payments import PaymentService
+from ..services.scheduler import RenderScheduler
+from ..services.single_flight import SingleFlight
 from ..services.storage import StorageService
-from .middleware import DependencyMiddleware
+from ..services.throttling import FloodGuard
+from .documents import DOCUMENTS_BY_CODE
 
-router = Router()
 
-
-def setup_router(settings: Settings, analytics: AnalyticsService, storage: StorageService) -> Router:
-    router.message.middleware(
-        DependencyMiddleware(settings=settings, analytics=analytics, storage=storage)
-    )
+def setup_router() -> Router:
+    router = Router()
+    router.message.register(admin_panel, Command("admin"))
     return router
 
 
-@router.message(Command("admin"))
-async def admin_panel(message: Message, settings: Settings, analytics: AnalyticsService, storage: StorageService) -> None:
+async def admin_panel(
+    message: Message,
+    bot: Bot,
+    command: CommandObject,
+    settings: Settings,
+    analytics: AnalyticsService,
+    storage: StorageService,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+    memory: MemoryReporter,
+    feedback_queue: FeedbackQueue,
+    flood_guard: FloodGuard,
+    maintenance: MaintenanceScheduler,
+    payments: PaymentService,
+) -> None:
     if message.from_user.id not in settings.admin_ids:
         await message.answer("Доступ запрещен")
         return
+    args = (command.args or "").split()
+    if args and args[0] == "mem":
+        await admin_memory(message, memory)
+        return
+    if args and args[0] == "export":
+        await admin_export(message, analytics, storage, args[1:])
+        return
+    if args and args[0] == "funnel":
+        await admin_funnel(message, analytics, args[1] if len(args) > 1 else None)
+        return
+    if args and args[0] == "tasks":
+        await admin_tasks(message, maintenance, args[1:])
+        return
     stats = storage.stats()
     top_docs = storage.top_documents()
     analytics_summary = analytics.summary()
+    flights = single_flight.stats()
+    render = scheduler.stats()
+    feedback_stats = await feedback_queue.stats()
+    flood = flood_guard.stats()
+    payment_stats = await payments.inbox.stats()
+    api_line = ""
+    if isinstance(bot.session, TelegramSession):
+        api = bot.session.stats()
+        slowest = sorted(api["p95"].items(), key=lambda item: item[1], reverse=True)[:3]
+        api_line = (
+            f"Bot API: запросов {api['requests']}, ошибок {api['errors']}, повторов {api['retries']}; p95: "
+            + (", ".join(f"{name} {seconds}с" for name, seconds in slowest) or "—")
+            + "\n"
+        )
     await message.answer(
         "Админ-панель:\n"
         f"Пользователей: {stats['users']}\n"
@@ -34,5 +82,110 @@ async def admin_panel(message: Message, settings: Settings, analytics: Analytics
         f"TOP документов: {top_docs}\n"
         f"Ошибок: {analytics_summary['errors']}\n"
         f"Событий: {analytics_summary['events']}\n"
+        f"Повторных рендеров предотвращено: {flights['avoided']} "
+        f"(ожидали: {flights['joined']}, отклонено: {flights['dropped']})\n"
+        f"Очередь рендера: {render['queued']} (в работе: {render['active']}, "
+        f"сброшено: {render['shed'] + render['rejected']})\n"
+        f"Отзывы: в очереди {feedback_stats['pending']}, доставлено {feedback_stats['delivered']}, "
+        f"ошибок {feedback_stats['failed']}, повторов {feedback_stats['retries']}\n"
+        f"Платежи: в очереди {payment_stats['pending']} (старейшее {payment_stats['oldest_pending']}с), "
+        f"обработано {payment_stats['processed']}, дублей {payment_stats['duplicates']}, "
+        f"p95 задержки {payment_stats['lag_p95']}с\n"
+        f"Антифлуд: задержано {flood['delayed']}, отброшено {flood['dropped']}, "
+        f"активных корзин {flood['users']}\n"
+        f"{api_line}"
+        f"p99 interactive/render: {render['p99']['interactive']}с / {render['p99']['render']}с\n"
         f"Последнее обновление: {datetime.utcnow().strftime('%d.%m.%Y %H:%M')}"
     )
+
+
+async def admin_memory(message: Message, memory: MemoryReporter) -> None:
+    report, growth = await memory.format_report()
+    lines = ["<b>Память</b>", f"<pre>{html.escape(report)}</pre>"]
+    if growth:
+        lines.append("<b>Рост аллокаций (tracemalloc)</b>")
+        lines.extend(
+            f"{html.escape(site.location)}: {format_bytes(site.size_diff)} ({site.count_diff:+d})" for site in growth
+        )
+    else:
+        lines.append("tracemalloc выключен (MEMORY_TRACEMALLOC=true для отчёта об аллокациях)")
+    await message.answer("\n".join(lines))
+
+
+async def admin_tasks(message: Message, maintenance: MaintenanceScheduler, args: list[str]) -> None:
+    if len(args) == 2 and args[0] == "run":
+        if args[1] not in maintenance.tasks:
+            await message.answer(f"Нет задачи {html.escape(args[1])}. Есть: {', '.join(maintenance.tasks)}")
+            return
+        await maintenance.run_task(args[1])
+    lines = ["<b>Задачи обслуживания</b>"]
+    for task in maintenance.stats():
+        if task["last_started"] is None:
+            last = "ещё не запускалась"
+        else:
+            started = datetime.utcfromtimestamp(task["last_started"]).strftime("%d.%m %H:%M:%S")
+            last = f"{started} UTC, {task['last_duration']:.2f} с"
+        outcome = f"ошибка: {task['last_error']}" if task["last_error"] else str(task["last_result"] or "")
+        lines.append(
+            f"{task['name']}: {last}; запусков {task['runs']}, ошибок {task['failures']}, "
+            f"следующий через {task['next_in'] / 60:.0f} мин\n  {html.escape(outcome)}"
+        )
+    if len(lines) == 1:
+        lines.append("Планировщик выключен (MAINTENANCE_ENABLED=false)")
+    lines.append("Запустить сейчас: /admin tasks run &lt;имя&gt;")
+    await message.answer("\n".join(lines))
+
+
+async def admin_funnel(message: Message, analytics: AnalyticsService, code: str | None) -> None:
+    document = DOCUMENTS_BY_CODE.get(code or "")
+    if not document:
+        known = ", ".join(f"{doc_code} ({reached})" for doc_code, reached in analytics.funnel.documents())
+        await message.answer(f"Использование: /admin funnel &lt;code&gt;\nДокументы (начато): {known or 'нет данных'}")
+        return
+    rows = analytics.funnel.report(document.code, len(document.questions))
+    if not rows:
+        await message.answer(f"По документу {document.code} ещё нет данных")
+        return
+    lines = [f"{'#':>3} {'вопрос':<22} {'дошли':>6} {'ответ':>6} {'ошиб':>5} {'назад':>5} {'бросили':>7}"]
+    for index, row in enumerate(rows):
+        label = document.questions[index].key if index < len(document.questions) else "— итог —"
+        lines.append(
+            f"{index + 1:>3} {label[:22]:<22} {row['reached']:>6} {row['answered']:>6} "
+            f"{row['invalid']:>5} {row['back']:>5} {row['abandoned']:>7}"
+        )
+    completed = analytics.funnel.completed_count(document.code)
+    await message.answer(
+        f"<b>Воронка: {html.escape(document.title)}</b>\nСформировано: {completed}\n"
+        f"<pre>{html.escape(chr(10).join(lines))}</pre>"
+    )
+
+
+async def admin_export(
+    message: Message, analytics: AnalyticsService, storage: StorageService, args: list[str]
+) -> None:
+    usage = (
+        "Использование: /admin export &lt;events|usage|funnel|profiles&gt; [csv|ndjson] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД]"
+    )
+    if not args or args[0] not in KINDS:
+        await message.answer(usage)
+        return
+    kind = args[0]
+    fmt = args[1] if len(args) > 1 and args[1] in FORMATS else "csv"
+    dates = [value for value in args[1:] if value not in FORMATS]
+    try:
+        since = parse_date(dates[0]) if dates else None
+        until = parse_date(dates[1]) if len(dates) > 1 else None
+    except ValueError:
+        await message.answer(usage)
+        return
+
+    await message.answer("⏳ Готовим выгрузку...")
+    path, count = await export_to_file(kind, fmt, analytics=analytics, storage=storage, since=since, until=until)
+    try:
+        stamp = datetime.utcnow().strftime("%Y%m%d_%H%M")
+        await message.answer_document(
+            FSInputFile(path, filename=f"{kind}_{stamp}.{fmt}.gz"),
+            caption=f"Выгрузка {kind}: {count} строк",
+        )
+    finally:
+        os.unlink(path)
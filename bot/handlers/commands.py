@@ -1,15 +1,17 @@
+from datetime import datetime
+from typing import List
+
 from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandStart
-from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 from ..config import Settings
 from ..services.analytics import AnalyticsService
+from ..services.artifacts import Artifact
 from ..services.legal import DISCLAIMER_TEXT
 from ..services.storage import StorageService
 from .documents import build_categories_keyboard
-from .middleware import DependencyMiddleware
-
-router = Router()
 
 
 def legal_ack_keyboard() -> InlineKeyboardMarkup:
@@ -18,14 +20,18 @@ def legal_ack_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def setup_router(settings: Settings, analytics: AnalyticsService, storage: StorageService) -> Router:
-    router.message.middleware(
-        DependencyMiddleware(settings=settings, analytics=analytics, storage=storage)
-    )
+def setup_router() -> Router:
+    router = Router()
+    router.message.register(cmd_start, CommandStart())
+    router.message.register(cmd_help, Command("help"))
+    router.message.register(cmd_legal, Command("legal", "terms"))
+    router.message.register(cmd_docs, Command("docs"))
+    router.message.register(cmd_profile, Command("profile"))
+    router.callback_query.register(download_artifact, F.data.startswith("artifact:"))
+    router.callback_query.register(legal_acknowledged, F.data == "legal_ack")
     return router
 
 
-@router.message(CommandStart())
 async def cmd_start(message: Message, settings: Settings, analytics: AnalyticsService) -> None:
     analytics.log_event("start", message.from_user.id, {})
     await message.answer(
@@ -37,18 +43,17 @@ async def cmd_start(message: Message, settings: Settings, analytics: AnalyticsSe
     await message.answer(DISCLAIMER_TEXT, reply_markup=legal_ack_keyboard())
 
 
-@router.message(Command("help"))
 async def cmd_help(message: Message) -> None:
     await message.answer(
         "<b>Как пользоваться ботом</b>\n"
         "1️⃣ Выберите документ из подходящей категории.\n"
         "2️⃣ Ответьте на вопросы — бот подставит данные в шаблон.\n"
         "3️⃣ Получите готовый файл в формате PDF или DOCX.\n\n"
-        "Команды: /docs — категории, /profile — профиль, /legal — правовая информация, /cancel — отменить документ."
+        "Команды: /docs — категории, /profile — профиль, /legal — правовая информация, /cancel — отменить документ.\n"
+        "/forget — забыть сохранённые данные сторон (ФИО, паспорта, адреса) для автозаполнения."
     )
 
 
-@router.message(Command("legal", "terms"))
 async def cmd_legal(message: Message) -> None:
     await message.answer(
         f"Правовая информация и условия использования:\n\n{DISCLAIMER_TEXT}",
@@ -56,24 +61,73 @@ async def cmd_legal(message: Message) -> None:
     )
 
 
-@router.message(Command("docs"))
 async def cmd_docs(message: Message) -> None:
     await message.answer("Выберите категорию документов:", reply_markup=build_categories_keyboard())
 
 
-@router.message(Command("profile"))
+def artifacts_keyboard(artifacts: List[Artifact]) -> InlineKeyboardMarkup | None:
+    if not artifacts:
+        return None
+    rows = []
+    for artifact in artifacts:
+        created = datetime.fromtimestamp(artifact.created_at).strftime("%d.%m")
+        rows.append(
+            [
+                InlineKeyboardButton(
+                    text=f"📥 {artifact.title[:40]} · {artifact.fmt.upper()} · {created}",
+                    callback_data=f"artifact:{artifact.id}",
+                )
+            ]
+        )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 async def cmd_profile(message: Message, storage: StorageService) -> None:
     profile = storage.get_profile(message.from_user.id)
     history = ", ".join(profile.history[-5:]) if profile.history else "Документов пока нет"
+    artifacts = await storage.artifacts.recent(message.from_user.id)
+    archive_line = "\n\nГотовые файлы можно скачать повторно:" if artifacts else ""
     await message.answer(
         "<b>Ваш профиль</b>\n"
         f"Тариф: {'Pro' if profile.is_pro else 'Free'}\n"
         f"Документов создано: {profile.documents_generated}\n"
         f"Последние шаблоны: {history}"
+        f"{archive_line}",
+        reply_markup=artifacts_keyboard(artifacts),
+    )
+
+
+async def download_artifact(callback: CallbackQuery, storage: StorageService) -> None:
+    try:
+        artifact_id = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        await callback.answer("Кнопка устарела — откройте /profile заново.", show_alert=True)
+        return
+    found = await storage.artifacts.load(callback.from_user.id, artifact_id, with_data=False)
+    if found is None:
+        await callback.answer("Файл больше не хранится — сформируйте документ заново.", show_alert=True)
+        return
+    artifact, _ = found
+    await callback.answer()
+    caption = f"{artifact.title} ({artifact.fmt.upper()})"
+    if artifact.file_id:
+        try:
+            await callback.message.answer_document(artifact.file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            # file_id привязан к боту; после смены токена отправляем сохранённые байты.
+            pass
+    found = await storage.artifacts.load(callback.from_user.id, artifact_id)
+    if found is None:
+        await callback.message.answer("Файл больше не хранится — сформируйте документ заново.")
+        return
+    _, data = found
+    sent = await callback.message.answer_document(
+        BufferedInputFile(data, filename=f"{artifact.code}.{artifact.fmt}"), caption=caption
     )
+    await storage.artifacts.remember_file_id(artifact.digest, sent.document.file_id)
 
 
-@router.callback_query(F.data == "legal_ack")
 async def legal_acknowledged(callback: CallbackQuery) -> None:
     await callback.answer("Спасибо! Будьте внимательны при использовании документов.")
     if callback.message:
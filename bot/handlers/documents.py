@@ -1,12 +1,15 @@
 ﻿from __future__ import annotations
 
+import html
+import math
 import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 
 from aiogram import F, Router
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -14,14 +17,17 @@ from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardButton
 
 from ..config import Settings
 from ..services.analytics import AnalyticsService
+from ..services.artifacts import content_digest
 from ..services.docx_builder import DocxBuilder
 from ..services.limits import can_create_document, register_document_usage
 from ..services.pdf_builder import PdfBuilder
+from ..services.scheduler import ProgressCallback, RenderRejected, RenderScheduler
+from ..services.single_flight import SingleFlight
 from ..services.subscription import is_subscribed
 from ..services.storage import GeneratedDocument, StorageService
 from ..services.templates_loader import TemplateLoader
-from .keyboards import subscription_keyboard
-from .middleware import DependencyMiddleware
+from ..services.throttling import admit_render
+from .keyboards import result_keyboard, subscription_keyboard
 
 PASSPORT_PATTERN = r"^\d{4}\s?\d{6}$"
 DATE_PATTERN = r"^\d{2}\.\d{2}\.\d{4}$"
@@ -48,6 +54,14 @@ class DocumentDefinition:
     category: str
     questions: List[DocumentQuestion]
 
+    def example_context(self) -> Dict[str, str]:
+        return self.context([question.example or "" for question in self.questions])
+
+    def context(self, answers: List[str]) -> Dict[str, str]:
+        context = {question.key: answer for question, answer in zip(self.questions, answers)}
+        context["document_title"] = self.title
+        return context
+
 
 def q(
     key: str,
@@ -77,6 +91,8 @@ CATEGORY_META: Dict[str, str] = {
 
 
 TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "data" / "templates"
+# Общий загрузчик: скомпилированные Jinja-шаблоны и статичные строки кешируются между запросами.
+TEMPLATE_LOADER = TemplateLoader(TEMPLATES_DIR)
 
 
 DOCUMENTS_DATA = [
@@ -907,8 +923,12 @@ def build_documents_keyboard(category: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def question_controls_keyboard(has_prev: bool) -> InlineKeyboardMarkup:
+def question_controls_keyboard(has_prev: bool, index: int = 0, saved: str | None = None) -> InlineKeyboardMarkup:
     rows: List[List[InlineKeyboardButton]] = []
+    if saved:
+        label = saved if len(saved) <= 40 else saved[:39] + "…"
+        # Индекс в callback_data: нажатие на кнопку под старым вопросом не ответит на текущий.
+        rows.append([InlineKeyboardButton(text=f"↩️ {label}", callback_data=f"wizard_saved:{index}")])
     controls: List[InlineKeyboardButton] = []
     if has_prev:
         controls.append(InlineKeyboardButton(text="⬅️ Назад", callback_data="wizard_back"))
@@ -917,24 +937,109 @@ def question_controls_keyboard(has_prev: bool) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def confirmation_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Сформировать документ", callback_data="confirm:render")],
+            [InlineKeyboardButton(text="✏️ Исправить ответ", callback_data="confirm:edit")],
+            [InlineKeyboardButton(text="⛔️ Отмена", callback_data="wizard_cancel")],
+        ]
+    )
+
+
+def answer_buttons(answers: List[str], callback_prefix: str) -> List[List[InlineKeyboardButton]]:
+    buttons = [
+        InlineKeyboardButton(
+            text=f"{index + 1}. {answer if len(answer) <= 24 else answer[:23] + '…'}",
+            callback_data=f"{callback_prefix}:{index}",
+        )
+        for index, answer in enumerate(answers)
+    ]
+    return [buttons[start : start + 2] for start in range(0, len(buttons), 2)]
+
+
+def edit_answers_keyboard(answers: List[str]) -> InlineKeyboardMarkup:
+    rows = answer_buttons(answers, "edit_answer")
+    rows.append([InlineKeyboardButton(text="◀️ К проверке", callback_data="confirm:show")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def autofill_keyboard(count: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=f"✅ Подставить сохранённое ({count})", callback_data="autofill:yes")],
+            [InlineKeyboardButton(text="✏️ Заполнить заново", callback_data="autofill:no")],
+        ]
+    )
+
+
+def _short_prompt(prompt: str) -> str:
+    label = re.split(r"\s*\(", prompt, maxsplit=1)[0].rstrip(" :").removeprefix("Введите ")
+    return label[:1].upper() + label[1:]
+
+
+def saved_fields_text(document: DocumentDefinition, saved: Dict[str, str]) -> str:
+    lines = [
+        f"• {_short_prompt(question.prompt)}: <b>{html.escape(saved[question.key])}</b>"
+        for question in document.questions
+        if question.key in saved
+    ]
+    return (
+        "💾 Есть данные из ваших прошлых документов:\n"
+        + "\n".join(lines)
+        + "\n\nПодставить их и задать только оставшиеся вопросы? Любой ответ можно изменить кнопкой «⬅️ Назад»."
+    )
+
+
+def normalize_answer(question: DocumentQuestion, text: str) -> Optional[str]:
+    """Answer as it goes into the template, or ``None`` when it does not match the question format."""
+
+    answer = text.strip()
+    if question.uppercase:
+        answer = answer.upper()
+    if question.pattern and not re.fullmatch(question.pattern, answer):
+        return None
+    return answer
+
+
 class DocumentForm(StatesGroup):
     choosing_document = State()
+    reviewing_saved = State()
     collecting_data = State()
     confirming = State()
 
 
-def setup_router(settings: Settings, analytics: AnalyticsService, storage: StorageService) -> Router:
+WIZARD_STATES = (
+    DocumentForm.reviewing_saved.state,
+    DocumentForm.collecting_data.state,
+    DocumentForm.confirming.state,
+)
+# Предпросмотр — текст из Jinja без ReportLab; длинные шаблоны обрезаются под лимит сообщения.
+PREVIEW_LIMIT = 3300
+
+
+def setup_router() -> Router:
     documents_router = Router()
-    documents_router.message.middleware(
-        DependencyMiddleware(settings=settings, analytics=analytics, storage=storage)
-    )
-    documents_router.callback_query.middleware(
-        DependencyMiddleware(settings=settings, analytics=analytics, storage=storage)
-    )
     setup_handlers(documents_router)
     return documents_router
 
 
+def is_wizard_answer(message: Message) -> bool:
+    return bool(message.text) and not message.text.startswith("/")
+
+
+def setup_wizard_router() -> Router:
+    """Hot path for wizard answers: included first, so answers skip every other router's filters.
+
+    Commands (``/start``, ``/admin`` ...) fall through to their routers even mid-wizard.
+    """
+
+    wizard_router = Router()
+    wizard_router.message.filter(DocumentForm.collecting_data)
+    wizard_router.message.register(collect_data, is_wizard_answer)
+    return wizard_router
+
+
 async def show_categories(callback: CallbackQuery) -> None:
     await callback.answer()
     await callback.message.edit_text(
@@ -964,6 +1069,8 @@ async def start_document(
     storage: StorageService,
     settings: Settings,
     bot: Bot,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
 ) -> None:
     code = callback.data.split(":", maxsplit=1)[1]
     document = DOCUMENTS_BY_CODE.get(code)
@@ -971,50 +1078,208 @@ async def start_document(
         await callback.answer("Шаблон не найден", show_alert=True)
         return
     user_id = callback.from_user.id
-    if not await is_subscribed(bot, user_id):
+    if not await is_subscribed(bot, settings.main_channel_id, user_id):
         await callback.answer()
         await callback.message.answer(
             "Чтобы пользоваться сервисом «Мой Юрист» и создавать документы, нужно подписаться на наш канал. "
             "Это помогает сервису оставаться бесплатным.\n\n"
             "После подписки нажмите «✅ Я подписался».",
-            reply_markup=subscription_keyboard(),
+            reply_markup=subscription_keyboard(settings.main_channel_username),
         )
         return
-    await state.set_state(DocumentForm.collecting_data)
-    await state.update_data(document_code=code, answers=[], index=0)
+    previous = await state.get_data()
+    previous_document = DOCUMENTS_BY_CODE.get(previous.get("document_code", ""))
+    if previous_document and await state.get_state() in WIZARD_STATES:
+        analytics.track_step(
+            previous_document.code, previous.get("index", 0), len(previous_document.questions), "abandoned"
+        )
+    saved = await saved_answers(storage, settings, user_id, document)
+    await state.set_state(DocumentForm.reviewing_saved if saved else DocumentForm.collecting_data)
+    await state.set_data({"document_code": code, "answers": [], "index": 0, "saved": saved, "autofill": []})
+    analytics.track_step(code, 0, len(document.questions), "reached")
     await callback.answer()
     await callback.message.answer(
         f"📝 Начинаем <b>{document.title}</b>. Отвечайте последовательно — под каждым вопросом есть пример оформления.",
     )
-    await ask_next_question(callback.message, state, storage, analytics, settings)
+    if saved:
+        await callback.message.answer(saved_fields_text(document, saved), reply_markup=autofill_keyboard(len(saved)))
+    else:
+        await ask_next_question(callback.message, state, storage, analytics, settings, single_flight, scheduler)
     analytics.log_event("document_selected", callback.from_user.id, {"document": code})
 
 
+async def saved_answers(
+    storage: StorageService, settings: Settings, user_id: int, document: DocumentDefinition
+) -> Dict[str, str]:
+    """Answers the user gave in earlier documents that fit this document's questions."""
+
+    if settings.saved_fields_ttl_days <= 0:
+        return {}
+    saved = await storage.saved_fields.suggestions(user_id, [question.key for question in document.questions])
+    answers = {}
+    for question in document.questions:
+        if question.key in saved:
+            answer = normalize_answer(question, saved[question.key])
+            if answer is not None:
+                answers[question.key] = answer
+    return answers
+
+
 async def ask_next_question(
     message: Message,
     state: FSMContext,
     storage: StorageService,
     analytics: AnalyticsService,
     settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
 ) -> None:
     data = await state.get_data()
     document = DOCUMENTS_BY_CODE[data["document_code"]]
     index = data.get("index", 0)
     total = len(document.questions)
+    saved: Dict[str, str] = data.get("saved", {})
+    autofill: List[str] = data.get("autofill", [])
+    if index < total and document.questions[index].key in autofill:
+        # Известные поля пропускаем, подставляя сохранённые ответы.
+        answers: List[str] = data.get("answers", [])
+        while index < total and document.questions[index].key in autofill:
+            answers[index : index + 1] = [saved[document.questions[index].key]]
+            analytics.track_step(document.code, index, total, "answered")
+            analytics.track_step(document.code, index + 1, total, "reached")
+            index += 1
+        await state.update_data(answers=answers, index=index)
     if index >= total:
-        await state.set_state(DocumentForm.confirming)
-        await message.answer("✨ Документ готовится...")
-        await finalize_document(message, state, storage, analytics, settings)
+        if data.get("regenerate"):
+            # Правка готового документа: без повторной проверки сразу пересобираем файл.
+            await start_render(message, state, storage, analytics, settings, single_flight, scheduler)
+        else:
+            await show_confirmation(message, state, document, data.get("answers", []))
         return
     question = document.questions[index]
     example_line = f"\n<i>Пример: {question.example}</i>" if question.example else ""
+    answers = data.get("answers", [])
+    if data.get("editing") and index < len(answers):
+        example_line += f"\nСейчас: <b>{html.escape(answers[index])}</b>"
     await message.answer(
         f"<b>Вопрос {index + 1}/{total}</b>\n{question.prompt}{example_line}",
-        reply_markup=question_controls_keyboard(index > 0),
+        reply_markup=question_controls_keyboard(index > 0, index, saved.get(question.key)),
+    )
+
+
+async def show_confirmation(
+    message: Message, state: FSMContext, document: DocumentDefinition, answers: List[str]
+) -> None:
+    """Show the filled-in document text and wait for confirmation before the PDF render."""
+
+    preview = TEMPLATE_LOADER.render(document.template, document.context(answers)).strip()
+    if len(preview) > PREVIEW_LIMIT:
+        preview = preview[:PREVIEW_LIMIT].rstrip() + "\n…"
+    await state.set_state(DocumentForm.confirming)
+    await message.answer(
+        f"<b>Проверьте документ</b>\n\n{html.escape(preview)}\n\n"
+        "Всё верно? PDF сформируется и учтётся в лимите только после подтверждения.",
+        reply_markup=confirmation_keyboard(),
     )
 
 
-async def cancel_creation(message: Message, state: FSMContext) -> None:
+async def confirm_document(
+    callback: CallbackQuery,
+    state: FSMContext,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    data = await state.get_data()
+    document = DOCUMENTS_BY_CODE.get(data.get("document_code", ""))
+    if await state.get_state() != DocumentForm.confirming.state or document is None:
+        await callback.answer("Эта анкета уже завершена.")
+        return
+    action = callback.data.split(":", maxsplit=1)[1]
+    total = len(document.questions)
+    if action == "edit":
+        analytics.track_step(document.code, total, total, "back")
+        await callback.answer()
+        await callback.message.edit_reply_markup(reply_markup=edit_answers_keyboard(data.get("answers", [])))
+        return
+    if action == "show":
+        await callback.answer()
+        await callback.message.edit_reply_markup(reply_markup=confirmation_keyboard())
+        return
+
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await start_render(callback.message, state, storage, analytics, settings, single_flight, scheduler)
+
+
+async def start_render(
+    message: Message,
+    state: FSMContext,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    async def render() -> None:
+        status = await message.answer("✨ Документ готовится...")
+        try:
+            await finalize_document(message, state, storage, analytics, settings, scheduler, status)
+        finally:
+            # Документ, отказ или ошибка приходят отдельным сообщением — статус очереди больше не нужен.
+            try:
+                await status.delete()
+            except TelegramBadRequest:
+                pass
+
+    started, _ = await single_flight.run(message.chat.id, "finalize", render)
+    if not started:
+        await message.answer("⏳ Документ уже готовится, подождите немного.")
+
+
+async def edit_answer(
+    callback: CallbackQuery,
+    state: FSMContext,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    data = await state.get_data()
+    document = DOCUMENTS_BY_CODE.get(data.get("document_code", ""))
+    index = int(callback.data.split(":", maxsplit=1)[1])
+    confirming = await state.get_state() == DocumentForm.confirming.state
+    if not confirming or document is None or index >= len(document.questions):
+        await callback.answer("Эта анкета уже завершена.")
+        return
+    # Исправленный ответ возвращает к проверке, а не к следующему вопросу.
+    autofill = [key for key in data.get("autofill", []) if key != document.questions[index].key]
+    await state.update_data(index=index, autofill=autofill, editing=True)
+    await state.set_state(DocumentForm.collecting_data)
+    await callback.answer()
+    await ask_next_question(callback.message, state, storage, analytics, settings, single_flight, scheduler)
+
+
+async def remind_confirmation(message: Message) -> None:
+    await message.answer("Проверьте документ выше и нажмите «✅ Сформировать документ» или «✏️ Исправить ответ».")
+
+
+def abandon_expired_wizard(analytics: AnalyticsService, state: Optional[str], data: Dict[str, Any]) -> None:
+    """Count a wizard dropped by the idle FSM expiry as abandoned at the question it stopped on."""
+
+    document = DOCUMENTS_BY_CODE.get(data.get("document_code", ""))
+    if document and state in WIZARD_STATES:
+        analytics.track_step(document.code, data.get("index", 0), len(document.questions), "abandoned")
+
+
+async def cancel_creation(message: Message, state: FSMContext, analytics: AnalyticsService) -> None:
+    data = await state.get_data()
+    document = DOCUMENTS_BY_CODE.get(data.get("document_code", ""))
+    if document:
+        analytics.track_step(document.code, data.get("index", 0), len(document.questions), "abandoned")
     await state.clear()
     await message.answer("🚫 Окей, создание документа остановлено. Возвращайтесь, когда будете готовы! 😊")
 
@@ -1025,11 +1290,21 @@ async def go_back(
     storage: StorageService,
     analytics: AnalyticsService,
     settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
 ) -> None:
     data = await state.get_data()
+    document = DOCUMENTS_BY_CODE.get(data.get("document_code", ""))
+    if not document:
+        return
+    analytics.track_step(document.code, data.get("index", 0), len(document.questions), "back")
     index = max(0, data.get("index", 0) - 1)
-    await state.update_data(index=index)
-    await ask_next_question(message, state, storage, analytics, settings)
+    # Подставленный ответ при возврате задаём явно, иначе его снова пропустит автозаполнение.
+    autofill = [key for key in data.get("autofill", []) if key != document.questions[index].key]
+    await state.update_data(index=index, autofill=autofill)
+    if await state.get_state() != DocumentForm.collecting_data.state:
+        await state.set_state(DocumentForm.collecting_data)
+    await ask_next_question(message, state, storage, analytics, settings, single_flight, scheduler)
 
 
 async def collect_data(
@@ -1038,22 +1313,136 @@ async def collect_data(
     storage: StorageService,
     analytics: AnalyticsService,
     settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
 ) -> None:
     data = await state.get_data()
     document = DOCUMENTS_BY_CODE[data["document_code"]]
     index = data.get("index", 0)
     question = document.questions[index]
-    user_answer = message.text.strip()
-    if question.uppercase:
-        user_answer = user_answer.upper()
-    if question.pattern and not re.fullmatch(question.pattern, user_answer):
+    user_answer = normalize_answer(question, message.text)
+    if user_answer is None:
         hint = question.error_hint or "Используйте формат из примера."
+        analytics.track_step(document.code, index, len(document.questions), "invalid")
         await message.answer(f"⚠️ Некорректный формат ответа. {hint}")
         return
+    await accept_answer(message, state, data, user_answer, storage, analytics, settings, single_flight, scheduler)
+
+
+async def accept_answer(
+    message: Message,
+    state: FSMContext,
+    data: Dict,
+    answer: str,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    document = DOCUMENTS_BY_CODE[data["document_code"]]
+    index = data.get("index", 0)
+    total = len(document.questions)
+    # После «Назад» или правки ответ заменяет прежний, а не дописывается в конец.
     answers: List[str] = data.get("answers", [])
-    answers.append(user_answer)
-    await state.update_data(answers=answers, index=index + 1)
-    await ask_next_question(message, state, storage, analytics, settings)
+    answers[index : index + 1] = [answer]
+    editing = data.get("editing", False)
+    await state.update_data(answers=answers, index=total if editing else index + 1, editing=False)
+    if not data.get("regenerate"):
+        analytics.track_step(document.code, index, total, "answered")
+        if not editing:
+            analytics.track_step(document.code, index + 1, total, "reached")
+    await ask_next_question(message, state, storage, analytics, settings, single_flight, scheduler)
+
+
+async def use_saved_answer(
+    callback: CallbackQuery,
+    state: FSMContext,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    data = await state.get_data()
+    document = DOCUMENTS_BY_CODE.get(data.get("document_code", ""))
+    index = data.get("index", 0)
+    if (
+        await state.get_state() != DocumentForm.collecting_data.state
+        or document is None
+        or callback.data != f"wizard_saved:{index}"
+        or index >= len(document.questions)
+    ):
+        await callback.answer("Этот вопрос уже пройден.")
+        return
+    answer = data.get("saved", {}).get(document.questions[index].key)
+    if answer is None:
+        await callback.answer("Сохранённого ответа нет, введите его сообщением.")
+        return
+    await callback.answer()
+    await callback.message.answer(f"↩️ {html.escape(answer)}")
+    await accept_answer(callback.message, state, data, answer, storage, analytics, settings, single_flight, scheduler)
+
+
+async def apply_autofill(
+    callback: CallbackQuery,
+    state: FSMContext,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    if await state.get_state() != DocumentForm.reviewing_saved.state:
+        await callback.answer()
+        return
+    data = await state.get_data()
+    autofill = list(data.get("saved", {})) if callback.data == "autofill:yes" else []
+    await state.update_data(autofill=autofill)
+    await state.set_state(DocumentForm.collecting_data)
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await ask_next_question(callback.message, state, storage, analytics, settings, single_flight, scheduler)
+
+
+async def remind_autofill(message: Message) -> None:
+    await message.answer("Выберите вариант кнопкой выше: подставить сохранённые данные или заполнить заново.")
+
+
+async def forget_saved_fields(message: Message, storage: StorageService) -> None:
+    removed = await storage.saved_fields.forget(message.from_user.id)
+    if removed:
+        await message.answer("🗑 Сохранённые данные удалены. В новых документах бот спросит всё заново.")
+    else:
+        await message.answer("Сохранённых данных нет.")
+
+
+def render_status_text(position: int, eta: float) -> str:
+    # Оценка округляется вверх до 5 секунд, чтобы статус не правился из-за мелких колебаний.
+    seconds = max(5, math.ceil(eta / 5) * 5)
+    if position == 0:
+        return f"✨ Документ формируется, осталось около {seconds} с..."
+    return f"⏳ Документ в очереди: вы {position}-й. Примерное ожидание — {seconds} с."
+
+
+def render_status_reporter(status: Message) -> ProgressCallback:
+    """Progress callback that edits ``status`` in place, skipping edits that change nothing."""
+
+    shown = status.text
+
+    async def report(position: int, eta: float) -> None:
+        nonlocal shown
+        text = render_status_text(position, eta)
+        if text == shown:
+            return
+        shown = text
+        try:
+            await status.edit_text(text)
+        except TelegramBadRequest:
+            # Статус удалён пользователем — документ всё равно придёт отдельным сообщением.
+            pass
+
+    return report
 
 
 async def finalize_document(
@@ -1062,73 +1451,265 @@ async def finalize_document(
     storage: StorageService,
     analytics: AnalyticsService,
     settings: Settings,
+    scheduler: RenderScheduler,
+    status: Optional[Message] = None,
 ) -> None:
-    user_id = message.from_user.id
-    if not await can_create_document(user_id, limit=settings.monthly_document_limit):
+    # Сообщение может быть сообщением бота (ответ кнопкой), поэтому пользователь берётся из FSM.
+    user_id = state.key.user_id
+    data = await state.get_data()
+    regenerate = data.get("regenerate", False)
+    # Правка поля в только что выпущенном документе не считается новым документом — до лимита правок.
+    free_edit = regenerate and data.get("edits", 0) < settings.document_free_edits
+    if not free_edit and not await can_create_document(
+        user_id, settings.monthly_document_limit, db_path=storage.usage_db_path
+    ):
         await message.answer(
             f"Вы уже создали {settings.monthly_document_limit} документов в этом месяце. Лимит обновится в следующем месяце."
         )
         await state.clear()
         return
-    data = await state.get_data()
     document = DOCUMENTS_BY_CODE[data["document_code"]]
-    answers: List[str] = data.get("answers", [])
-    context = {question.key: answer for question, answer in zip(document.questions, answers)}
-    context["document_title"] = document.title
-    template_loader = TemplateLoader(TEMPLATES_DIR)
-    pdf_builder = PdfBuilder(template_loader)
-    pdf_file = pdf_builder.build(document.template, context)
+    context = document.context(data.get("answers", []))
+    pdf_builder = PdfBuilder(TEMPLATE_LOADER, profile=settings.pdf_profile)
+    try:
+        await admit_render()
+        pdf_file = await scheduler.submit(
+            pdf_builder.build,
+            document.template,
+            context,
+            high_priority=storage.get_profile(user_id).is_pro,
+            progress=render_status_reporter(status) if status is not None else None,
+        )
+    except RenderRejected:
+        await message.answer(
+            "😔 Сейчас слишком много запросов на формирование документов. "
+            "Ответы сохранены — нажмите «Сформировать документ» ещё раз через минуту.",
+            reply_markup=confirmation_keyboard(),
+        )
+        await state.set_state(DocumentForm.confirming)
+        return
     pdf_bytes = pdf_file.getvalue()
     pdf_file.close()
 
-    storage.register_generation(message.from_user.id, document.title)
-    await register_document_usage(user_id)
-    storage.remember_last_document(
-        message.from_user.id,
-        GeneratedDocument(
-            code=document.code,
-            title=document.title,
-            template_name=document.template,
-            context=dict(context),
-        ),
+    if free_edit:
+        analytics.log_event("document_regenerated", user_id, {"document": document.title})
+    else:
+        storage.register_generation(user_id, document.title)
+        await register_document_usage(user_id, db_path=storage.usage_db_path)
+    generated = GeneratedDocument(
+        code=document.code,
+        title=document.title,
+        template_name=document.template,
+        context=dict(context),
+        # Платная правка тоже считается: иначе после неё снова открылись бы бесплатные.
+        edits=data.get("edits", 0) + 1 if regenerate else 0,
     )
-    analytics.log_event("document_generated", message.from_user.id, {"document": document.title})
-
+    await storage.remember_last_document(user_id, generated)
+    context_key = await storage.contexts.put(generated)
+    if not regenerate:
+        analytics.log_event("document_generated", user_id, {"document": document.title})
+        analytics.funnel.complete(document.code, len(document.questions))
+    if settings.saved_fields_ttl_days > 0:
+        await storage.saved_fields.remember(user_id, context)
+
+    digest = content_digest("pdf", document.template, context, profile=settings.pdf_profile)
+    await storage.artifacts.store(user_id, document.code, document.title, "pdf", digest, pdf_bytes)
     document_file = BufferedInputFile(pdf_bytes, filename=f"{document.code}.pdf")
-    await message.answer_document(document_file, caption=f"Готово! <b>{document.title}</b> сформирован ✅")
+    verb = "обновлён" if regenerate else "сформирован"
+    sent = await message.answer_document(document_file, caption=f"Готово! <b>{document.title}</b> {verb} ✅")
+    await storage.artifacts.remember_file_id(digest, sent.document.file_id)
+    # Кнопка несёт подписанную ссылку на контекст в общем хранилище: DOCX выдаст любой воркер,
+    # в том числе после перезапуска.
     await message.answer(
         "Хотите продолжить?",
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🔁 К категориям", callback_data="docs")],
-                [InlineKeyboardButton(text="💬 Оставить отзыв", callback_data="feedback_start")],
-                [InlineKeyboardButton(text="📄 DOCX-файл", callback_data="docx_download")],
-                [InlineKeyboardButton(text="🚀 Про-режим в разработке", callback_data="upgrade")],
-            ]
-        ),
+        reply_markup=result_keyboard(storage.download_tokens.issue(user_id, "docx", context_key)),
     )
     await state.clear()
 
 
-async def send_docx(callback: CallbackQuery, storage: StorageService) -> None:
-    await callback.answer()
-    last_document = storage.get_last_document(callback.from_user.id)
+async def send_docx(
+    callback: CallbackQuery,
+    storage: StorageService,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    last_document = await storage.get_last_document(callback.from_user.id)
     if not last_document:
+        await callback.answer()
         await callback.message.answer(
             "Чтобы получить DOCX, сначала сформируйте документ."
         )
         return
 
-    template_loader = TemplateLoader(TEMPLATES_DIR)
-    docx_builder = DocxBuilder(template_loader)
-    docx_file = docx_builder.build(last_document.template_name, last_document.context)
+    is_pro = storage.get_profile(callback.from_user.id).is_pro
+    started, _ = await single_flight.run(
+        callback.from_user.id,
+        "send_docx",
+        lambda: _send_docx(callback, storage, last_document, scheduler, is_pro),
+        join=True,
+    )
+    if not started:
+        await callback.answer("DOCX уже отправлен — проверьте чат выше.")
+
+
+async def _send_docx(
+    callback: CallbackQuery,
+    storage: StorageService,
+    last_document: GeneratedDocument,
+    scheduler: RenderScheduler,
+    high_priority: bool,
+) -> None:
+    docx_builder = DocxBuilder(TEMPLATE_LOADER)
+    try:
+        await admit_render()
+        docx_file = await scheduler.submit(
+            docx_builder.build,
+            last_document.template_name,
+            last_document.context,
+            high_priority=high_priority,
+        )
+    except RenderRejected:
+        await callback.answer("Сервис перегружен, попробуйте получить DOCX через минуту.", show_alert=True)
+        return
+    await callback.answer()
     docx_bytes = docx_file.getvalue()
     docx_file.close()
 
-    await callback.message.answer_document(
+    digest = content_digest("docx", last_document.template_name, last_document.context)
+    await storage.artifacts.store(
+        callback.from_user.id, last_document.code, last_document.title, "docx", digest, docx_bytes
+    )
+    sent = await callback.message.answer_document(
         BufferedInputFile(docx_bytes, filename=f"{last_document.code}.docx"),
         caption=f"DOCX-версия: {last_document.title}",
     )
+    await storage.artifacts.remember_file_id(digest, sent.document.file_id)
+
+
+async def redeliver_document(
+    callback: CallbackQuery,
+    storage: StorageService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    verified = storage.download_tokens.verify(callback.data, callback.from_user.id)
+    if verified is None:
+        await callback.answer("Кнопка устарела — сформируйте документ заново.", show_alert=True)
+        return
+    fmt, key = verified
+    is_pro = storage.get_profile(callback.from_user.id).is_pro
+    started, _ = await single_flight.run(
+        callback.from_user.id,
+        f"download:{fmt}",
+        lambda: _redeliver_document(callback, storage, settings, scheduler, fmt, key, is_pro),
+        join=True,
+    )
+    if not started:
+        await callback.answer("Файл уже отправлен — проверьте чат выше.")
+
+
+async def _redeliver_document(
+    callback: CallbackQuery,
+    storage: StorageService,
+    settings: Settings,
+    scheduler: RenderScheduler,
+    fmt: str,
+    key: bytes,
+    high_priority: bool,
+) -> None:
+    document = await storage.contexts.get(key)
+    if document is None:
+        await callback.answer("Документ больше не хранится — сформируйте его заново.", show_alert=True)
+        return
+    profile = settings.pdf_profile if fmt == "pdf" else None
+    digest = content_digest(fmt, document.template_name, document.context, profile=profile)
+    found = await storage.artifacts.find(digest)
+    data = None
+    if found is None:
+        # Файла нет ни у кого в архиве — рендерим заново по сохранённому контексту.
+        if fmt == "pdf":
+            builder = PdfBuilder(TEMPLATE_LOADER, profile=settings.pdf_profile)
+        else:
+            builder = DocxBuilder(TEMPLATE_LOADER)
+        try:
+            await admit_render()
+            rendered = await scheduler.submit(
+                builder.build, document.template_name, document.context, high_priority=high_priority
+            )
+        except RenderRejected:
+            await callback.answer("Сервис перегружен, попробуйте получить файл через минуту.", show_alert=True)
+            return
+        data = rendered.getvalue()
+        rendered.close()
+    await callback.answer()
+    if data is not None:
+        await storage.artifacts.store(callback.from_user.id, document.code, document.title, fmt, digest, data)
+
+    caption = f"{fmt.upper()}-версия: {document.title}"
+    if found is not None and found[0]:
+        try:
+            await callback.message.answer_document(found[0], caption=caption)
+            return
+        except TelegramBadRequest:
+            # file_id привязан к боту; после смены токена отправляем сохранённые байты.
+            pass
+    if data is None:
+        found = await storage.artifacts.find(digest, with_data=True)
+        if found is None:
+            await callback.message.answer("Файл больше не хранится — сформируйте документ заново.")
+            return
+        data = found[1]
+    sent = await callback.message.answer_document(
+        BufferedInputFile(data, filename=f"{document.code}.{fmt}"), caption=caption
+    )
+    await storage.artifacts.remember_file_id(digest, sent.document.file_id)
+
+
+async def choose_field_to_edit(callback: CallbackQuery, storage: StorageService) -> None:
+    last_document = await storage.get_last_document(callback.from_user.id)
+    document = DOCUMENTS_BY_CODE.get(last_document.code) if last_document else None
+    if document is None:
+        await callback.answer("Сначала сформируйте документ.", show_alert=True)
+        return
+    await callback.answer()
+    answers = [last_document.context.get(question.key, "") for question in document.questions]
+    await callback.message.answer(
+        f"Какое поле изменить в документе «{document.title}»? Файл пересоберётся сразу после ответа.",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=answer_buttons(answers, f"regen_field:{document.code}")),
+    )
+
+
+async def regenerate_field(
+    callback: CallbackQuery,
+    state: FSMContext,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
+) -> None:
+    _, code, raw_index = callback.data.split(":")
+    index = int(raw_index)
+    last_document = await storage.get_last_document(callback.from_user.id)
+    document = DOCUMENTS_BY_CODE.get(code)
+    if last_document is None or last_document.code != code or document is None or index >= len(document.questions):
+        await callback.answer("Это уже не последний документ — нажмите «✏️ Изменить поле» под новым.", show_alert=True)
+        return
+    # Контекст готового документа становится анкетой, в которой заново задаётся один вопрос.
+    await state.set_state(DocumentForm.collecting_data)
+    await state.set_data(
+        {
+            "document_code": code,
+            "answers": [last_document.context.get(question.key, "") for question in document.questions],
+            "index": index,
+            "editing": True,
+            "regenerate": True,
+            "edits": last_document.edits,
+        }
+    )
+    await callback.answer()
+    await ask_next_question(callback.message, state, storage, analytics, settings, single_flight, scheduler)
 
 
 async def upgrade_placeholder(callback: CallbackQuery) -> None:
@@ -1139,9 +1720,9 @@ async def show_docs(callback: CallbackQuery) -> None:
     await show_categories(callback)
 
 
-async def check_subscription_handler(callback: CallbackQuery, bot: Bot) -> None:
+async def check_subscription_handler(callback: CallbackQuery, bot: Bot, settings: Settings) -> None:
     user_id = callback.from_user.id
-    if await is_subscribed(bot, user_id):
+    if await is_subscribed(bot, settings.main_channel_id, user_id):
         await callback.answer("Подписка подтверждена!", show_alert=False)
         await callback.message.answer(
             "✅ Подписка подтверждена! Теперь вы можете создавать документы.\n\nВыберите категорию:",
@@ -1160,14 +1741,16 @@ async def wizard_back(
     storage: StorageService,
     analytics: AnalyticsService,
     settings: Settings,
+    single_flight: SingleFlight,
+    scheduler: RenderScheduler,
 ) -> None:
     await callback.answer()
-    await go_back(callback.message, state, storage, analytics, settings)
+    await go_back(callback.message, state, storage, analytics, settings, single_flight, scheduler)
 
 
-async def wizard_cancel(callback: CallbackQuery, state: FSMContext) -> None:
+async def wizard_cancel(callback: CallbackQuery, state: FSMContext, analytics: AnalyticsService) -> None:
     await callback.answer()
-    await cancel_creation(callback.message, state)
+    await cancel_creation(callback.message, state, analytics)
     await callback.message.answer(
         "Вы вернулись в главное меню. Выберите категорию документов:",
         reply_markup=build_categories_keyboard(),
@@ -1179,10 +1762,20 @@ def setup_handlers(router: Router) -> None:
     router.callback_query.register(show_category_documents, F.data.startswith("cat:"))
     router.callback_query.register(start_document, F.data.startswith("doc:"))
     router.callback_query.register(send_docx, F.data == "docx_download")
+    router.callback_query.register(redeliver_document, F.data.startswith("dl:"))
     router.callback_query.register(upgrade_placeholder, F.data == "upgrade")
     router.callback_query.register(check_subscription_handler, F.data == "check_subscription")
     router.callback_query.register(wizard_back, F.data == "wizard_back")
     router.callback_query.register(wizard_cancel, F.data == "wizard_cancel")
+    router.callback_query.register(use_saved_answer, F.data.startswith("wizard_saved:"))
+    router.callback_query.register(apply_autofill, F.data.startswith("autofill:"))
+    router.callback_query.register(confirm_document, F.data.startswith("confirm:"))
+    router.callback_query.register(edit_answer, F.data.startswith("edit_answer:"))
+    router.callback_query.register(choose_field_to_edit, F.data == "regen_fields")
+    router.callback_query.register(regenerate_field, F.data.startswith("regen_field:"))
     router.message.register(cancel_creation, Command("cancel"))
     router.message.register(go_back, Command("back"))
-    router.message.register(collect_data, DocumentForm.collecting_data)
+    router.message.register(forget_saved_fields, Command("forget"))
+    router.message.register(collect_data, DocumentForm.collecting_data, F.text)
+    router.message.register(remind_autofill, DocumentForm.reviewing_saved, is_wizard_answer)
+    router.message.register(remind_confirmation, DocumentForm.confirming, is_wizard_answer)
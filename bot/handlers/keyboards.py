@@ -1,10 +1,8 @@
 ﻿from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from ..config import settings
 
-
-def subscription_keyboard() -> InlineKeyboardMarkup:
-    channel_username = settings.main_channel_username.lstrip('@')
+def subscription_keyboard(channel_username: str) -> InlineKeyboardMarkup:
+    channel_username = channel_username.lstrip('@')
     channel_url = f"https://t.me/{channel_username}"
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -14,12 +12,13 @@ def subscription_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def result_keyboard(document_id: str) -> InlineKeyboardMarkup:
+def result_keyboard(docx_token: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="⬇️ Скачать .DOCX", callback_data=f"get_docx:{document_id}")],
             [InlineKeyboardButton(text="🔁 К категориям", callback_data="docs")],
-            [InlineKeyboardButton(text="📄 DOCX (скоро)", callback_data="docx_placeholder")],
+            [InlineKeyboardButton(text="💬 Оставить отзыв", callback_data="feedback_start")],
+            [InlineKeyboardButton(text="📄 DOCX-файл", callback_data=docx_token)],
+            [InlineKeyboardButton(text="✏️ Изменить поле", callback_data="regen_fields")],
             [InlineKeyboardButton(text="🚀 Про-режим в разработке", callback_data="upgrade")],
         ]
     )
@@ -1,13 +1,66 @@
-from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable
 
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
+from aiogram.types import CallbackQuery, Message, TelegramObject
 
+from ..services.metrics import HANDLER_SECONDS, UPDATES
+from ..services.scheduler import INTERACTIVE, render_wait
+from ..services.throttling import FloodGuard, RenderGate, render_gate
 
-class DependencyMiddleware(BaseMiddleware):
-    def __init__(self, **dependencies: Any) -> None:
-        super().__init__()
-        self.dependencies = dependencies
+
+class LaneLatencyMiddleware(BaseMiddleware):
+    """Records handler latency in the interactive lane, excluding time spent waiting for renders.
+
+    Also feeds the per-handler update counter and latency histogram of ``/metrics``.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        waited = [0.0]
+        token = render_wait.set(waited)
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            render_wait.reset(token)
+            elapsed = time.monotonic() - started
+            data["scheduler"].observe(INTERACTIVE, elapsed - waited[0])
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+            UPDATES.inc(name)
+            HANDLER_SECONDS.observe(elapsed, name)
+
+
+EXPENSIVE_CALLBACK_PREFIXES = (
+    "doc:",
+    "check_subscription",
+    "confirm:render",
+    "regen_field:",
+    "docx_download",
+    "dl:",
+    "artifact:",
+)
+EXPENSIVE_COMMANDS = ("/profile", "/admin", "/forget")
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    """Outer middleware that drops or delays updates over the user's budget before any filter runs.
+
+    Every update is charged to the cheap budget; actions that hit Telegram (``get_chat_member``),
+    SQLite or the renderer are also charged to the expensive one. A render started by an update
+    admitted as cheap (a typed answer, an edited field) is charged through ``render_gate`` and
+    ``admit_render``. Dropped users get one notice per interval.
+    """
+
+    def __init__(self, guard: FloodGuard, exempt: Iterable[int] = ()) -> None:
+        self.guard = guard
+        self.exempt = frozenset(exempt)
 
     async def __call__(
         self,
@@ -15,5 +68,36 @@ class DependencyMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        data.update(self.dependencies)
-        return await handler(event, data)
+        user = getattr(event, "from_user", None)
+        if user is None or user.id in self.exempt:
+            return await handler(event, data)
+
+        expensive = self._is_expensive(event)
+        wait = self.guard.admit(user.id, expensive)
+        if wait is None:
+            await self._notify(event, user.id, "⏳ Слишком много запросов. Подождите несколько секунд.")
+            return None
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.guard.passed += 1
+        token = render_gate.set(RenderGate(self.guard, user.id, charged=expensive))
+        try:
+            return await handler(event, data)
+        finally:
+            render_gate.reset(token)
+
+    @staticmethod
+    def _is_expensive(event: TelegramObject) -> bool:
+        if isinstance(event, CallbackQuery):
+            return (event.data or "").startswith(EXPENSIVE_CALLBACK_PREFIXES)
+        if isinstance(event, Message):
+            return (event.text or "").startswith(EXPENSIVE_COMMANDS)
+        return False
+
+    async def _notify(self, event: TelegramObject, user_id: int, text: str) -> None:
+        if not self.guard.should_notify(user_id):
+            return
+        if isinstance(event, CallbackQuery):
+            await event.answer(text, show_alert=False)
+        elif isinstance(event, Message):
+            await event.answer(text)
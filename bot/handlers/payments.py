@@ -1,51 +1,43 @@
-from aiogram import Router
+from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
-from ..config import Settings
-from ..services.analytics import AnalyticsService
 from ..services.payments import PaymentService
 from ..services.storage import StorageService
-from .middleware import DependencyMiddleware
 
-router = Router()
 
-
-def setup_router(settings: Settings, analytics: AnalyticsService, storage: StorageService) -> Router:
-    payment_service = PaymentService(settings)
-    router.message.middleware(
-        DependencyMiddleware(
-            settings=settings, analytics=analytics, storage=storage, payments=payment_service
-        )
-    )
-    router.callback_query.middleware(
-        DependencyMiddleware(
-            settings=settings, analytics=analytics, storage=storage, payments=payment_service
-        )
-    )
+def setup_router() -> Router:
+    router = Router()
+    router.message.register(upgrade, Command("upgrade"))
+    router.callback_query.register(activate_pro, F.data.startswith("activate_pro"))
+    router.message.register(pricing, Command("pricing"))
     return router
 
 
-@router.message(Command("upgrade"))
 async def upgrade(message: Message, payments: PaymentService, storage: StorageService) -> None:
     result = await payments.create_checkout(message.from_user.id)
     await message.answer(
         f"Оформляем Pro (демо). {result.message}",
         reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="Активировать Pro", callback_data="activate_pro")]]
+            inline_keyboard=[
+                [InlineKeyboardButton(text="Активировать Pro", callback_data=f"activate_pro:{result.checkout_id}")]
+            ]
         ),
     )
 
 
-@router.callback_query(lambda c: c.data == "activate_pro")
-async def activate_pro(callback: CallbackQuery, payments: PaymentService, storage: StorageService) -> None:
+async def activate_pro(callback: CallbackQuery, payments: PaymentService) -> None:
     await callback.answer()
-    result = await payments.activate_subscription(callback.from_user.id)
-    storage.activate_pro(callback.from_user.id)
+    _, _, checkout_id = callback.data.partition(":")
+    if not checkout_id:
+        # Кнопка из сообщения, отправленного до появления идентификатора оплаты.
+        await callback.message.answer("Кнопка устарела, оформите подписку заново: /upgrade")
+        return
+    # Подписку включит обработчик платёжных событий; здесь только передаём оплату провайдеру.
+    result = await payments.activate_subscription(callback.from_user.id, checkout_id)
     await callback.message.answer(result.message)
 
 
-@router.message(Command("pricing"))
 async def pricing(message: Message, payments: PaymentService) -> None:
     info = payments.pricing_info()
     await message.answer(f"Тарифы:\n{info['free']}\n{info['pro']}")
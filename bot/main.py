@@ -1,31 +1,395 @@
 import asyncio
 import logging
+import signal
+import time
+from pathlib import Path
+from typing import Any, Dict
 from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramAPIError
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from .config import load_settings
+from .config import Settings, load_settings
 from .handlers import admin, commands, documents, feedback, payments
+from .handlers.middleware import FloodControlMiddleware, LaneLatencyMiddleware
 from .services.analytics import AnalyticsService
+from .services.counters import SharedCounterStore
+from .services.feedback_queue import FeedbackQueue
+from .services import limits
+from .services.http_session import TelegramSession
+from .services.maintenance import (
+    ANALYTICS_LOG_DIR,
+    AnalyticsRotation,
+    FsmExpiry,
+    MaintenanceScheduler,
+    sqlite_compaction,
+)
+from .services.memory import MemoryReporter
+from .services.payment_events import PaymentInbox
+from .services.payments import PaymentService
+from .services.scheduler import RenderScheduler
+from .services.snapshot import SNAPSHOT_PATH, load_snapshot, save_snapshot
+from .services.single_flight import SingleFlight
+from .services.layout_cache import layout_cache
+from .services.metrics import TelegramRequestMetrics, metrics, start_metrics_server
 from .services.storage import StorageService
+from .services.throttling import FloodGuard
+
+
+def create_session(settings: Settings) -> TelegramSession:
+    session = TelegramSession(
+        pool_size=settings.telegram_pool_size,
+        upload_pool_size=settings.telegram_upload_pool_size,
+        keepalive=settings.telegram_keepalive,
+        timeout=settings.telegram_timeout,
+        upload_timeout=settings.telegram_upload_timeout,
+        retries=settings.telegram_retries,
+    )
+    # Один раз на сессию: ботов на общей сессии может быть несколько, а запрос должен считаться однажды.
+    session.middleware(TelegramRequestMetrics())
+    return session
+
+
+def create_bot(settings: Settings, session: TelegramSession | None = None) -> Bot:
+    # Токен входит в URL запроса, поэтому несколько ботов могут делить одну сессию и её пулы.
+    return Bot(token=settings.bot_token, session=session or create_session(settings), parse_mode=ParseMode.HTML)
+
+
+def create_scheduler(settings: Settings) -> RenderScheduler:
+    return RenderScheduler(
+        concurrency=settings.render_concurrency,
+        max_queue=settings.render_queue_size,
+        slo_seconds=settings.render_slo_seconds,
+        pro_weight=settings.pro_render_weight,
+        progress_interval=settings.render_status_interval,
+        progress_rate=settings.render_status_rate,
+    )
+
+
+def register_metrics(
+    storage: StorageService,
+    scheduler: RenderScheduler,
+    single_flight: SingleFlight,
+    flood_guard: FloodGuard,
+) -> None:
+    """Expose state kept by services; read only when ``/metrics`` is scraped."""
+
+    metrics.gauge_callback("bot_render_queue_depth", "Render jobs waiting in the queue", lambda: scheduler.queued)
+    metrics.gauge_callback("bot_render_active", "Render jobs currently running", lambda: scheduler.active)
+    metrics.counter_callback(
+        "bot_render_dropped_total",
+        "Render jobs shed by SLO or rejected on a full queue",
+        lambda: {("shed",): scheduler.shed, ("rejected",): scheduler.rejected},
+        ("reason",),
+    )
+    metrics.counter_callback(
+        "bot_cache_requests_total",
+        "Cache lookups by cache and result",
+        lambda: {
+            ("layout", "hit"): layout_cache.hits,
+            ("layout", "miss"): layout_cache.misses,
+            ("layout_dynamic", "hit"): layout_cache.dynamic_hits,
+            ("layout_dynamic", "miss"): layout_cache.dynamic_misses,
+            ("last_documents", "hit"): storage._last_documents.hits,
+            ("last_documents", "disk_hit"): storage._last_documents.disk_hits,
+            ("last_documents", "miss"): storage._last_documents.misses,
+            ("single_flight", "avoided"): single_flight.stats()["avoided"],
+            ("single_flight", "started"): single_flight.stats()["started"],
+        },
+        ("cache", "result"),
+    )
+    metrics.counter_callback(
+        "bot_flood_updates_total",
+        "Updates seen by flood control, by decision",
+        lambda: {(decision,): flood_guard.stats()[decision] for decision in ("passed", "delayed", "dropped")},
+        ("decision",),
+    )
+
+
+def register_maintenance(
+    settings: Settings,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    fsm_storage: MemoryStorage,
+    feedback_queue: FeedbackQueue,
+    counters: SharedCounterStore | None,
+) -> MaintenanceScheduler:
+    """Housekeeping that used to run inline on request paths, or not at all."""
+
+    maintenance = MaintenanceScheduler(jitter=settings.maintenance_jitter)
+    # Состояние процесса: каждый воркер обслуживает своё.
+    maintenance.add(
+        "fsm_expiry",
+        FsmExpiry(
+            fsm_storage,
+            settings.fsm_idle_ttl_hours * 3600,
+            on_expire=lambda state, data: documents.abandon_expired_wizard(analytics, state, data),
+        ),
+        interval=600,
+        budget=1,
+    )
+
+    async def expire_last_documents(deadline: float) -> Dict[str, int]:
+        spilled, deleted = await storage._last_documents.expire()
+        return {"spilled": spilled, "deleted": deleted}
+
+    maintenance.add("last_documents", expire_last_documents, interval=600, budget=1)
+    maintenance.add(
+        "analytics_rotation",
+        AnalyticsRotation(
+            analytics,
+            settings.analytics_max_events,
+            keep_files=settings.analytics_log_keep,
+            directory=analytics.archive_dir,
+        ),
+        interval=900,
+        budget=5,
+    )
+    if not settings.maintenance_shared:
+        return maintenance
+
+    async def expire_contexts(deadline: float) -> Dict[str, int]:
+        return {"deleted": await storage.contexts.expire(deadline)}
+
+    async def expire_saved_fields(deadline: float) -> Dict[str, int]:
+        return {"deleted": await storage.saved_fields.expire()}
+
+    async def rollup_usage(deadline: float) -> Dict[str, int]:
+        return await limits.rollup_usage(settings.usage_raw_retention_days, deadline, db_path=storage.usage_db_path)
+
+    maintenance.add("saved_fields", expire_saved_fields, interval=6 * 3600, budget=5)
+    maintenance.add("usage_rollup", rollup_usage, interval=6 * 3600, budget=10)
+    databases = [storage.usage_db_path or limits._DB_PATH, storage.saved_fields.db_path, feedback_queue.db_path]
+    if counters is not None:
+        databases.append(counters.db_path)
+    if not settings.tenant:
+        # Файлы, общие для всех ботов процесса, обслуживает основной бот.
+        maintenance.add("document_contexts", expire_contexts, interval=3600, budget=5)
+        maintenance.add("artifact_retention", storage.artifacts.prune, interval=600, budget=5)
+        databases += [storage.contexts.db_path, storage.artifacts.db_path]
+    maintenance.add("sqlite_compact", sqlite_compaction(databases), interval=24 * 3600, budget=30)
+    return maintenance
+
+
+async def _wait_idle(dp: Dispatcher, scheduler: RenderScheduler, deadline: float) -> Dict[str, int]:
+    """Let in-flight updates and renders finish until ``deadline``; intake is already stopped."""
+
+    # Задачи апдейтов, которые polling запустил в режиме handle_as_tasks.
+    in_flight = [task for task in getattr(dp, "_handle_update_tasks", ()) if not task.done()]
+    abandoned = 0
+    if in_flight:
+        _, pending = await asyncio.wait(in_flight, timeout=max(0.0, deadline - time.monotonic()))
+        abandoned = len(pending)
+    while (scheduler.queued or scheduler.active) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return {
+        "updates_drained": len(in_flight) - abandoned,
+        "updates_abandoned": abandoned,
+        "renders_unfinished": scheduler.queued + scheduler.active,
+    }
+
+
+def build_dispatcher(
+    settings: Settings,
+    counters: SharedCounterStore | None = None,
+    snapshot_path: Path | None = SNAPSHOT_PATH,
+    scheduler: RenderScheduler | None = None,
+    payment_inbox_path: Path | None = None,
+) -> Dispatcher:
+    """Dispatcher of one bot; pass ``scheduler`` to share a render pool (its owner then closes it)."""
+
+    fsm_storage = MemoryStorage()
+
+    # У каждого бота свой каталог: иначе ротация смешивает события и удаляет чужие файлы.
+    analytics = AnalyticsService(counters=counters, archive_dir=settings.data_path("analytics") or ANALYTICS_LOG_DIR)
+    storage_service = StorageService(settings=settings, analytics=analytics, counters=counters)
+    single_flight = SingleFlight()
+    owns_scheduler = scheduler is None
+    if scheduler is None:
+        scheduler = create_scheduler(settings)
+    feedback_queue = FeedbackQueue(
+        settings.admin_ids,
+        digest_interval=settings.feedback_digest_interval,
+        send_rate=settings.feedback_send_rate,
+        max_attempts=settings.feedback_max_attempts,
+        db_path=settings.data_path("feedback_queue.db"),
+    )
+    payment_inbox = PaymentInbox(
+        batch_size=settings.payment_batch_size,
+        batch_window=settings.payment_batch_window,
+        db_path=payment_inbox_path or settings.data_path("payment_events.db"),
+    )
+    flood_guard = FloodGuard(
+        rate=settings.flood_rate,
+        burst=settings.flood_burst,
+        expensive_rate=settings.flood_expensive_rate,
+        expensive_burst=settings.flood_expensive_burst,
+        max_delay=settings.flood_max_delay,
+        notice_interval=settings.flood_notice_interval,
+    )
+    memory = MemoryReporter(use_tracemalloc=settings.memory_tracemalloc)
+    memory.track("user_profiles", lambda: storage_service.user_profiles)
+    memory.track("last_documents", lambda: storage_service._last_documents)
+    memory.track("document_counter", lambda: storage_service.document_counter)
+    memory.track("analytics.events", lambda: analytics.events)
+    memory.track("analytics.errors", lambda: analytics.errors)
+    memory.track("waiting_feedback_users", lambda: feedback_queue.waiting)
+    memory.track("fsm_storage", lambda: fsm_storage.storage)
+    memory.track(
+        "flood_buckets",
+        lambda: (flood_guard.cheap, flood_guard.expensive, flood_guard.notices),
+        count=lambda: len(flood_guard.cheap) + len(flood_guard.expensive) + len(flood_guard.notices),
+    )
+    maintenance = register_maintenance(settings, storage_service, analytics, fsm_storage, feedback_queue, counters)
+
+    # Зависимости хендлеров передаются один раз через workflow data диспетчера.
+    dp = Dispatcher(
+        storage=fsm_storage,
+        settings=settings,
+        analytics=analytics,
+        single_flight=single_flight,
+        scheduler=scheduler,
+        memory=memory,
+        feedback_queue=feedback_queue,
+        flood_guard=flood_guard,
+        maintenance=maintenance,
+        payments=PaymentService(settings, payment_inbox),
+    )
+    # Имя ``storage`` в конструкторе занято FSM-хранилищем.
+    dp["storage"] = storage_service
+    if settings.flood_rate > 0:
+        flood_control = FloodControlMiddleware(flood_guard, exempt=settings.admin_ids)
+        dp.message.outer_middleware(flood_control)
+        dp.callback_query.outer_middleware(flood_control)
+    dp.message.middleware(LaneLatencyMiddleware())
+    dp.callback_query.middleware(LaneLatencyMiddleware())
+
+    if not settings.tenant:
+        # /metrics процесса показывает основной бот; общий планировщик рендера виден и по нему.
+        register_metrics(storage_service, scheduler, single_flight, flood_guard)
+        metrics.gauge_callback(
+            "bot_maintenance_last_run_timestamp",
+            "Unix time of the last maintenance run, by task",
+            lambda: {(task.name,): task.last_started or 0 for task in maintenance.tasks.values()},
+            ("task",),
+        )
+
+    async def start_background_tasks(bot: Bot) -> None:
+        if settings.state_snapshot and snapshot_path is not None:
+            restored = await asyncio.to_thread(load_snapshot, snapshot_path, storage_service, analytics, fsm_storage)
+            if restored:
+                logging.info("Восстановлено состояние из %s: %s", snapshot_path, restored)
+        # Снимок может отставать от обработанных платежей — источник правды для Pro это inbox.
+        storage_service.apply_subscriptions(await payment_inbox.subscriptions(), log_events=False)
+
+        async def apply_subscriptions(changes: Dict[int, bool]) -> None:
+            storage_service.apply_subscriptions(changes)
+            for user_id, is_pro in changes.items():
+                text = "Pro-подписка активирована 🎉" if is_pro else "Pro-подписка отключена"
+                try:
+                    await bot.send_message(user_id, text)
+                except TelegramAPIError:
+                    logging.warning("Не удалось уведомить %s об изменении подписки", user_id)
+
+        dp["feedback_task"] = asyncio.create_task(feedback_queue.run(bot))
+        dp["payments_task"] = asyncio.create_task(payment_inbox.run(apply_subscriptions))
+        if settings.memory_report_interval > 0:
+            dp["memory_task"] = asyncio.create_task(memory.run_periodic(settings.memory_report_interval))
+        if settings.maintenance_enabled:
+            dp["maintenance_task"] = asyncio.create_task(maintenance.run())
+        if settings.metrics_port > 0:
+            dp["metrics_runner"] = await start_metrics_server(settings.metrics_host, settings.metrics_port)
+
+    async def graceful_shutdown() -> None:
+        started = time.monotonic()
+        report: Dict[str, Any] = await _wait_idle(dp, scheduler, started + settings.shutdown_timeout)
+        report["renders_completed"] = scheduler.completed
+        if owns_scheduler:
+            await scheduler.close()
+        for name in ("feedback_task", "payments_task", "memory_task", "maintenance_task"):
+            task = dp.workflow_data.pop(name, None)
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        report["feedback_pending"] = (await feedback_queue.stats())["pending"]
+        report["payment_events_pending"] = (await payment_inbox.stats())["pending"]
+        report["last_documents_flushed"] = await storage_service.flush()
+        if settings.state_snapshot and snapshot_path is not None:
+            report["snapshot"] = await asyncio.to_thread(
+                save_snapshot, snapshot_path, storage_service, analytics, fsm_storage
+            )
+        runner = dp.workflow_data.pop("metrics_runner", None)
+        if runner is not None:
+            await runner.cleanup()
+        logging.info("Остановка завершена за %.1f с: %s", time.monotonic() - started, report)
+
+    dp.startup.register(start_background_tasks)
+    dp.shutdown.register(graceful_shutdown)
+
+    dp.include_router(documents.setup_wizard_router())
+    dp.include_router(commands.setup_router())
+    dp.include_router(feedback.setup_router())
+    dp.include_router(documents.setup_router())
+    dp.include_router(payments.setup_router())
+    dp.include_router(admin.setup_router())
+    return dp
+
+
+async def run_bots(settings: Settings) -> None:
+    """Serve the main bot and every ``BOTS`` entry from this process.
+
+    Each bot gets its own dispatcher, FSM, analytics and per-bot data files; the render scheduler,
+    Bot API connection pools, templates, fonts, layout cache and artifact archive are shared.
+    """
+
+    configs = [settings, *(settings.for_bot(bot) for bot in settings.bots)]
+    scheduler = create_scheduler(settings)
+    session = create_session(settings)
+    bots = [create_bot(config, session) for config in configs]
+    dispatchers = [
+        build_dispatcher(
+            config, snapshot_path=config.data_path("state_snapshot.json.gz") or SNAPSHOT_PATH, scheduler=scheduler
+        )
+        for config in configs
+    ]
+    for bot in bots:
+        await bot.delete_webhook(drop_pending_updates=True)
+
+    # Обработчик сигнала у цикла один, поэтому сигналы ловит не aiogram, а этот код — для всех ботов сразу.
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda sig=sig: [dp._signal_stop_polling(sig) for dp in dispatchers])
+    logging.info("Запущено ботов в процессе: %s (%s)", len(bots), ", ".join(config.tenant or "main" for config in configs))
+    try:
+        await asyncio.gather(
+            *(
+                dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+                for dp, bot in zip(dispatchers, bots)
+            )
+        )
+    finally:
+        await scheduler.close()
+        await session.close()
 
 
 async def main() -> None:
     settings = load_settings()
     logging.basicConfig(level=logging.INFO if settings.enable_logging else logging.WARNING)
 
-    bot = Bot(token=settings.bot_token, parse_mode=ParseMode.HTML)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    if settings.workers > 1:
+        from .cluster import run_supervisor
+
+        if settings.bots:
+            logging.warning("BOTS работает только при WORKERS=1; дополнительные боты не запущены")
+        await run_supervisor(settings)
+        return
 
-    analytics = AnalyticsService()
-    storage_service = StorageService(settings=settings, analytics=analytics)
+    if settings.bots:
+        await run_bots(settings)
+        return
 
-    dp.include_router(commands.setup_router(settings, analytics, storage_service))
-    dp.include_router(feedback.setup_router(settings, storage_service))
-    dp.include_router(documents.setup_router(settings, analytics, storage_service))
-    dp.include_router(payments.setup_router(settings, analytics, storage_service))
-    dp.include_router(admin.setup_router(settings, analytics, storage_service))
+    bot = create_bot(settings)
+    dp = build_dispatcher(settings, snapshot_path=settings.data_path("state_snapshot.json.gz") or SNAPSHOT_PATH)
 
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
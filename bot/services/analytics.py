@@ -3,8 +3,12 @@ from __future__ import annotations
 from collections import Counter
 from dataclasses import dataclass, field
 from datetime import datetime
+from pathlib import Path
 from typing import Dict, List
 
+from .counters import SharedCounterStore
+from .funnel import FunnelAggregator
+
 
 @dataclass
 class AnalyticsEntry:
@@ -15,25 +19,75 @@ class AnalyticsEntry:
 
 
 class AnalyticsService:
-    def __init__(self) -> None:
+    """In-memory event log plus running totals.
+
+    ``events`` only holds what has not been rotated into ``archive_dir`` yet, so the totals are
+    kept separately and never derived from the list.
+    """
+
+    def __init__(self, counters: SharedCounterStore | None = None, archive_dir: Path | None = None) -> None:
         self.events: List[AnalyticsEntry] = []
         self.errors: List[str] = []
+        self.counters = counters
+        self.archive_dir = archive_dir
+        self.funnel = FunnelAggregator(counters)
+        self.event_totals: Counter[str] = Counter()
+        self.document_totals: Counter[str] = Counter()
+        self.error_total = 0
+
+    def _count(self, entry: AnalyticsEntry) -> None:
+        self.event_totals[entry.event] += 1
+        if entry.event == "document_generated":
+            self.document_totals[entry.payload.get("document", "unknown")] += 1
 
     def log_event(self, event: str, user_id: int, payload: Dict[str, str] | None = None) -> None:
         payload = payload or {}
-        self.events.append(AnalyticsEntry(event=event, user_id=user_id, payload=payload))
+        entry = AnalyticsEntry(event=event, user_id=user_id, payload=payload)
+        self.events.append(entry)
+        self._count(entry)
+        if self.counters:
+            self.counters.incr("events", event)
+
+    def track_step(self, document: str, index: int, total: int, stage: str) -> None:
+        self.funnel.record(document, index, total, stage)
 
     def log_error(self, message: str) -> None:
         self.errors.append(message)
+        self.error_total += 1
+        if self.counters:
+            self.counters.incr("errors", "total")
+
+    def restore(self, entries: List[AnalyticsEntry], errors: List[str], totals: Dict[str, object] | None) -> None:
+        """Prepend entries from a snapshot; ``totals`` (absent in older snapshots) also covers rotated events."""
+
+        self.events[:0] = entries
+        self.errors[:0] = errors
+        if totals is None:
+            for entry in entries:
+                self._count(entry)
+            self.error_total += len(errors)
+            return
+        self.event_totals.update(totals["events"])
+        self.document_totals.update(totals["documents"])
+        self.error_total += totals["errors"]
+
+    def dump_totals(self) -> Dict[str, object]:
+        return {
+            "events": dict(self.event_totals),
+            "documents": dict(self.document_totals),
+            "errors": self.error_total,
+        }
 
     def summary(self) -> Dict[str, int]:
+        if self.counters:
+            return {
+                "events": self.counters.total("events"),
+                "errors": self.counters.total("errors"),
+            }
         return {
-            "events": len(self.events),
-            "errors": len(self.errors),
+            "events": sum(self.event_totals.values()),
+            "errors": self.error_total,
         }
 
     def top_documents(self, limit: int = 5) -> List[tuple[str, int]]:
-        counter: Counter[str] = Counter(
-            entry.payload.get("document", "unknown") for entry in self.events if entry.event == "document_generated"
-        )
-        return counter.most_common(limit)
+        return self.document_totals.most_common(limit)
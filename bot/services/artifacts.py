@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import SQLITE_SECONDS
+
+_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "artifacts.db"
+
+
+@dataclass
+class Artifact:
+    id: int
+    user_id: int
+    code: str
+    title: str
+    fmt: str
+    digest: str
+    created_at: float
+    file_id: Optional[str] = None
+
+
+def content_digest(fmt: str, template_name: str, context: Dict[str, str], profile: Optional[str] = None) -> str:
+    """Hash of what the document says, not of its bytes.
+
+    PDF and DOCX files embed creation timestamps and random IDs, so two renders of the same
+    answers never match byte for byte; hashing the template and answers lets them share a blob.
+    ``profile`` is the PDF output profile: files rendered under different profiles must not share one.
+    """
+
+    parts: List[Any] = [fmt, template_name, context]
+    if profile is not None:
+        parts.append(profile)
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ArtifactArchive:
+    """Per-user archive of generated files in SQLite, so old documents can be re-downloaded.
+
+    File bodies are zlib-compressed and stored once per content digest; users reference them from
+    ``artifacts`` rows. Each user keeps the newest ``per_user`` entries, trimmed on every store;
+    the oldest entries overall are dropped by :meth:`prune` (a maintenance task) once compressed
+    blobs exceed ``max_bytes``. The Telegram ``file_id`` of the first upload is remembered, so
+    repeat downloads are served without sending the bytes again.
+
+    Several bots can share one archive file: blobs are common, while history rows and ``file_id``
+    values (which Telegram binds to a bot) are kept per ``namespace``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 500 * 1024 * 1024,
+        per_user: int = 20,
+        db_path: Optional[Path] = None,
+        namespace: str = "",
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.per_user = per_user
+        self.namespace = namespace
+        self.db_path = Path(db_path or _DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.deduplicated = 0
+        self.evicted = 0
+        with closing(self._connect()) as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS artifact_blobs (
+                    digest TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    code TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    fmt TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    namespace TEXT NOT NULL DEFAULT ''
+                );
+                CREATE TABLE IF NOT EXISTS artifact_file_ids (
+                    digest TEXT NOT NULL,
+                    namespace TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    PRIMARY KEY (digest, namespace)
+                );
+                CREATE INDEX IF NOT EXISTS idx_artifacts_digest ON artifacts (digest);
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(artifacts)")}
+            if "namespace" not in columns:
+                # Архив одного бота: его записи и file_id переходят в пространство имён по умолчанию.
+                conn.execute("ALTER TABLE artifacts ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+                conn.execute(
+                    """
+                    INSERT OR IGNORE INTO artifact_file_ids (digest, namespace, file_id)
+                    SELECT digest, '', file_id FROM artifact_blobs WHERE file_id IS NOT NULL
+                    """
+                )
+            blob_columns = {row[1] for row in conn.execute("PRAGMA table_info(artifact_blobs)")}
+            if "file_id" in blob_columns and sqlite3.sqlite_version_info >= (3, 35, 0):
+                # file_id переехал в artifact_file_ids; на старом SQLite колонка просто остаётся пустой.
+                conn.execute("ALTER TABLE artifact_blobs DROP COLUMN file_id")
+            conn.execute("DROP INDEX IF EXISTS idx_artifacts_user")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_owner ON artifacts (namespace, user_id, created_at)")
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _store(self, user_id: int, code: str, title: str, fmt: str, digest: str, data: bytes) -> int:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            existing = conn.execute(
+                "SELECT id FROM artifacts WHERE namespace = ? AND user_id = ? AND digest = ?",
+                (self.namespace, user_id, digest),
+            ).fetchone()
+            if existing:
+                # Тот же документ повторно — поднимаем запись наверх истории вместо дубля.
+                conn.execute("UPDATE artifacts SET created_at = ? WHERE id = ?", (now, existing[0]))
+                conn.commit()
+                self.deduplicated += 1
+                return existing[0]
+
+            if conn.execute("SELECT 1 FROM artifact_blobs WHERE digest = ?", (digest,)).fetchone():
+                self.deduplicated += 1
+            else:
+                blob = zlib.compress(data, 6)
+                conn.execute(
+                    "INSERT INTO artifact_blobs (digest, data, size, raw_size, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (digest, blob, len(blob), len(data), now),
+                )
+            cursor = conn.execute(
+                """
+                INSERT INTO artifacts (namespace, user_id, code, title, fmt, digest, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self.namespace, user_id, code, title, fmt, digest, now),
+            )
+            artifact_id = cursor.lastrowid
+            self._enforce_retention(conn, user_id)
+            conn.commit()
+            return artifact_id
+
+    def _enforce_retention(self, conn: sqlite3.Connection, user_id: int) -> None:
+        # Только строки этого пользователя по индексу idx_artifacts_owner; общий лимит байтов — в prune().
+        surplus = conn.execute(
+            """
+            SELECT id, digest FROM artifacts WHERE namespace = ? AND user_id = ?
+            ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            """,
+            (self.namespace, user_id, self.per_user),
+        ).fetchall()
+        if not surplus:
+            return
+        conn.executemany("DELETE FROM artifacts WHERE id = ?", [(artifact_id,) for artifact_id, _ in surplus])
+        self.evicted += len(surplus)
+        self._drop_orphans(conn, {digest for _, digest in surplus})
+
+    @staticmethod
+    def _drop_orphans(conn: sqlite3.Connection, digests: Iterable[str]) -> None:
+        orphans = [
+            (digest,)
+            for digest in digests
+            if conn.execute("SELECT 1 FROM artifacts WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None
+        ]
+        conn.executemany("DELETE FROM artifact_blobs WHERE digest = ?", orphans)
+        conn.executemany("DELETE FROM artifact_file_ids WHERE digest = ?", orphans)
+
+    def _prune(self, deadline: float) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifact_blobs").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                oldest = conn.execute(
+                    """
+                    SELECT a.id, a.digest, b.size FROM artifacts a JOIN artifact_blobs b ON b.digest = a.digest
+                    ORDER BY a.created_at
+                    """
+                ).fetchall()
+                # Блоб освобождается, только когда удалены все ссылающиеся на него записи.
+                references: Dict[str, int] = {}
+                for _, digest, _ in oldest:
+                    references[digest] = references.get(digest, 0) + 1
+                doomed: List[Tuple[int, str]] = []
+                for artifact_id, digest, size in oldest:
+                    if total <= self.max_bytes or time.monotonic() >= deadline:
+                        break
+                    doomed.append((artifact_id, digest))
+                    references[digest] -= 1
+                    if not references[digest]:
+                        total -= size
+                conn.executemany("DELETE FROM artifacts WHERE id = ?", [(artifact_id,) for artifact_id, _ in doomed])
+                self._drop_orphans(conn, {digest for _, digest in doomed})
+                evicted = len(doomed)
+                conn.commit()
+        self.evicted += evicted
+        return {"bytes": total, "evicted": evicted}
+
+    def _recent(self, user_id: int, limit: int) -> List[Artifact]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                SELECT a.id, a.user_id, a.code, a.title, a.fmt, a.digest, a.created_at, f.file_id
+                FROM artifacts a
+                LEFT JOIN artifact_file_ids f ON f.digest = a.digest AND f.namespace = a.namespace
+                WHERE a.namespace = ? AND a.user_id = ?
+                ORDER BY a.created_at DESC
+                LIMIT ?
+                """,
+                (self.namespace, user_id, limit),
+            ).fetchall()
+        return [Artifact(*row) for row in rows]
+
+    def _load(self, user_id: int, artifact_id: int, with_data: bool) -> Optional[Tuple[Artifact, Optional[bytes]]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"""
+                SELECT a.id, a.user_id, a.code, a.title, a.fmt, a.digest, a.created_at, f.file_id,
+                       {'b.data' if with_data else 'NULL'}
+                FROM artifacts a
+                JOIN artifact_blobs b ON b.digest = a.digest
+                LEFT JOIN artifact_file_ids f ON f.digest = a.digest AND f.namespace = a.namespace
+                WHERE a.id = ? AND a.namespace = ? AND a.user_id = ?
+                """,
+                (artifact_id, self.namespace, user_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return Artifact(*row[:8]), zlib.decompress(row[8]) if row[8] is not None else None
+
+    def _find(self, digest: str, with_data: bool) -> Optional[Tuple[Optional[str], Optional[bytes]]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"""
+                SELECT f.file_id, {'b.data' if with_data else 'NULL'}
+                FROM artifact_blobs b
+                LEFT JOIN artifact_file_ids f ON f.digest = b.digest AND f.namespace = ?
+                WHERE b.digest = ?
+                """,
+                (self.namespace, digest),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], zlib.decompress(row[1]) if row[1] is not None else None
+
+    def _set_file_id(self, digest: str, file_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                INSERT INTO artifact_file_ids (digest, namespace, file_id) VALUES (?, ?, ?)
+                ON CONFLICT (digest, namespace) DO UPDATE SET file_id = excluded.file_id
+                """,
+                (digest, self.namespace, file_id),
+            )
+            conn.commit()
+
+    def _stats(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            artifacts = conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+            blobs, size, raw_size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM artifact_blobs"
+            ).fetchone()
+        return {
+            "artifacts": artifacts,
+            "blobs": blobs,
+            "bytes": size,
+            "raw_bytes": raw_size,
+            "deduplicated": self.deduplicated,
+            "evicted": self.evicted,
+        }
+
+    async def store(self, user_id: int, code: str, title: str, fmt: str, digest: str, data: bytes) -> int:
+        with SQLITE_SECONDS.time("artifact_store"):
+            return await asyncio.to_thread(self._store, user_id, code, title, fmt, digest, data)
+
+    async def recent(self, user_id: int, limit: int = 10) -> List[Artifact]:
+        with SQLITE_SECONDS.time("artifact_recent"):
+            return await asyncio.to_thread(self._recent, user_id, limit)
+
+    async def load(self, user_id: int, artifact_id: int, with_data: bool = True) -> Optional[Tuple[Artifact, Optional[bytes]]]:
+        """Artifact of ``user_id`` with its decompressed bytes (``None`` when ``with_data`` is off)."""
+
+        with SQLITE_SECONDS.time("artifact_load"):
+            return await asyncio.to_thread(self._load, user_id, artifact_id, with_data)
+
+    async def find(self, digest: str, with_data: bool = False) -> Optional[Tuple[Optional[str], Optional[bytes]]]:
+        """``(file_id, bytes)`` of a stored blob by content digest, whoever stored it.
+
+        ``file_id`` is this namespace's upload of the blob, ``None`` if this bot never sent it.
+        """
+
+        with SQLITE_SECONDS.time("artifact_find"):
+            return await asyncio.to_thread(self._find, digest, with_data)
+
+    async def remember_file_id(self, digest: str, file_id: str) -> None:
+        await asyncio.to_thread(self._set_file_id, digest, file_id)
+
+    async def prune(self, deadline: float) -> Dict[str, int]:
+        """Drop the oldest entries of all users until blobs fit ``max_bytes`` or ``deadline`` passes."""
+
+        with SQLITE_SECONDS.time("artifact_prune"):
+            return await asyncio.to_thread(self._prune, deadline)
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "shared_counters.db"
+
+
+class SharedCounterStore:
+    """On-host counters shared by all worker processes (SQLite in WAL mode)."""
+
+    def __init__(self, db_path: Optional[Path] = None) -> None:
+        self.db_path = self.resolve_path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS counters (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+
+    @staticmethod
+    def resolve_path(db_path: Optional[Path] = None) -> Path:
+        return Path(db_path or _DB_PATH)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def incr(self, namespace: str, key: str, delta: int = 1) -> None:
+        self._connection().execute(
+            """
+            INSERT INTO counters (namespace, key, value) VALUES (?, ?, ?)
+            ON CONFLICT (namespace, key) DO UPDATE SET value = value + excluded.value
+            """,
+            (namespace, key, delta),
+        )
+
+    def get(self, namespace: str, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def total(self, namespace: str) -> int:
+        row = self._connection().execute(
+            "SELECT COALESCE(SUM(value), 0) FROM counters WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0]
+
+    def count(self, namespace: str) -> int:
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM counters WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0]
+
+    def top(self, namespace: str, limit: int = 5) -> List[tuple[str, int]]:
+        cursor = self._connection().execute(
+            "SELECT key, value FROM counters WHERE namespace = ? ORDER BY value DESC LIMIT ?",
+            (namespace, limit),
+        )
+        return [(key, value) for key, value in cursor.fetchall()]
+
+    def items(self, namespace: str, prefix: str = "") -> Dict[str, int]:
+        # Диапазон по первичному ключу вместо LIKE: коды документов могут содержать «_».
+        cursor = self._connection().execute(
+            "SELECT key, value FROM counters WHERE namespace = ? AND key >= ? AND key < ?",
+            (namespace, prefix, prefix + "\U0010ffff"),
+        )
+        return dict(cursor.fetchall())
@@ -1,35 +1,112 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import json
+import sqlite3
 import time
-import uuid
-from typing import Any, Dict, Optional
-
-_CONTEXT_TTL = 15 * 60  # 15 minutes
-_document_contexts: Dict[str, Dict[str, Any]] = {}
-
-
-def _cleanup() -> None:
-    now = time.time()
-    expired = [doc_id for doc_id, payload in _document_contexts.items() if now - payload.get("created_at", 0) > _CONTEXT_TTL]
-    for doc_id in expired:
-        _document_contexts.pop(doc_id, None)
-
-
-def store_document_context(payload: Dict[str, Any]) -> str:
-    _cleanup()
-    doc_id = uuid.uuid4().hex
-    payload = dict(payload)
-    payload["created_at"] = time.time()
-    _document_contexts[doc_id] = payload
-    return doc_id
-
-
-def get_document_context(doc_id: str) -> Optional[Dict[str, Any]]:
-    _cleanup()
-    context = _document_contexts.get(doc_id)
-    if not context:
-        return None
-    if time.time() - context.get("created_at", 0) > _CONTEXT_TTL:
-        _document_contexts.pop(doc_id, None)
-        return None
-    return context
+import zlib
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Optional
+
+from .artifacts import content_digest
+from .last_documents import GeneratedDocument
+from .metrics import SQLITE_SECONDS
+
+_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "document_contexts.db"
+_CONTEXT_TTL = 30 * 24 * 60 * 60
+
+
+def context_key(template_name: str, context: Dict[str, str]) -> bytes:
+    """16-byte content address of a document's answers; equal answers share one row."""
+
+    return bytes.fromhex(content_digest("context", template_name, context)[:32])
+
+
+class DocumentContextStore:
+    """Compressed document contexts in a SQLite file shared by every worker process.
+
+    Rows are addressed by :func:`context_key`, so a download token issued by one worker can be
+    served by any other, and after a restart, without per-process state.
+    """
+
+    def __init__(self, ttl: float = _CONTEXT_TTL, db_path: Optional[Path] = None) -> None:
+        self.ttl = ttl
+        self.db_path = Path(db_path or _DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS document_contexts (
+                    key BLOB PRIMARY KEY,
+                    code TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    template_name TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    stored_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _expire_batch(self, limit: int) -> int:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "DELETE FROM document_contexts WHERE key IN "
+                "(SELECT key FROM document_contexts WHERE stored_at < ? LIMIT ?)",
+                (time.time() - self.ttl, limit),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def _put(self, key: bytes, document: GeneratedDocument) -> None:
+        now = time.time()
+        payload = zlib.compress(json.dumps(document.context, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                INSERT INTO document_contexts (key, code, title, template_name, payload, stored_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET stored_at = excluded.stored_at
+                """,
+                (key, document.code, document.title, document.template_name, payload, now),
+            )
+            conn.commit()
+
+    def _get(self, key: bytes) -> Optional[GeneratedDocument]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT code, title, template_name, payload FROM document_contexts WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return GeneratedDocument(
+            code=row[0], title=row[1], template_name=row[2], context=json.loads(zlib.decompress(row[3]).decode("utf-8"))
+        )
+
+    async def put(self, document: GeneratedDocument) -> bytes:
+        key = context_key(document.template_name, document.context)
+        with SQLITE_SECONDS.time("context_put"):
+            await asyncio.to_thread(self._put, key, document)
+        return key
+
+    async def get(self, key: bytes) -> Optional[GeneratedDocument]:
+        with SQLITE_SECONDS.time("context_get"):
+            return await asyncio.to_thread(self._get, key)
+
+    async def expire(self, deadline: Optional[float] = None, batch_size: int = 1000) -> int:
+        """Delete contexts older than ``ttl`` in batches until ``deadline`` (monotonic) passes."""
+
+        removed = 0
+        while deadline is None or time.monotonic() < deadline:
+            with SQLITE_SECONDS.time("context_expire"):
+                count = await asyncio.to_thread(self._expire_batch, batch_size)
+            removed += count
+            if count < batch_size:
+                break
+        return removed
@@ -5,6 +5,7 @@ from io import BytesIO
 from typing import Dict
 
 from docx import Document
+from docx.document import Document as DocumentObject
 from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.shared import Cm, Pt
@@ -18,6 +19,10 @@ class DocxBuilder:
         self.template_loader = template_loader
 
     def build(self, template_name: str, context: Dict[str, str]) -> BytesIO:
+        rendered = self.template_loader.render(template_name, context)
+        return self.save(self.build_document(rendered))
+
+    def build_document(self, rendered: str) -> DocumentObject:
         document = Document()
 
         section = document.sections[0]
@@ -68,8 +73,6 @@ class DocxBuilder:
         footer_style.paragraph_format.line_spacing = 1.15
         footer_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
 
-        rendered = self.template_loader.render(template_name, context)
-
         lines = [line.rstrip() for line in rendered.split("\n")]
 
         first_content_added = False
@@ -97,8 +100,11 @@ class DocxBuilder:
             "Подпись стороны: _____________________", style=footer_style
         )
         document.add_paragraph()
-        disclaimer = document.add_paragraph(DISCLAIMER_TEXT, style=disclaimer_style)
+        document.add_paragraph(DISCLAIMER_TEXT, style=disclaimer_style)
+        return document
 
+    @staticmethod
+    def save(document: DocumentObject) -> BytesIO:
         buffer = BytesIO()
         document.save(buffer)
         buffer.seek(0)
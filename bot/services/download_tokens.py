@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+import time
+from typing import Optional, Tuple
+
+FORMATS = ("pdf", "docx")
+CALLBACK_PREFIX = "dl:"
+
+# Формат (1 байт), user_id (8), срок действия в секундах эпохи (4), адрес контекста (16).
+_PAYLOAD = struct.Struct(">BqI16s")
+_MAC_SIZE = 10
+
+
+def derive_secret(bot_token: str) -> bytes:
+    # Все воркеры одного бота получают один ключ без отдельной настройки.
+    return hashlib.sha256(b"download-tokens:" + bot_token.encode("utf-8")).digest()
+
+
+class DownloadTokens:
+    """HMAC-signed references to a stored document context, sized for ``callback_data``.
+
+    A token names the format, the user it was issued to, an expiry and the 16-byte context key:
+    39 bytes, 52 characters in base64url, 55 with the ``dl:`` prefix (Telegram allows 64). Any
+    process holding the secret can verify it, so re-downloads need no sticky per-worker state.
+    """
+
+    def __init__(self, secret: bytes, ttl: float = 30 * 24 * 60 * 60) -> None:
+        self.secret = secret
+        self.ttl = ttl
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()[:_MAC_SIZE]
+
+    def issue(self, user_id: int, fmt: str, key: bytes) -> str:
+        payload = _PAYLOAD.pack(FORMATS.index(fmt), user_id, int(time.time() + self.ttl), key)
+        token = base64.urlsafe_b64encode(payload + self._mac(payload)).rstrip(b"=").decode("ascii")
+        return CALLBACK_PREFIX + token
+
+    def verify(self, data: str, user_id: int) -> Optional[Tuple[str, bytes]]:
+        """``(format, context key)`` for a valid, unexpired token of ``user_id``; ``None`` otherwise."""
+
+        token = data[len(CALLBACK_PREFIX) :] if data.startswith(CALLBACK_PREFIX) else data
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (binascii.Error, ValueError):
+            return None
+        if len(raw) != _PAYLOAD.size + _MAC_SIZE:
+            return None
+        payload, mac = raw[: _PAYLOAD.size], raw[_PAYLOAD.size :]
+        if not hmac.compare_digest(mac, self._mac(payload)):
+            return None
+        fmt_index, owner, expires, key = _PAYLOAD.unpack(payload)
+        if owner != user_id or expires < time.time() or fmt_index >= len(FORMATS):
+            return None
+        return FORMATS[fmt_index], key
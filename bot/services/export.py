@@ -0,0 +1,243 @@
+"""Streaming export of analytics events, usage rows, funnel counters and profile stats as gzip CSV/NDJSON.
+
+CLI for what lives on disk, so it can be exported without the bot running::
+
+    python -m bot.services.export usage --format ndjson --since 2025-01-01 -o usage.ndjson.gz
+    python -m bot.services.export events --source bot/data/tenants/acme/analytics -o events.csv.gz
+    python -m bot.services.export funnel -o funnel.csv.gz
+
+``events`` reads only the rotated ``events-*.ndjson.gz`` files (events still in a running bot's memory
+are exported with ``/admin export events``); ``funnel`` reads the shared counter store, which exists
+only when the bot runs with shared counters.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .analytics import AnalyticsService
+from .counters import SharedCounterStore
+from .funnel import STAGES, FunnelAggregator
+from .limits import iter_usage_rows
+from .maintenance import ANALYTICS_LOG_DIR
+from .storage import StorageService
+
+FORMATS = ("csv", "ndjson")
+KINDS = ("events", "usage", "funnel", "profiles")
+CHUNK_SIZE = 5000
+
+FIELDS: Dict[str, Sequence[str]] = {
+    "events": ("created_at", "event", "user_id", "payload"),
+    "usage": ("id", "user_id", "created_at"),
+    "funnel": ("document", "step", *STAGES, "completed"),
+    "profiles": ("user_id", "is_pro", "documents_generated", "last_generation_date", "history_size"),
+}
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _event_row(created_at: datetime, event: str, user_id: int, payload: Any) -> Dict[str, Any]:
+    return {
+        "created_at": created_at.isoformat(),
+        "event": event,
+        "user_id": user_id,
+        "payload": json.dumps(payload, ensure_ascii=False),
+    }
+
+
+def event_files(directory: Optional[Path]) -> List[Path]:
+    """Rotated event files, oldest first (names start with the rotation time)."""
+
+    if directory is None or not directory.is_dir():
+        return []
+    return sorted(directory.glob("events-*.ndjson.gz"))
+
+
+def iter_events(
+    events: Sequence[Any],
+    files: Sequence[Path] = (),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Rotated ``files`` first, then the in-memory ``events``.
+
+    Take both on the event loop: rotation replaces the list instead of trimming it, and renames a
+    file only together with that replacement, so the pair never overlaps or misses events.
+    """
+
+    since_naive = since.astimezone(timezone.utc).replace(tzinfo=None) if since else None
+    until_naive = until.astimezone(timezone.utc).replace(tzinfo=None) if until else None
+
+    def wanted(created_at: datetime) -> bool:
+        return not (since_naive and created_at < since_naive) and not (until_naive and created_at >= until_naive)
+
+    for path in files:
+        try:
+            handle = gzip.open(path, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            # Файл удалён по лимиту хранения уже после того, как попал в список.
+            continue
+        with handle:
+            for line in handle:
+                record = json.loads(line)
+                created_at = datetime.fromisoformat(record["created_at"])
+                if wanted(created_at):
+                    yield _event_row(created_at, record["event"], record["user_id"], record["payload"])
+    for entry in events:
+        if wanted(entry.created_at):
+            yield _event_row(entry.created_at, entry.event, entry.user_id, entry.payload)
+
+
+def iter_usage(
+    since: Optional[datetime] = None, until: Optional[datetime] = None, db_path: Optional[Path] = None
+) -> Iterator[Dict[str, Any]]:
+    for row_id, user_id, created_at in iter_usage_rows(
+        since.isoformat() if since else None,
+        until.isoformat() if until else None,
+        chunk_size=CHUNK_SIZE,
+        db_path=db_path,
+    ):
+        yield {"id": row_id, "user_id": user_id, "created_at": created_at}
+
+
+def iter_funnel(funnel: FunnelAggregator) -> Iterator[Dict[str, Any]]:
+    """One row per question step of each document; the last step is the confirmation/result."""
+
+    for code, _ in funnel.documents():
+        completed = funnel.completed_count(code)
+        for step, row in enumerate(funnel.report(code), start=1):
+            yield {"document": code, "step": step, **row, "completed": completed}
+
+
+def iter_profiles(profiles: List[Any]) -> Iterator[Dict[str, Any]]:
+    for profile in profiles:
+        yield {
+            "user_id": profile.user_id,
+            "is_pro": int(profile.is_pro),
+            "documents_generated": profile.documents_generated,
+            "last_generation_date": profile.last_generation_date.isoformat() if profile.last_generation_date else "",
+            "history_size": len(profile.history or ()),
+        }
+
+
+def write_export(rows: Iterable[Dict[str, Any]], fields: Sequence[str], fmt: str, path: str) -> int:
+    """Write rows to a gzip file one chunk at a time; returns the number of rows written."""
+
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as handle:
+        if fmt == "csv":
+            writer = csv.DictWriter(handle, fieldnames=fields)
+            writer.writeheader()
+            chunk: List[Dict[str, Any]] = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= CHUNK_SIZE:
+                    writer.writerows(chunk)
+                    count += len(chunk)
+                    chunk.clear()
+            writer.writerows(chunk)
+            count += len(chunk)
+        else:
+            lines: List[str] = []
+            for row in rows:
+                lines.append(json.dumps(row, ensure_ascii=False))
+                if len(lines) >= CHUNK_SIZE:
+                    handle.write("\n".join(lines) + "\n")
+                    count += len(lines)
+                    lines.clear()
+            if lines:
+                handle.write("\n".join(lines) + "\n")
+                count += len(lines)
+    return count
+
+
+def _source(
+    kind: str,
+    analytics: Optional[AnalyticsService],
+    storage: Optional[StorageService],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Callable[[], Iterable[Dict[str, Any]]]:
+    if kind == "events":
+        events, files = analytics.events, event_files(analytics.archive_dir)
+        return lambda: iter_events(events, files, since, until)
+    if kind == "usage":
+        return lambda: iter_usage(since, until, storage.usage_db_path if storage else None)
+    if kind == "funnel":
+        if analytics.funnel.shared:
+            return lambda: iter_funnel(analytics.funnel)
+        # Локальные массивы меняются хендлерами, поэтому строки собираются в цикле событий.
+        funnel_rows = list(iter_funnel(analytics.funnel))
+        return lambda: funnel_rows
+    # Снимок ссылок делается в цикле событий: словарь профилей меняется хендлерами.
+    profiles = list(storage.user_profiles.values())
+    return lambda: iter_profiles(profiles)
+
+
+async def export_to_file(
+    kind: str,
+    fmt: str,
+    analytics: Optional[AnalyticsService] = None,
+    storage: Optional[StorageService] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> tuple[str, int]:
+    """Export in a worker thread so the event loop stays responsive; caller removes the file."""
+
+    if kind not in KINDS or fmt not in FORMATS:
+        raise ValueError(f"unsupported export {kind}/{fmt}")
+    rows = _source(kind, analytics, storage, since, until)
+    handle, path = tempfile.mkstemp(prefix=f"export_{kind}_", suffix=f".{fmt}.gz")
+    os.close(handle)
+    try:
+        count = await asyncio.to_thread(lambda: write_export(rows(), FIELDS[kind], fmt, path))
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Экспорт статистики без запущенного бота")
+    parser.add_argument("kind", choices=("events", "usage", "funnel"))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--since", help="ISO-дата начала (включительно; кроме funnel)")
+    parser.add_argument("--until", help="ISO-дата конца (не включительно; кроме funnel)")
+    parser.add_argument(
+        "--source",
+        type=Path,
+        help="каталог ротированных событий (events) или файл SQLite (usage, funnel); по умолчанию из bot/data",
+    )
+    parser.add_argument("-o", "--output", required=True, help="путь к .gz файлу")
+    args = parser.parse_args()
+    since, until = parse_date(args.since), parse_date(args.until)
+    if args.kind == "events":
+        files = event_files(args.source or ANALYTICS_LOG_DIR)
+        if not files:
+            parser.error("нет файлов events-*.ndjson.gz: события ещё не ротировались, выгрузите их через /admin")
+        rows: Iterable[Dict[str, Any]] = iter_events((), files, since, until)
+    elif args.kind == "funnel":
+        db_path = SharedCounterStore.resolve_path(args.source)
+        if not db_path.exists():
+            parser.error(f"{db_path} не найден: воронка хранится на диске только с общими счётчиками")
+        rows = iter_funnel(FunnelAggregator(SharedCounterStore(db_path)))
+    else:
+        rows = iter_usage(since, until, args.source)
+    count = write_export(rows, FIELDS[args.kind], args.format, args.output)
+    print(f"Экспортировано строк: {count} → {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+
+from .metrics import SQLITE_SECONDS
+
+_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "feedback_queue.db"
+_MESSAGE_LIMIT = 4000
+_MAX_BACKOFF = 10 * 60
+_LEASE_SECONDS = 60
+
+
+@dataclass
+class PendingDelivery:
+    feedback_id: int
+    admin_id: int
+    attempts: int
+    user_id: int
+    username: str
+    operation: str
+    text: str
+    created_at: float
+
+
+def format_feedback(item: PendingDelivery) -> str:
+    return (
+        "📝 Новый отзыв от пользователя\n"
+        f"ID: <code>{item.user_id}</code>\n"
+        f"Username: @{html.escape(item.username)}\n"
+        f"Операция: {html.escape(item.operation)}\n\n"
+        f"Текст:\n{html.escape(item.text)}"
+    )
+
+
+def format_digest(items: List[PendingDelivery]) -> List[Tuple[str, List[PendingDelivery]]]:
+    """Split a digest into messages under the Telegram limit, each with the items it carries."""
+
+    header = f"📬 Дайджест отзывов ({len(items)})"
+    messages: List[Tuple[str, List[PendingDelivery]]] = []
+    current, carried = header, []
+    for item in items:
+        block = (
+            f"\n\n<code>{item.user_id}</code> @{html.escape(item.username)} · {html.escape(item.operation)}\n"
+            f"{html.escape(item.text)}"
+        )
+        if carried and len(current) + len(block) > _MESSAGE_LIMIT:
+            messages.append((current, carried))
+            current, carried = header + " — продолжение", []
+        current += block[: _MESSAGE_LIMIT - len(current)]
+        carried.append(item)
+    messages.append((current, carried))
+    return messages
+
+
+class FeedbackQueue:
+    """Durable feedback inbox (SQLite) with per-admin delivery tracking.
+
+    Users are acknowledged as soon as the review is written; ``run`` delivers it in the background
+    with bounded concurrency, a send-rate limit, retries with backoff and optional digests.
+    """
+
+    def __init__(
+        self,
+        admin_ids: Iterable[int],
+        digest_interval: float = 0,
+        send_rate: float = 20.0,
+        concurrency: int = 5,
+        max_attempts: int = 5,
+        poll_interval: float = 2.0,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        self.admin_ids = list(admin_ids)
+        self.digest_interval = digest_interval
+        self.send_interval = 1 / send_rate if send_rate > 0 else 0.0
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.db_path = Path(db_path or _DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.sent = 0
+        self._send_lock = asyncio.Lock()
+        self._next_send_at = 0.0
+        self._wakeup = asyncio.Event()
+        with closing(self._connect()) as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS feedback (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    username TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS feedback_deliveries (
+                    feedback_id INTEGER NOT NULL,
+                    admin_id INTEGER NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    delivered_at REAL,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    PRIMARY KEY (feedback_id, admin_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_feedback_deliveries_due
+                ON feedback_deliveries (delivered_at, failed, next_attempt_at);
+                CREATE TABLE IF NOT EXISTS feedback_waiting (
+                    user_id INTEGER PRIMARY KEY,
+                    since REAL NOT NULL
+                );
+                """
+            )
+            self.waiting: Set[int] = {row[0] for row in conn.execute("SELECT user_id FROM feedback_waiting")}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(sql, params)
+            conn.commit()
+
+    def is_waiting(self, user_id: int) -> bool:
+        return user_id in self.waiting
+
+    async def set_waiting(self, user_id: int) -> None:
+        self.waiting.add(user_id)
+        await asyncio.to_thread(
+            self._execute, "INSERT OR REPLACE INTO feedback_waiting (user_id, since) VALUES (?, ?)", (user_id, time.time())
+        )
+
+    async def clear_waiting(self, user_id: int) -> None:
+        self.waiting.discard(user_id)
+        await asyncio.to_thread(self._execute, "DELETE FROM feedback_waiting WHERE user_id = ?", (user_id,))
+
+    def _insert(self, user_id: int, username: str, operation: str, text: str) -> int:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO feedback (user_id, username, operation, text, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, username, operation, text, now),
+            )
+            feedback_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO feedback_deliveries (feedback_id, admin_id, next_attempt_at) VALUES (?, ?, ?)",
+                [(feedback_id, admin_id, now) for admin_id in self.admin_ids],
+            )
+            conn.execute("DELETE FROM feedback_waiting WHERE user_id = ?", (user_id,))
+            conn.commit()
+            return feedback_id
+
+    async def enqueue(self, user_id: int, username: str, operation: str, text: str) -> int:
+        self.waiting.discard(user_id)
+        if not self.admin_ids:
+            logging.warning("Получен отзыв, но список ADMIN_IDS пуст")
+        with SQLITE_SECONDS.time("feedback_insert"):
+            feedback_id = await asyncio.to_thread(self._insert, user_id, username, operation, text)
+        self._wakeup.set()
+        return feedback_id
+
+    def _oldest_due(self) -> Optional[float]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                """
+                SELECT MIN(f.created_at)
+                FROM feedback_deliveries d JOIN feedback f ON f.id = d.feedback_id
+                WHERE d.delivered_at IS NULL AND d.failed = 0 AND d.next_attempt_at <= ?
+                """,
+                (time.time(),),
+            ).fetchone()
+        return row[0]
+
+    def _claim_due(self, limit: int = 200) -> List[PendingDelivery]:
+        """Select due deliveries and lease them, so parallel worker processes don't send twice."""
+
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """
+                SELECT d.feedback_id, d.admin_id, d.attempts, f.user_id, f.username, f.operation, f.text, f.created_at
+                FROM feedback_deliveries d JOIN feedback f ON f.id = d.feedback_id
+                WHERE d.delivered_at IS NULL AND d.failed = 0 AND d.next_attempt_at <= ?
+                ORDER BY d.feedback_id
+                LIMIT ?
+                """,
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE feedback_deliveries SET next_attempt_at = ? WHERE feedback_id = ? AND admin_id = ?",
+                [(now + _LEASE_SECONDS, row[0], row[1]) for row in rows],
+            )
+            conn.commit()
+        return [PendingDelivery(*row) for row in rows]
+
+    def _mark(self, delivered: List[PendingDelivery], failed: List[tuple[PendingDelivery, str]]) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "UPDATE feedback_deliveries SET delivered_at = ?, attempts = attempts + 1 WHERE feedback_id = ? AND admin_id = ?",
+                [(now, item.feedback_id, item.admin_id) for item in delivered],
+            )
+            conn.executemany(
+                """
+                UPDATE feedback_deliveries
+                SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?, failed = ?
+                WHERE feedback_id = ? AND admin_id = ?
+                """,
+                [
+                    (
+                        error,
+                        now + min(_MAX_BACKOFF, 5 * 2**item.attempts),
+                        int(item.attempts + 1 >= self.max_attempts),
+                        item.feedback_id,
+                        item.admin_id,
+                    )
+                    for item, error in failed
+                ],
+            )
+            conn.commit()
+
+    async def _send(self, bot: Bot, admin_id: int, text: str) -> None:
+        async with self._send_lock:
+            delay = self._next_send_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_send_at = time.monotonic() + self.send_interval
+        await bot.send_message(admin_id, text)
+        self.sent += 1
+
+    async def _deliver_to_admin(
+        self, bot: Bot, admin_id: int, items: List[PendingDelivery], semaphore: asyncio.Semaphore
+    ) -> tuple[List[PendingDelivery], List[tuple[PendingDelivery, str]]]:
+        async with semaphore:
+            delivered: List[PendingDelivery] = []
+            failed: List[tuple[PendingDelivery, str]] = []
+            if self.digest_interval > 0 and len(items) > 1:
+                # Отзывы отмечаются доставленными по отправленным сообщениям дайджеста: повтор не дублирует их.
+                parts = format_digest(items)
+                for index, (text, carried) in enumerate(parts):
+                    try:
+                        await self._send(bot, admin_id, text)
+                    except Exception as error:
+                        logging.warning("Не удалось отправить дайджест отзывов администратору %s: %s", admin_id, error)
+                        failed.extend((item, str(error)) for _, rest in parts[index:] for item in rest)
+                        break
+                    delivered.extend(carried)
+                return delivered, failed
+
+            for item in items:
+                try:
+                    await self._send(bot, admin_id, format_feedback(item))
+                except Exception as error:
+                    logging.warning("Не удалось отправить отзыв администратору %s: %s", admin_id, error)
+                    failed.append((item, str(error)))
+                else:
+                    delivered.append(item)
+            return delivered, failed
+
+    async def deliver_due(self, bot: Bot) -> int:
+        if self.digest_interval > 0:
+            oldest = await asyncio.to_thread(self._oldest_due)
+            if oldest is None or time.time() - oldest < self.digest_interval:
+                return 0
+        with SQLITE_SECONDS.time("feedback_claim"):
+            due = await asyncio.to_thread(self._claim_due)
+        if not due:
+            return 0
+
+        by_admin: Dict[int, List[PendingDelivery]] = {}
+        for item in due:
+            by_admin.setdefault(item.admin_id, []).append(item)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._deliver_to_admin(bot, admin_id, items, semaphore) for admin_id, items in by_admin.items())
+        )
+        delivered = [item for ok, _ in results for item in ok]
+        failed = [entry for _, errors in results for entry in errors]
+        await asyncio.to_thread(self._mark, delivered, failed)
+        return len(delivered)
+
+    async def run(self, bot: Bot) -> None:
+        while True:
+            try:
+                await self.deliver_due(bot)
+            except Exception:  # pragma: no cover - воркер не должен останавливаться
+                logging.exception("Ошибка доставки отзывов")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _stats(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                """
+                SELECT
+                    COALESCE(SUM(delivered_at IS NULL AND failed = 0), 0),
+                    COALESCE(SUM(delivered_at IS NOT NULL), 0),
+                    COALESCE(SUM(failed), 0),
+                    COALESCE(SUM(CASE WHEN attempts > 1 THEN attempts - 1 ELSE 0 END), 0)
+                FROM feedback_deliveries
+                """
+            ).fetchone()
+        return {"pending": row[0], "delivered": row[1], "failed": row[2], "retries": row[3]}
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from .counters import SharedCounterStore
+
+STAGES = ("reached", "answered", "invalid", "back", "abandoned")
+_STAGE_INDEX = {stage: position for position, stage in enumerate(STAGES)}
+
+
+class FunnelAggregator:
+    """Per-document, per-question step counters maintained at ingest time.
+
+    Each document owns one flat ``array`` of ``questions × stages`` counters plus a row for the
+    confirmation/result step, so a report costs O(questions) regardless of event volume.
+
+    With ``shared`` every step is also added to the ``funnel`` namespace of the on-host counter
+    store (keys ``code:index:stage`` and ``code:completed``), and reports read from there, so all
+    worker processes contribute to one funnel.
+    """
+
+    def __init__(self, shared: Optional[SharedCounterStore] = None) -> None:
+        self.shared = shared
+        self._counters: Dict[str, array] = {}
+        self._sizes: Dict[str, int] = {}
+        self.completed: Dict[str, int] = {}
+
+    def _row(self, code: str, total: int) -> array:
+        counters = self._counters.get(code)
+        if counters is None or self._sizes[code] != total:
+            counters = array("Q", bytes(8 * (total + 1) * len(STAGES)))
+            self._counters[code] = counters
+            self._sizes[code] = total
+            self.completed.setdefault(code, 0)
+        return counters
+
+    def record(self, code: str, index: int, total: int, stage: str) -> None:
+        counters = self._row(code, total)
+        index = min(max(index, 0), total)
+        counters[index * len(STAGES) + _STAGE_INDEX[stage]] += 1
+        if self.shared:
+            self.shared.incr("funnel", f"{code}:{index}:{stage}")
+
+    def complete(self, code: str, total: int) -> None:
+        self._row(code, total)
+        self.completed[code] += 1
+        if self.shared:
+            self.shared.incr("funnel", f"{code}:completed")
+
+    def completed_count(self, code: str) -> int:
+        if self.shared:
+            return self.shared.get("funnel", f"{code}:completed")
+        return self.completed.get(code, 0)
+
+    def report(self, code: str, total: Optional[int] = None) -> List[Dict[str, int]]:
+        """One row per question plus the result row; ``total`` fixes the row count for shared counters."""
+
+        if self.shared:
+            return self._shared_report(code, total)
+        counters = self._counters.get(code)
+        if counters is None:
+            return []
+        width = len(STAGES)
+        return [
+            {stage: counters[index * width + position] for position, stage in enumerate(STAGES)}
+            for index in range(self._sizes[code] + 1)
+        ]
+
+    def _shared_report(self, code: str, total: Optional[int]) -> List[Dict[str, int]]:
+        values = self.shared.items("funnel", f"{code}:")
+        cells: Dict[Tuple[int, str], int] = {}
+        for key, value in values.items():
+            index, _, stage = key[len(code) + 1 :].partition(":")
+            if stage in _STAGE_INDEX:
+                cells[int(index), stage] = value
+        if not cells:
+            return []
+        size = total if total is not None else max(index for index, _ in cells)
+        return [{stage: cells.get((index, stage), 0) for stage in STAGES} for index in range(size + 1)]
+
+    def dump(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            code: {"size": self._sizes[code], "counters": counters.tolist(), "completed": self.completed.get(code, 0)}
+            for code, counters in self._counters.items()
+        }
+
+    def restore(self, state: Dict[str, Dict[str, Any]]) -> None:
+        for code, item in state.items():
+            self._counters[code] = array("Q", item["counters"])
+            self._sizes[code] = item["size"]
+            self.completed[code] = item["completed"]
+
+    def documents(self) -> List[Tuple[str, int]]:
+        if self.shared:
+            started = [
+                (key[: -len(":0:reached")], value)
+                for key, value in self.shared.items("funnel").items()
+                if key.endswith(":0:reached")
+            ]
+            return sorted(started, key=lambda item: item[1], reverse=True)
+        return sorted(
+            ((code, counters[_STAGE_INDEX["reached"]]) for code, counters in self._counters.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import ssl
+import time
+from collections import Counter
+from typing import Any, Dict, Mapping, Optional
+
+import certifi
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import RestartingTelegram, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.types import InputFile
+
+from .metrics import metrics
+from .scheduler import LatencyTracker
+
+TELEGRAM_SECONDS = metrics.histogram(
+    "bot_telegram_request_seconds", "Bot API request latency, including retries", ("method", "pool")
+)
+
+DEFAULT_METHOD_TIMEOUTS: Dict[str, float] = {
+    "GetChatMember": 5.0,
+    "AnswerCallbackQuery": 5.0,
+}
+_MAX_RETRY_AFTER = 30
+
+
+def is_upload(method: TelegramMethod) -> bool:
+    """True when the request carries file bytes (``file_id`` resends are small calls)."""
+
+    return any(isinstance(getattr(method, name, None), InputFile) for name in type(method).model_fields)
+
+
+def is_idempotent(method: TelegramMethod) -> bool:
+    # Get*-методы ничего не меняют; getUpdates повторяет сам цикл polling aiogram.
+    return type(method).__name__.startswith("Get") and not isinstance(method, GetUpdates)
+
+
+class PooledSession(AiohttpSession):
+    """``AiohttpSession`` with its own connection pool size and keep-alive.
+
+    aiogram's session takes no connector settings, so the pooled ``ClientSession`` is created here
+    (with the same TLS context and User-Agent as aiogram's) instead of patching its internals.
+    """
+
+    def __init__(self, pool_size: int = 100, keepalive: float = 15.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self._pooled: Optional[ClientSession] = None
+
+    async def create_session(self) -> ClientSession:
+        if self._pooled is None or self._pooled.closed:
+            connector = TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=self.keepalive,
+                ssl=ssl.create_default_context(cafile=certifi.where()),
+            )
+            self._pooled = ClientSession(
+                connector=connector, headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"}
+            )
+        return self._pooled
+
+    async def close(self) -> None:
+        if self._pooled is not None and not self._pooled.closed:
+            await self._pooled.close()
+            # Как в aiogram: даём SSL-соединениям закрыться.
+            await asyncio.sleep(0.25)
+        await super().close()
+
+
+class TelegramSession(PooledSession):
+    """Bot API session with separate connection pools for uploads and small calls.
+
+    Uploads (documents sent as bytes) get their own small pool and long timeout, so a slow PDF
+    upload never holds the connections that replies and ``get_chat_member`` need. Flood-control
+    answers (429) are retried for any method because Telegram did not execute the request; network
+    and 5xx errors are retried with exponential backoff only for idempotent ``Get*`` calls.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 50,
+        upload_pool_size: int = 4,
+        keepalive: float = 30.0,
+        timeout: float = 15.0,
+        upload_timeout: float = 120.0,
+        method_timeouts: Optional[Mapping[str, float]] = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ) -> None:
+        super().__init__(pool_size=pool_size, keepalive=keepalive, timeout=timeout)
+        self.uploads = PooledSession(
+            pool_size=upload_pool_size, keepalive=keepalive, api=self.api, timeout=upload_timeout
+        )
+        self.upload_timeout = upload_timeout
+        self.method_timeouts = dict(DEFAULT_METHOD_TIMEOUTS if method_timeouts is None else method_timeouts)
+        self.retries = retries
+        self.backoff = backoff
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.requests: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.retried = 0
+
+    def _observe(self, name: str, pool: str, seconds: float) -> None:
+        tracker = self.latency.get(name)
+        if tracker is None:
+            tracker = self.latency[name] = LatencyTracker()
+        tracker.observe(seconds)
+        TELEGRAM_SECONDS.observe(seconds, name, pool)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        upload = is_upload(method)
+        pool = "upload" if upload else "api"
+        if timeout is None:
+            timeout = self.method_timeouts.get(name, self.upload_timeout if upload else self.timeout)
+            if isinstance(method, GetUpdates) and method.timeout:
+                # Long polling держит соединение до method.timeout секунд — это не зависание.
+                timeout = method.timeout + timeout
+        self.requests[name] += 1
+        started = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    if upload:
+                        return await self.uploads.make_request(bot, method, timeout)
+                    return await super().make_request(bot, method, timeout)
+                except TelegramRetryAfter as error:
+                    if error.retry_after > _MAX_RETRY_AFTER:
+                        raise
+                    failure: Exception = error
+                    delay: float = error.retry_after
+                except (TelegramNetworkError, TelegramServerError, RestartingTelegram) as error:
+                    if not is_idempotent(method):
+                        raise
+                    failure = error
+                    delay = self.backoff * 2**attempt
+                attempt += 1
+                if attempt > self.retries:
+                    raise failure
+                self.retried += 1
+                logging.info("Повтор %s через %.1f с (попытка %s)", name, delay, attempt + 1)
+                await asyncio.sleep(delay)
+        except Exception as error:
+            self.errors[f"{name}:{type(error).__name__}"] += 1
+            raise
+        finally:
+            self._observe(name, pool, time.monotonic() - started)
+
+    async def close(self) -> None:
+        await self.uploads.close()
+        await super().close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": sum(self.requests.values()),
+            "errors": sum(self.errors.values()),
+            "retries": self.retried,
+            "p95": {name: round(tracker.percentile(95), 3) for name, tracker in self.latency.items()},
+        }
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import SQLITE_SECONDS
+
+_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "last_documents.db"
+
+
+@dataclass
+class GeneratedDocument:
+    code: str
+    title: str
+    template_name: str
+    context: Dict[str, str]
+    # Сколько раз документ перевыпущен с правкой одного поля.
+    edits: int = 0
+
+
+class _Entry:
+    __slots__ = ("code", "title", "template_name", "payload", "used_at", "edits")
+
+    def __init__(
+        self, code: str, title: str, template_name: str, payload: Any, used_at: float, edits: int = 0
+    ) -> None:
+        self.code = code
+        self.title = title
+        self.template_name = template_name
+        self.payload = payload
+        self.used_at = used_at
+        self.edits = edits
+
+
+def _encode(context: Dict[str, str]) -> bytes:
+    return zlib.compress(json.dumps(context, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob: bytes) -> Dict[str, str]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class LastDocumentStore:
+    """Last generated document per user: bounded LRU in RAM with TTL, spilled to a SQLite tier.
+
+    Entries evicted by size or unused for longer than ``ttl`` move to disk and are promoted back on
+    access, so DOCX requests from long-idle users still work without keeping every context resident.
+    Both TTLs count from the last access. Disk reads and writes run in worker threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        ttl: float = 60 * 60,
+        compress: bool = True,
+        disk_ttl: float = 30 * 24 * 60 * 60,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.compress = compress
+        self.disk_ttl = disk_ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # Вытесненные записи, которые ещё пишутся на диск: чтение в этот момент берёт их отсюда.
+        self._spilling: Dict[int, _Entry] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_writes = 0
+        self.db_path = Path(db_path or _DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS last_documents (
+                    user_id INTEGER PRIMARY KEY,
+                    code TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    template_name TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    edits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(last_documents)")}
+            if "edits" not in columns:
+                conn.execute("ALTER TABLE last_documents ADD COLUMN edits INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _pack(self, context: Dict[str, str]) -> Any:
+        if self.compress:
+            return _encode(context)
+        return tuple((sys.intern(key), value) for key, value in context.items())
+
+    def _unpack(self, payload: Any) -> Dict[str, str]:
+        if isinstance(payload, bytes):
+            return _decode(payload)
+        return dict(payload)
+
+    def _resident(self, user_id: int, entry: _Entry) -> List[Tuple[int, _Entry]]:
+        """Make ``entry`` the most recent one; returns entries evicted over ``max_entries``."""
+
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = entry
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False))
+        return evicted
+
+    async def put(self, user_id: int, document: GeneratedDocument) -> None:
+        entry = _Entry(
+            code=sys.intern(document.code),
+            title=sys.intern(document.title),
+            template_name=sys.intern(document.template_name),
+            payload=self._pack(document.context),
+            used_at=time.time(),
+            edits=document.edits,
+        )
+        self._spilling.pop(user_id, None)
+        await self._spill(self._resident(user_id, entry))
+
+    async def get(self, user_id: int) -> Optional[GeneratedDocument]:
+        now = time.time()
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            # Резидентная запись ещё не выгружена обслуживанием — обращение продлевает её TTL.
+            entry.used_at = now
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return self._to_document(entry)
+
+        entry = self._spilling.get(user_id)
+        if entry is None:
+            with SQLITE_SECONDS.time("last_document_get"):
+                entry = await asyncio.to_thread(self._read, user_id)
+            resident = self._entries.get(user_id)
+            if resident is not None:
+                # Пока читали диск, пользователь получил новый документ.
+                return self._to_document(resident)
+            if entry is None or now - entry.used_at > self.disk_ttl:
+                self.misses += 1
+                return None
+        self.disk_hits += 1
+        entry.used_at = now
+        await self._spill(self._resident(user_id, entry))
+        return self._to_document(entry)
+
+    def _read(self, user_id: int) -> Optional[_Entry]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT code, title, template_name, payload, stored_at, edits FROM last_documents WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        payload = row[3] if self.compress else self._pack(_decode(row[3]))
+        return _Entry(code=row[0], title=row[1], template_name=row[2], payload=payload, used_at=row[4], edits=row[5])
+
+    def _to_document(self, entry: _Entry) -> GeneratedDocument:
+        return GeneratedDocument(
+            code=entry.code,
+            title=entry.title,
+            template_name=entry.template_name,
+            context=self._unpack(entry.payload),
+            edits=entry.edits,
+        )
+
+    def _write(self, rows: List[Tuple[Any, ...]]) -> None:
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO last_documents (user_id, code, title, template_name, payload, stored_at, edits)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            conn.commit()
+
+    async def _spill(self, entries: List[Tuple[int, _Entry]], keep_resident: bool = False) -> None:
+        if not entries:
+            return
+        rows = []
+        for user_id, entry in entries:
+            if not keep_resident:
+                self._spilling[user_id] = entry
+            payload = entry.payload if isinstance(entry.payload, bytes) else _encode(dict(entry.payload))
+            rows.append((user_id, entry.code, entry.title, entry.template_name, payload, entry.used_at, entry.edits))
+        try:
+            with SQLITE_SECONDS.time("last_document_spill"):
+                await asyncio.to_thread(self._write, rows)
+        finally:
+            for user_id, entry in entries:
+                if self._spilling.get(user_id) is entry:
+                    del self._spilling[user_id]
+        self.disk_writes += len(rows)
+
+    def _delete_expired(self, cutoff: float) -> int:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("DELETE FROM last_documents WHERE stored_at < ?", (cutoff,))
+            conn.commit()
+            return cursor.rowcount
+
+    async def expire(self) -> Tuple[int, int]:
+        """Spill resident entries unused for ``ttl`` and drop disk rows unused for ``disk_ttl``."""
+
+        now = time.time()
+        idle = [user_id for user_id, entry in self._entries.items() if now - entry.used_at > self.ttl]
+        await self._spill([(user_id, self._entries.pop(user_id)) for user_id in idle])
+        with SQLITE_SECONDS.time("last_document_expire"):
+            deleted = await asyncio.to_thread(self._delete_expired, now - self.disk_ttl)
+        return len(idle), deleted
+
+    async def flush(self) -> int:
+        """Write every resident entry to the disk tier (entries stay resident)."""
+
+        entries = list(self._entries.items())
+        await self._spill(entries, keep_resident=True)
+        return len(entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "resident": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_writes": self.disk_writes,
+        }
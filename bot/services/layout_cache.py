@@ -0,0 +1,199 @@
+"""Process-wide cache of parsed and line-broken paragraphs for static template text.
+
+Lines of a Jinja template that contain no variables or tags render identically for every user,
+so their ReportLab markup parse and line breaking for a given style and frame width are computed
+once and shared by all later documents. Variable-bearing lines go to a bounded LRU tier: they
+rarely repeat across users, but regenerating a document after editing one field reuses the
+layout of every line the edit did not touch.
+
+Timing per template, cache off vs on::
+
+    python -m bot.services.layout_cache --iterations 20
+"""
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import Paragraph
+
+_STYLE_ATTRS = (
+    "name",
+    "fontName",
+    "fontSize",
+    "leading",
+    "firstLineIndent",
+    "leftIndent",
+    "rightIndent",
+    "alignment",
+    "textColor",
+    "wordWrap",
+)
+
+
+def style_key(style: ParagraphStyle) -> Tuple[Any, ...]:
+    return tuple(str(getattr(style, attr, None)) for attr in _STYLE_ATTRS)
+
+
+class _LruDict(OrderedDict):
+    """Dict bounded to ``capacity`` entries; ``get`` refreshes recency. Safe across render threads."""
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__()
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return self[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self[key] = value
+            self.move_to_end(key)
+            while len(self) > self.capacity:
+                self.popitem(last=False)
+
+
+class LayoutCache:
+    def __init__(self, dynamic_entries: int = 2048) -> None:
+        self._parsed: Dict[Tuple[str, Tuple[Any, ...]], Tuple[ParagraphStyle, Any, Any]] = {}
+        self._layouts: Dict[Tuple[Any, ...], Tuple[Any, list, float]] = {}
+        self._dynamic_parsed = _LruDict(dynamic_entries)
+        self._dynamic_layouts = _LruDict(dynamic_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dynamic_hits = 0
+        self.dynamic_misses = 0
+
+    def paragraph(self, text: str, style: ParagraphStyle, dynamic: bool = False) -> Paragraph:
+        if dynamic and self._dynamic_layouts.capacity <= 0:
+            return Paragraph(text, style)
+        return CachedParagraph(text, style, cache=self, dynamic=dynamic)
+
+    def _store(self, kind: str, dynamic: bool, key: Tuple[Any, ...], value: Any) -> None:
+        if dynamic:
+            (self._dynamic_parsed if kind == "parsed" else self._dynamic_layouts).put(key, value)
+            return
+        with self._lock:
+            (self._parsed if kind == "parsed" else self._layouts)[key] = value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._layouts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "dynamic_entries": len(self._dynamic_layouts),
+            "dynamic_hits": self.dynamic_hits,
+            "dynamic_misses": self.dynamic_misses,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._parsed.clear()
+            self._layouts.clear()
+            self._dynamic_parsed.clear()
+            self._dynamic_layouts.clear()
+
+
+class CachedParagraph(Paragraph):
+    """Paragraph whose parse and ``wrap`` result are memoised in a ``LayoutCache``.
+
+    Cached line structures are only read while drawing or splitting, so they can be shared
+    between documents and render threads. Split parts are plain (uncached) paragraphs.
+    """
+
+    def __init__(
+        self,
+        text: Optional[str],
+        style: Optional[ParagraphStyle] = None,
+        bulletText: Optional[str] = None,
+        frags: Any = None,
+        caseSensitive: int = 1,
+        encoding: str = "utf8",
+        cache: Optional[LayoutCache] = None,
+        dynamic: bool = False,
+    ) -> None:
+        self._layout_cache = cache
+        self._dynamic = dynamic
+        if cache is None or frags is not None or bulletText is not None:
+            self._layout_cache = None
+            super().__init__(text, style, bulletText=bulletText, frags=frags, caseSensitive=caseSensitive, encoding=encoding)
+            return
+
+        self._cache_key = (text, style_key(style))
+        parsed = (cache._dynamic_parsed if dynamic else cache._parsed).get(self._cache_key)
+        if parsed is None:
+            super().__init__(text, style, caseSensitive=caseSensitive, encoding=encoding)
+            cache._store("parsed", dynamic, self._cache_key, (self.style, self.frags, self.bulletText))
+            return
+        self.caseSensitive = caseSensitive
+        self.encoding = encoding
+        self.text = text
+        self.style, self.frags, self.bulletText = parsed
+        self.debug = 0
+
+    def wrap(self, availWidth: float, availHeight: float) -> Tuple[float, float]:
+        cache = self._layout_cache
+        if cache is None:
+            return super().wrap(availWidth, availHeight)
+        key = (self._cache_key, availWidth)
+        cached = (cache._dynamic_layouts if self._dynamic else cache._layouts).get(key)
+        if cached is None:
+            if self._dynamic:
+                cache.dynamic_misses += 1
+            else:
+                cache.misses += 1
+            result = super().wrap(availWidth, availHeight)
+            if hasattr(self, "blPara"):
+                cache._store("layouts", self._dynamic, key, (self.blPara, list(self._wrapWidths), self.height))
+            return result
+        if self._dynamic:
+            cache.dynamic_hits += 1
+        else:
+            cache.hits += 1
+        self.width = availWidth
+        self.blPara, wrap_widths, self.height = cached
+        self._wrapWidths = list(wrap_widths)
+        return self.width, self.height
+
+
+layout_cache = LayoutCache()
+
+
+def main() -> None:
+    from ..handlers.documents import DOCUMENTS, TEMPLATES_DIR
+    from .pdf_builder import PdfBuilder
+    from .templates_loader import TemplateLoader
+
+    parser = argparse.ArgumentParser(description="Время рендера PDF по шаблонам без кеша и с кешем раскладки")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    loader = TemplateLoader(TEMPLATES_DIR)
+    plain = PdfBuilder(loader, layout_cache=None)
+    cached = PdfBuilder(loader, layout_cache=LayoutCache())
+    print(f"{'template':<34} {'plain ms':>9} {'cached ms':>10} {'saving':>7}")
+    for document in DOCUMENTS:
+        context = document.example_context()
+        timings = []
+        for builder in (plain, cached):
+            builder.build(document.template, context)
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                builder.build(document.template, context)
+            timings.append((time.perf_counter() - started) / args.iterations * 1000)
+        saving = 1 - timings[1] / timings[0]
+        print(f"{document.template:<34} {timings[0]:>9.2f} {timings[1]:>10.2f} {saving:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
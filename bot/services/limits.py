@@ -1,18 +1,19 @@
 import asyncio
 import sqlite3
+import time
 from contextlib import closing
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, Optional, Tuple
 
-from ..config import settings
+from .metrics import SQLITE_SECONDS
 
 _DB_PATH = Path(__file__).resolve().parent.parent / "data" / "usage_limits.db"
 _DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 
-def _get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(_DB_PATH)
+def _get_connection(db_path: Optional[Path] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or _DB_PATH)
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS user_document_usage (
@@ -28,6 +29,16 @@ def _get_connection() -> sqlite3.Connection:
         ON user_document_usage (user_id, created_at)
         """
     )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_document_usage_monthly (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            documents INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month)
+        )
+        """
+    )
     return conn
 
 
@@ -36,8 +47,8 @@ def get_month_start(now: Optional[datetime] = None) -> datetime:
     return current.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
 
-def _fetch_count_since(user_id: int, created_from: str) -> int:
-    with closing(_get_connection()) as conn:
+def _fetch_count_since(user_id: int, created_from: str, db_path: Optional[Path]) -> int:
+    with closing(_get_connection(db_path)) as conn:
         cursor = conn.execute(
             "SELECT COUNT(*) FROM user_document_usage WHERE user_id = ? AND created_at >= ?",
             (user_id, created_from),
@@ -46,8 +57,8 @@ def _fetch_count_since(user_id: int, created_from: str) -> int:
         return row[0] if row else 0
 
 
-def _insert_usage(user_id: int, created_at: str) -> None:
-    with closing(_get_connection()) as conn:
+def _insert_usage(user_id: int, created_at: str, db_path: Optional[Path]) -> None:
+    with closing(_get_connection(db_path)) as conn:
         conn.execute(
             """
             INSERT INTO user_document_usage (user_id, created_at)
@@ -58,17 +69,96 @@ def _insert_usage(user_id: int, created_at: str) -> None:
         conn.commit()
 
 
-async def get_user_doc_count(user_id: int, month_start: Optional[datetime] = None) -> int:
+def iter_usage_rows(
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    chunk_size: int = 5000,
+    db_path: Optional[Path] = None,
+) -> Iterator[Tuple[int, int, str]]:
+    """Stream ``(id, user_id, created_at)`` rows in ``chunk_size`` batches (blocking, run in a thread)."""
+
+    query = "SELECT id, user_id, created_at FROM user_document_usage WHERE 1 = 1"
+    params: list = []
+    if created_from:
+        query += " AND created_at >= ?"
+        params.append(created_from)
+    if created_to:
+        query += " AND created_at < ?"
+        params.append(created_to)
+    with closing(_get_connection(db_path)) as conn:
+        cursor = conn.execute(query + " ORDER BY id", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def _rollup_batch(cutoff: str, batch_size: int, db_path: Optional[Path]) -> int:
+    with closing(_get_connection(db_path)) as conn:
+        rows = conn.execute(
+            "SELECT id, user_id, created_at FROM user_document_usage WHERE created_at < ? ORDER BY id LIMIT ?",
+            (cutoff, batch_size),
+        ).fetchall()
+        if not rows:
+            return 0
+        totals: Dict[Tuple[int, str], int] = {}
+        for _, user_id, created_at in rows:
+            key = (user_id, created_at[:7])
+            totals[key] = totals.get(key, 0) + 1
+        # Агрегаты и удаление сырых строк — в одной транзакции, чтобы не посчитать строку дважды.
+        conn.executemany(
+            """
+            INSERT INTO user_document_usage_monthly (user_id, month, documents) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, month) DO UPDATE SET documents = documents + excluded.documents
+            """,
+            [(user_id, month, count) for (user_id, month), count in totals.items()],
+        )
+        conn.executemany("DELETE FROM user_document_usage WHERE id = ?", [(row[0],) for row in rows])
+        conn.commit()
+        return len(rows)
+
+
+async def rollup_usage(
+    retention_days: int,
+    deadline: Optional[float] = None,
+    batch_size: int = 5000,
+    db_path: Optional[Path] = None,
+) -> Dict[str, int]:
+    """Fold raw usage rows older than ``retention_days`` into ``user_document_usage_monthly``.
+
+    The current month is never touched, so the quota check keeps counting raw rows. Works in
+    batches until ``deadline`` (a ``time.monotonic()`` value) passes.
+    """
+
+    now = datetime.now(timezone.utc)
+    cutoff = min(get_month_start(now), now - timedelta(days=retention_days)).isoformat()
+    rolled = 0
+    while deadline is None or time.monotonic() < deadline:
+        with SQLITE_SECONDS.time("usage_rollup"):
+            count = await asyncio.to_thread(_rollup_batch, cutoff, batch_size, db_path)
+        rolled += count
+        if count < batch_size:
+            break
+    return {"rolled_up": rolled}
+
+
+async def get_user_doc_count(
+    user_id: int, month_start: Optional[datetime] = None, db_path: Optional[Path] = None
+) -> int:
     start = month_start or get_month_start()
-    return await asyncio.to_thread(_fetch_count_since, user_id, start.isoformat())
+    with SQLITE_SECONDS.time("usage_count"):
+        return await asyncio.to_thread(_fetch_count_since, user_id, start.isoformat(), db_path)
 
 
-async def register_document_usage(user_id: int, created_at: Optional[datetime] = None) -> None:
+async def register_document_usage(
+    user_id: int, created_at: Optional[datetime] = None, db_path: Optional[Path] = None
+) -> None:
     timestamp = (created_at or datetime.now(timezone.utc)).isoformat()
-    await asyncio.to_thread(_insert_usage, user_id, timestamp)
+    with SQLITE_SECONDS.time("usage_insert"):
+        await asyncio.to_thread(_insert_usage, user_id, timestamp, db_path)
 
 
-async def can_create_document(user_id: int, limit: Optional[int] = None) -> bool:
-    monthly_limit = limit or settings.monthly_document_limit
-    count = await get_user_doc_count(user_id)
-    return count < monthly_limit
+async def can_create_document(user_id: int, limit: int, db_path: Optional[Path] = None) -> bool:
+    count = await get_user_doc_count(user_id, db_path=db_path)
+    return count < limit
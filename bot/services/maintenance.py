@@ -0,0 +1,250 @@
+"""In-process scheduler for periodic housekeeping: expiry, rollups, compaction and log rotation.
+
+Tasks run one at a time on the event loop, at jittered intervals so worker processes started
+together do not hit the shared SQLite files at the same moment. Each run gets a deadline; tasks
+work in batches and stop when it passes, leaving the rest for the next run.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from .analytics import AnalyticsService
+from .metrics import metrics
+
+MAINTENANCE_SECONDS = metrics.histogram(
+    "bot_maintenance_seconds",
+    "Maintenance task run time",
+    ("task",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+ANALYTICS_LOG_DIR = Path(__file__).resolve().parent.parent / "data" / "analytics"
+
+TaskFunc = Callable[[float], Awaitable[Any]]
+
+
+@dataclass
+class MaintenanceTask:
+    name: str
+    func: TaskFunc
+    interval: float
+    budget: float
+    next_run: float = 0.0
+    runs: int = 0
+    failures: int = 0
+    last_started: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_result: Any = None
+    last_error: Optional[str] = None
+
+
+class MaintenanceScheduler:
+    def __init__(self, jitter: float = 0.1) -> None:
+        self.jitter = jitter
+        self.tasks: Dict[str, MaintenanceTask] = {}
+        self._lock = asyncio.Lock()
+
+    def add(self, name: str, func: TaskFunc, interval: float, budget: float = 5.0) -> None:
+        """Register ``func(deadline)``; ``deadline`` is a ``time.monotonic()`` value to stop by."""
+
+        task = MaintenanceTask(name=name, func=func, interval=interval, budget=budget)
+        # Первый запуск — в случайный момент первого интервала (не дольше 5 минут после старта).
+        task.next_run = time.monotonic() + random.uniform(0, min(interval, 300.0))
+        self.tasks[name] = task
+
+    def _schedule(self, task: MaintenanceTask) -> None:
+        spread = task.interval * self.jitter
+        task.next_run = time.monotonic() + task.interval + random.uniform(-spread, spread)
+
+    async def run_task(self, name: str) -> MaintenanceTask:
+        task = self.tasks[name]
+        async with self._lock:
+            started = time.monotonic()
+            task.last_started = time.time()
+            try:
+                task.last_result = await task.func(started + task.budget)
+                task.last_error = None
+            except Exception as error:
+                task.failures += 1
+                task.last_error = f"{type(error).__name__}: {error}"
+                logging.exception("Задача обслуживания %s завершилась с ошибкой", name)
+            finally:
+                task.runs += 1
+                task.last_duration = time.monotonic() - started
+                MAINTENANCE_SECONDS.observe(task.last_duration, name)
+                self._schedule(task)
+        if task.last_duration > task.budget * 1.5:
+            logging.warning("Задача %s заняла %.1f с при бюджете %.1f с", name, task.last_duration, task.budget)
+        return task
+
+    async def run(self) -> None:
+        while True:
+            if not self.tasks:
+                return
+            due = min(self.tasks.values(), key=lambda task: task.next_run)
+            await asyncio.sleep(max(0.0, due.next_run - time.monotonic()))
+            await self.run_task(due.name)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "name": task.name,
+                "runs": task.runs,
+                "failures": task.failures,
+                "last_started": task.last_started,
+                "last_duration": task.last_duration,
+                "last_result": task.last_result,
+                "last_error": task.last_error,
+                "next_in": max(0.0, task.next_run - now),
+            }
+            for task in self.tasks.values()
+        ]
+
+
+class FsmExpiry:
+    """Drops FSM records that did not change for ``ttl`` seconds, and empty records right away.
+
+    ``MemoryStorage`` creates a record for every key it is asked about, so without this it keeps
+    one per user ever seen. Records carry no timestamps; a record counts as unchanged while its
+    state and data object stay the same (``set_data`` always stores a fresh dict). ``on_expire``
+    gets the state and data of every stale record before it is dropped.
+    """
+
+    def __init__(
+        self,
+        storage: MemoryStorage,
+        ttl: float,
+        on_expire: Optional[Callable[[Optional[str], Dict[str, Any]], None]] = None,
+    ) -> None:
+        self.storage = storage
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self._seen: Dict[Any, Tuple[Optional[str], int, float]] = {}
+
+    async def __call__(self, deadline: float) -> Dict[str, int]:
+        now = time.monotonic()
+        records = self.storage.storage
+        removed_empty = removed_stale = 0
+        seen: Dict[Any, Tuple[Optional[str], int, float]] = {}
+        for key, record in list(records.items()):
+            if record.state is None and not record.data:
+                del records[key]
+                removed_empty += 1
+                continue
+            fingerprint = (record.state, id(record.data))
+            previous = self._seen.get(key)
+            since = previous[2] if previous is not None and previous[:2] == fingerprint else now
+            if now - since >= self.ttl:
+                del records[key]
+                if self.on_expire is not None:
+                    self.on_expire(record.state, record.data)
+                removed_stale += 1
+                continue
+            seen[key] = (*fingerprint, since)
+        self._seen = seen
+        return {"empty": removed_empty, "stale": removed_stale, "kept": len(records)}
+
+
+class AnalyticsRotation:
+    """Moves the oldest in-memory analytics events into gzip NDJSON files under ``directory``.
+
+    ``keep_files`` is a retention limit: only the newest files are kept, older events are deleted
+    for good (totals in :class:`AnalyticsService` still count them). A file is written under a
+    temporary name and renamed in the same loop step that drops its events from memory, so an
+    export listing the files and then reading the list sees every event exactly once.
+    """
+
+    def __init__(
+        self,
+        analytics: AnalyticsService,
+        max_events: int,
+        keep_files: int = 10,
+        max_errors: int = 1000,
+        directory: Path = ANALYTICS_LOG_DIR,
+    ) -> None:
+        self.analytics = analytics
+        self.max_events = max_events
+        self.keep_files = keep_files
+        self.max_errors = max_errors
+        self.directory = directory
+
+    def _write(self, entries: List[Any]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"events-{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}.ndjson.gz.tmp"
+        try:
+            with gzip.open(path, "wt", encoding="utf-8") as handle:
+                for entry in entries:
+                    record = {
+                        "created_at": entry.created_at.isoformat(),
+                        "event": entry.event,
+                        "user_id": entry.user_id,
+                        "payload": entry.payload,
+                    }
+                    handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return path
+
+    def _publish(self, temporary: Path) -> None:
+        os.replace(temporary, temporary.with_suffix(""))
+        files = sorted(self.directory.glob("events-*.ndjson.gz"))
+        for old in files[: max(0, len(files) - self.keep_files)]:
+            old.unlink(missing_ok=True)
+
+    async def __call__(self, deadline: float) -> Dict[str, int]:
+        if len(self.analytics.errors) > self.max_errors:
+            self.analytics.errors = self.analytics.errors[-self.max_errors :]
+        events = self.analytics.events
+        if len(events) <= self.max_events:
+            return {"rotated": 0}
+        # Оставляем половину лимита, чтобы ротация не срабатывала на каждом запуске.
+        cut = len(events) - self.max_events // 2
+        temporary = await asyncio.to_thread(self._write, events[:cut])
+        # Пока файл писался, список только дописывался, поэтому первые cut записей те же.
+        # Переименование и замена списка идут без await между ними.
+        self._publish(temporary)
+        self.analytics.events = self.analytics.events[cut:]
+        return {"rotated": cut}
+
+
+def _compact_database(path: Path, vacuum_ratio: float) -> Dict[str, Any]:
+    with closing(sqlite3.connect(path, timeout=5, isolation_level=None)) as conn:
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        vacuumed = pages > 0 and free / pages >= vacuum_ratio
+        if vacuumed:
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"pages": pages, "free": free, "vacuumed": vacuumed}
+
+
+def sqlite_compaction(paths: Iterable[Path], vacuum_ratio: float = 0.2) -> TaskFunc:
+    """Task running ANALYZE (via ``PRAGMA optimize``), a WAL checkpoint and, when at least
+    ``vacuum_ratio`` of pages are free, VACUUM on each database until the deadline."""
+
+    async def compact(deadline: float) -> Dict[str, Any]:
+        report: Dict[str, Any] = {}
+        for path in paths:
+            if time.monotonic() >= deadline:
+                break
+            if path.exists():
+                report[path.name] = await asyncio.to_thread(_compact_database, path, vacuum_ratio)
+        return report
+
+    return compact
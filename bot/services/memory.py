@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_ATOMIC = (str, bytes, bytearray, int, float, bool, complex, type(None))
+_COLLECT_ATTEMPTS = 3
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Approximate retained size of ``obj`` including containers, dataclasses and slots."""
+
+    seen: set[int] = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, _ATOMIC):
+            continue
+        if isinstance(current, dict):
+            # Снимок элементов: обход идёт в потоке, пока цикл событий продолжает менять словари.
+            for key, value in list(current.items()):
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(list(current))
+        else:
+            attributes = getattr(current, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return total
+
+
+@dataclass
+class MemoryEntry:
+    name: str
+    entries: int
+    size: int
+
+
+@dataclass
+class AllocationSite:
+    location: str
+    size_diff: int
+    count_diff: int
+
+
+def format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB"):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+class MemoryReporter:
+    """Tracks entry counts and deep sizes of in-process state plus tracemalloc growth.
+
+    The walk over tracked objects and tracemalloc snapshots run in a worker thread, so a large
+    store does not stall the event loop while a report is collected.
+    """
+
+    def __init__(self, use_tracemalloc: bool = False, top_sites: int = 10) -> None:
+        self.top_sites = top_sites
+        self._targets: Dict[str, Tuple[Callable[[], Any], Optional[Callable[[], int]]]] = {}
+        # У периодического лога и /admin mem свои точки отсчёта, чтобы не сбивать рост друг другу.
+        self._baselines: Dict[str, tracemalloc.Snapshot] = {}
+        if use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+
+    def track(self, name: str, getter: Callable[[], Any], count: Optional[Callable[[], int]] = None) -> None:
+        """Report ``getter()``; entries are ``len()`` of it unless ``count`` says otherwise."""
+
+        self._targets[name] = (getter, count)
+
+    def _measure(self, name: str) -> MemoryEntry:
+        getter, count = self._targets[name]
+        attempt = 1
+        while True:
+            value = getter()
+            try:
+                size = deep_sizeof(value)
+                entries = count() if count is not None else len(value)
+                return MemoryEntry(name=name, entries=entries, size=size)
+            except RuntimeError:
+                # Контейнер изменился во время обхода — пробуем ещё раз.
+                if attempt >= _COLLECT_ATTEMPTS:
+                    raise
+                attempt += 1
+
+    def _collect(self) -> List[MemoryEntry]:
+        return [self._measure(name) for name in list(self._targets)]
+
+    async def collect(self) -> List[MemoryEntry]:
+        return await asyncio.to_thread(self._collect)
+
+    def allocation_growth(self, baseline: str = "admin") -> List[AllocationSite]:
+        """Top allocation sites by growth since the previous call for ``baseline`` (empty without tracemalloc)."""
+
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        previous = self._baselines.get(baseline)
+        self._baselines[baseline] = snapshot
+        if previous is None:
+            stats = snapshot.statistics("lineno")
+            return [
+                AllocationSite(location=str(stat.traceback), size_diff=stat.size, count_diff=stat.count)
+                for stat in stats[: self.top_sites]
+            ]
+        stats = snapshot.compare_to(previous, "lineno")
+        return [
+            AllocationSite(location=str(stat.traceback), size_diff=stat.size_diff, count_diff=stat.count_diff)
+            for stat in stats[: self.top_sites]
+        ]
+
+    async def format_report(self, baseline: str = "admin") -> Tuple[str, List[AllocationSite]]:
+        entries = await self.collect()
+        total = sum(entry.size for entry in entries)
+        lines = [f"{entry.name}: {entry.entries} шт., {format_bytes(entry.size)}" for entry in entries]
+        lines.append(f"Итого: {format_bytes(total)}")
+        return "\n".join(lines), await asyncio.to_thread(self.allocation_growth, baseline)
+
+    async def run_periodic(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                entries = await self.collect()
+                summary = ", ".join(f"{entry.name}={entry.entries}/{format_bytes(entry.size)}" for entry in entries)
+                logging.info("Память: %s", summary)
+                for site in (await asyncio.to_thread(self.allocation_growth, "periodic"))[:3]:
+                    logging.info("Рост аллокаций: %s %+d B (%+d)", site.location, site.size_diff, site.count_diff)
+            except Exception:  # pragma: no cover - отчёт не должен ронять бота
+                logging.exception("Не удалось собрать отчёт о памяти")
@@ -0,0 +1,215 @@
+"""In-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain dicts and lists updated from the event loop thread, so recording
+is a dict lookup and an integer increment with no locks. Values that already live elsewhere (queue
+depth, cache statistics, RSS) are read by callbacks only when ``/metrics`` is scraped.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import resource
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiohttp import web
+
+LabelValues = Tuple[str, ...]
+CallbackValue = Union[float, Dict[LabelValues, float]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self._values.items()]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: LabelValues) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (non-cumulative, last slot is +Inf) followed by the sum.
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str) -> _Timer:
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    def __init__(
+        self, name: str, documentation: str, kind: str, read: Callable[[], CallbackValue], labels: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.read = read
+        self.labels = tuple(labels)
+
+    def samples(self) -> List[str]:
+        value = self.read()
+        if not isinstance(value, dict):
+            return [f"{self.name} {value}"]
+        return [f"{self.name}{_format_labels(self.labels, key)} {item}" for key, item in value.items()]
+
+
+Metric = Union[Counter, Histogram, CallbackMetric]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def _add(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def gauge_callback(
+        self, name: str, documentation: str, read: Callable[[], CallbackValue], labels: Sequence[str] = ()
+    ) -> None:
+        self._add(CallbackMetric(name, documentation, "gauge", read, labels))
+
+    def counter_callback(
+        self, name: str, documentation: str, read: Callable[[], CallbackValue], labels: Sequence[str] = ()
+    ) -> None:
+        self._add(CallbackMetric(name, documentation, "counter", read, labels))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception:  # pragma: no cover - сломанный колбэк не должен ронять весь скрейп
+                logging.exception("Не удалось собрать метрику %s", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes() -> float:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            return float(int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, IndexError):
+        # Вне Linux — пиковое значение (ru_maxrss в КБ).
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+metrics = MetricsRegistry()
+
+UPDATES = metrics.counter("bot_updates_total", "Updates handled, by handler", ("handler",))
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Handler latency including render waits", ("handler",))
+RENDER_QUEUE_SECONDS = metrics.histogram("bot_render_queue_wait_seconds", "Time render jobs spent queued")
+RENDER_SECONDS = metrics.histogram("bot_render_seconds", "Render job latency from submit to result", ("outcome",))
+SQLITE_SECONDS = metrics.histogram(
+    "bot_sqlite_query_seconds",
+    "SQLite query latency as seen by the event loop",
+    ("query",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+TELEGRAM_REQUESTS = metrics.counter("bot_telegram_requests_total", "Bot API requests, by method", ("method",))
+TELEGRAM_ERRORS = metrics.counter("bot_telegram_errors_total", "Failed Bot API requests", ("method", "error"))
+metrics.gauge_callback("bot_process_resident_memory_bytes", "Resident set size of the bot process", process_rss_bytes)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Bot session middleware counting API requests and failures per method."""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Any, method: TelegramMethod) -> Response:
+        name = type(method).__name__
+        TELEGRAM_REQUESTS.inc(name)
+        try:
+            return await make_request(bot, method)
+        except Exception as error:
+            TELEGRAM_ERRORS.inc(name, type(error).__name__)
+            raise
+
+
+async def start_metrics_server(host: str, port: int, registry: Optional[MetricsRegistry] = None) -> web.AppRunner:
+    registry = registry or metrics
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import SQLITE_SECONDS, metrics
+from .scheduler import LatencyTracker
+
+INBOX_PATH = Path(__file__).resolve().parent.parent / "data" / "payment_events.db"
+
+SUBSCRIPTION_ACTIVATED = "subscription.activated"
+SUBSCRIPTION_CANCELLED = "subscription.cancelled"
+# Тип события -> состояние Pro после него; остальные события только сохраняются.
+SUBSCRIPTION_STATES = {SUBSCRIPTION_ACTIVATED: True, SUBSCRIPTION_CANCELLED: False}
+
+PAYMENT_EVENT_LAG_SECONDS = metrics.histogram(
+    "bot_payment_event_lag_seconds",
+    "Time from payment event receipt to processing",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+PAYMENT_EVENTS_TOTAL = metrics.counter(
+    "bot_payment_events_total", "Payment events received, by outcome", ("outcome",)
+)
+
+# Получает {user_id: is_pro} для пользователей, чьё состояние изменилось в пачке.
+ApplyCallback = Callable[[Dict[int, bool]], Awaitable[None]]
+
+
+@dataclass
+class PaymentEvent:
+    event_id: str
+    kind: str
+    user_id: int
+    occurred_at: float
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+class PaymentInbox:
+    """Durable inbox of payment provider events, keyed by the provider's event ID.
+
+    Handlers and webhooks only :meth:`put` events, which is cheap and safe to repeat: a duplicate
+    delivery hits the primary key and is counted, not queued. :meth:`run` drains the inbox in
+    batches; per user only the latest event by ``occurred_at`` decides the subscription state, which
+    is recorded in ``subscription_state`` in the same transaction that marks the events processed.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 200,
+        batch_window: float = 0.2,
+        poll_interval: float = 5.0,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.db_path = Path(db_path or INBOX_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.lag = LatencyTracker()
+        self._wakeup = asyncio.Event()
+        with closing(self._connect()) as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS payment_events (
+                    event_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    occurred_at REAL NOT NULL,
+                    payload TEXT NOT NULL,
+                    received_at REAL NOT NULL,
+                    processed_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_payment_events_pending
+                ON payment_events (processed_at, received_at);
+                CREATE TABLE IF NOT EXISTS subscription_state (
+                    user_id INTEGER PRIMARY KEY,
+                    is_pro INTEGER NOT NULL,
+                    event_id TEXT NOT NULL,
+                    occurred_at REAL NOT NULL
+                );
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _put(self, event: PaymentEvent) -> bool:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO payment_events (event_id, kind, user_id, occurred_at, payload, received_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    event.event_id,
+                    event.kind,
+                    event.user_id,
+                    event.occurred_at,
+                    json.dumps(event.payload, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+
+    async def put(self, event: PaymentEvent) -> bool:
+        """Store ``event`` unless its ID was seen before; ``False`` for a duplicate delivery."""
+
+        with SQLITE_SECONDS.time("payment_put"):
+            stored = await asyncio.to_thread(self._put, event)
+        if stored:
+            self.received += 1
+            PAYMENT_EVENTS_TOTAL.inc("stored")
+            self._wakeup.set()
+        else:
+            self.duplicates += 1
+            PAYMENT_EVENTS_TOTAL.inc("duplicate")
+        return stored
+
+    def _process_batch(self) -> Tuple[Dict[int, bool], List[float]]:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                SELECT event_id, kind, user_id, occurred_at, received_at FROM payment_events
+                WHERE processed_at IS NULL ORDER BY received_at LIMIT ?
+                """,
+                (self.batch_size,),
+            ).fetchall()
+            if not rows:
+                return {}, []
+            latest: Dict[int, Tuple[float, str, bool]] = {}
+            for event_id, kind, user_id, occurred_at, _ in rows:
+                if kind in SUBSCRIPTION_STATES and (user_id not in latest or occurred_at >= latest[user_id][0]):
+                    latest[user_id] = (occurred_at, event_id, SUBSCRIPTION_STATES[kind])
+            changed: Dict[int, bool] = {}
+            for user_id, (occurred_at, event_id, is_pro) in latest.items():
+                current = conn.execute(
+                    "SELECT is_pro, occurred_at FROM subscription_state WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                # Запоздавшее старое событие не перекрывает более новое, уже применённое.
+                if current is not None and current[1] > occurred_at:
+                    continue
+                conn.execute(
+                    """
+                    INSERT INTO subscription_state (user_id, is_pro, event_id, occurred_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        is_pro = excluded.is_pro, event_id = excluded.event_id, occurred_at = excluded.occurred_at
+                    """,
+                    (user_id, int(is_pro), event_id, occurred_at),
+                )
+                if current is None or bool(current[0]) != is_pro:
+                    changed[user_id] = is_pro
+            conn.executemany(
+                "UPDATE payment_events SET processed_at = ? WHERE event_id = ?", [(now, row[0]) for row in rows]
+            )
+            conn.commit()
+        return changed, [now - row[4] for row in rows]
+
+    async def process_pending(self, apply: ApplyCallback) -> int:
+        with SQLITE_SECONDS.time("payment_process"):
+            changed, lags = await asyncio.to_thread(self._process_batch)
+        for lag in lags:
+            self.lag.observe(lag)
+            PAYMENT_EVENT_LAG_SECONDS.observe(lag)
+        self.processed += len(lags)
+        if changed:
+            await apply(changed)
+        return len(lags)
+
+    async def run(self, apply: ApplyCallback) -> None:
+        while True:
+            try:
+                while await self.process_pending(apply) >= self.batch_size:
+                    pass
+            except Exception:  # pragma: no cover - воркер не должен останавливаться
+                logging.exception("Ошибка обработки платёжных событий")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                # Короткое окно, чтобы всплеск событий провайдера обработался одной пачкой.
+                await asyncio.sleep(self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _subscriptions(self) -> Dict[int, bool]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT user_id, is_pro FROM subscription_state").fetchall()
+        return {user_id: bool(is_pro) for user_id, is_pro in rows}
+
+    async def subscriptions(self) -> Dict[int, bool]:
+        """Recorded subscription state of every user who ever had a subscription event."""
+
+        return await asyncio.to_thread(self._subscriptions)
+
+    def _stats(self) -> Dict[str, Any]:
+        with closing(self._connect()) as conn:
+            pending, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(received_at) FROM payment_events WHERE processed_at IS NULL"
+            ).fetchone()
+        return {
+            "pending": pending,
+            "oldest_pending": round(time.time() - oldest, 1) if oldest else 0.0,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "lag_p95": round(self.lag.percentile(95), 3),
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats)
@@ -1,8 +1,11 @@
+import time
+import uuid
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 
 from ..config import Settings
+from .payment_events import SUBSCRIPTION_ACTIVATED, PaymentEvent, PaymentInbox
 
 
 @dataclass
@@ -10,17 +13,58 @@ class PaymentResult:
     success: bool
     message: str
     timestamp: datetime
+    checkout_id: Optional[str] = None
+
+
+class LocalPaymentProvider:
+    """Stand-in for a payment provider: every checkout is paid at once.
+
+    The provider's webhook is simulated by putting the event straight into the inbox, repeated
+    ``duplicate_deliveries`` extra times, the way real providers redeliver on timeouts.
+    """
+
+    def __init__(self, inbox: PaymentInbox, duplicate_deliveries: int = 0) -> None:
+        self.inbox = inbox
+        self.duplicate_deliveries = duplicate_deliveries
+
+    async def create_checkout(self, user_id: int) -> str:
+        return uuid.uuid4().hex[:16]
+
+    async def confirm(self, user_id: int, checkout_id: str) -> None:
+        event = PaymentEvent(
+            event_id=f"local:{checkout_id}:paid",
+            kind=SUBSCRIPTION_ACTIVATED,
+            user_id=user_id,
+            occurred_at=time.time(),
+            payload={"checkout_id": checkout_id},
+        )
+        for _ in range(1 + self.duplicate_deliveries):
+            await self.inbox.put(event)
 
 
 class PaymentService:
-    def __init__(self, settings: Settings) -> None:
+    """Checkout and activation return as soon as the provider has the request; the subscription
+    itself changes when :class:`PaymentInbox` processes the provider's event."""
+
+    def __init__(self, settings: Settings, inbox: PaymentInbox) -> None:
         self.settings = settings
+        self.inbox = inbox
+        self.provider = LocalPaymentProvider(inbox, duplicate_deliveries=settings.payment_duplicate_deliveries)
 
     async def create_checkout(self, user_id: int) -> PaymentResult:
-        return PaymentResult(success=True, message="Оплата пока в демо-режиме", timestamp=datetime.utcnow())
+        checkout_id = await self.provider.create_checkout(user_id)
+        return PaymentResult(
+            success=True, message="Оплата пока в демо-режиме", timestamp=datetime.utcnow(), checkout_id=checkout_id
+        )
 
-    async def activate_subscription(self, user_id: int) -> PaymentResult:
-        return PaymentResult(success=True, message="Подписка активирована (демо)", timestamp=datetime.utcnow())
+    async def activate_subscription(self, user_id: int, checkout_id: str) -> PaymentResult:
+        await self.provider.confirm(user_id, checkout_id)
+        return PaymentResult(
+            success=True,
+            message="Платёж принят (демо). Pro включится в течение нескольких секунд — мы пришлём уведомление.",
+            timestamp=datetime.utcnow(),
+            checkout_id=checkout_id,
+        )
 
     def pricing_info(self) -> Dict[str, str]:
         return {
@@ -1,9 +1,12 @@
 ﻿from __future__ import annotations
 
+import itertools
+import threading
+from dataclasses import dataclass
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Optional, Tuple
 
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT
 from reportlab.lib.pagesizes import A4
@@ -11,36 +14,111 @@ from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 
+from .layout_cache import LayoutCache, layout_cache as shared_layout_cache
 from .legal import DISCLAIMER_TEXT
 from .templates_loader import TemplateLoader
 
+_DEFAULT = object()
 
-class PdfBuilder:
-    _font_registered = False
+_FONTS_DIR = Path(__file__).resolve().parent.parent / "data" / "fonts"
+# TTFont хранит состояние подмножеств глифов и не потокобезопасен: у каждого потока рендера своя копия.
+_thread_fonts = threading.local()
+_font_sequence = itertools.count()
 
-    def __init__(self, template_loader: TemplateLoader) -> None:
-        self.template_loader = template_loader
 
-    def _ensure_font(self) -> str:
-        """Register bundled DejaVuSerif fonts to render Cyrillic correctly."""
+@dataclass(frozen=True)
+class PdfProfile:
+    """Output settings that trade file size against completeness of the PDF."""
 
-        if PdfBuilder._font_registered:
-            return "DejaVuSerif"
+    name: str
+    page_compression: bool = True
+    bold_font: bool = True
+    metadata: bool = False
 
-        fonts_dir = Path(__file__).resolve().parent.parent / "data" / "fonts"
-        regular = fonts_dir / "DejaVuSerif.ttf"
-        bold = fonts_dir / "DejaVuSerif-Bold.ttf"
 
-        pdfmetrics.registerFont(TTFont("DejaVuSerif", str(regular)))
-        pdfmetrics.registerFont(TTFont("DejaVuSerif-Bold", str(bold)))
+# ReportLab always embeds TrueType faces as glyph subsets, so the font lever is the number of faces:
+# "compact" sets titles in the regular face and ships a single DejaVu subset. "archival" fills the
+# document info dictionary and language tag; true PDF/A (XMP, OutputIntent) is out of ReportLab's reach.
+PDF_PROFILES: Dict[str, PdfProfile] = {
+    "compact": PdfProfile("compact", bold_font=False),
+    "standard": PdfProfile("standard"),
+    "archival": PdfProfile("archival", metadata=True),
+}
 
-        PdfBuilder._font_registered = True
-        return "DejaVuSerif"
 
-    def build(self, template_name: str, context: Dict[str, str]) -> BytesIO:
-        font_name = self._ensure_font()
+class PdfBuilder:
+    def __init__(
+        self,
+        template_loader: TemplateLoader,
+        layout_cache: Optional[LayoutCache] = _DEFAULT,
+        profile: str = "standard",
+    ) -> None:
+        self.template_loader = template_loader
+        self.layout_cache = shared_layout_cache if layout_cache is _DEFAULT else layout_cache
+        self.profile = self.get_profile(profile)
+
+    @staticmethod
+    def get_profile(name: str) -> PdfProfile:
+        try:
+            return PDF_PROFILES[name]
+        except KeyError:
+            raise ValueError(f"unknown PDF profile {name!r}, expected one of {', '.join(PDF_PROFILES)}") from None
+
+    def _paragraph(self, text: str, style: ParagraphStyle, static: bool) -> Paragraph:
+        if self.layout_cache is not None:
+            return self.layout_cache.paragraph(text, style, dynamic=not static)
+        return Paragraph(text, style)
+
+    @staticmethod
+    def _ensure_font() -> Tuple[str, str]:
+        """Register bundled DejaVuSerif fonts for the calling thread; returns (regular, bold) names."""
+
+        names = getattr(_thread_fonts, "names", None)
+        if names is None:
+            suffix = next(_font_sequence)
+            names = (f"DejaVuSerif-{suffix}", f"DejaVuSerif-Bold-{suffix}")
+            pdfmetrics.registerFont(TTFont(names[0], str(_FONTS_DIR / "DejaVuSerif.ttf")))
+            pdfmetrics.registerFont(TTFont(names[1], str(_FONTS_DIR / "DejaVuSerif-Bold.ttf")))
+            _thread_fonts.names = names
+        return names
+
+    def build(self, template_name: str, context: Dict[str, str], profile: Optional[str] = None) -> BytesIO:
+        rendered = self.template_loader.render(template_name, context)
+        return self.build_rendered(
+            template_name,
+            rendered,
+            profile=profile,
+            title=context.get("document_title"),
+        )
+
+    def _document_options(self, profile: PdfProfile, title: Optional[str]) -> Dict[str, Any]:
+        options: Dict[str, Any] = {"pageCompression": int(profile.page_compression)}
+        if profile.metadata:
+            options.update(
+                title=title or "",
+                author="CLEAN DOC BOT",
+                subject=title or "",
+                creator="CLEAN DOC BOT",
+                lang="ru-RU",
+                displayDocTitle=1,
+            )
+        return options
+
+    def build_rendered(
+        self,
+        template_name: str,
+        rendered: str,
+        canvasmaker: type = Canvas,
+        profile: Optional[str] = None,
+        title: Optional[str] = None,
+    ) -> BytesIO:
+        """Lay out and serialise already rendered template text."""
+
+        output_profile = self.get_profile(profile) if profile else self.profile
+        font_name, bold_font_name = self._ensure_font()
         buffer = BytesIO()
         doc = SimpleDocTemplate(
             buffer,
@@ -49,11 +127,11 @@ class PdfBuilder:
             bottomMargin=20 * mm,
             leftMargin=30 * mm,
             rightMargin=10 * mm,
+            **self._document_options(output_profile, title),
         )
         story = []
         styles = getSampleStyleSheet()
-        registered_fonts = set(pdfmetrics.getRegisteredFontNames())
-        title_font = "DejaVuSerif-Bold" if "DejaVuSerif-Bold" in registered_fonts else font_name
+        title_font = bold_font_name if output_profile.bold_font else font_name
 
         normal = styles["Normal"]
         normal.fontSize = 14
@@ -99,31 +177,32 @@ class PdfBuilder:
             spaceBefore=12,
         )
 
-        rendered = self.template_loader.render(template_name, context)
+        static_lines = self.template_loader.static_lines(template_name)
 
         first_content_added = False
         for line in rendered.split("\n"):
             if not line.strip():
                 continue
+            static = line.strip() in static_lines
 
             if not first_content_added:
-                story.append(Paragraph(line, title_style))
+                story.append(self._paragraph(line, title_style, static))
                 first_content_added = True
                 continue
 
             if line.lower().startswith("г. "):
-                story.append(Paragraph(line, meta_style))
+                story.append(self._paragraph(line, meta_style, static))
                 continue
 
-            story.append(Paragraph(line, normal))
+            story.append(self._paragraph(line, normal, static))
             story.append(Spacer(1, 8))
 
         story.append(Spacer(1, 12))
         story.append(Paragraph(f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}", footer_style))
-        story.append(Paragraph("Подпись стороны: _____________________", footer_style))
+        story.append(self._paragraph("Подпись стороны: _____________________", footer_style, static=True))
         story.append(Spacer(1, 12))
-        story.append(Paragraph(DISCLAIMER_TEXT, disclaimer_style))
-        doc.build(story)
+        story.append(self._paragraph(DISCLAIMER_TEXT, disclaimer_style, static=True))
+        doc.build(story, canvasmaker=canvasmaker)
         buffer.seek(0)
         return buffer
 
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional
+
+from .metrics import SQLITE_SECONDS
+
+_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "saved_fields.db"
+
+# Роли сторон, чьи данные повторяются из шаблона в шаблон; синонимы сводятся к одной роли.
+PARTY_ROLES = {
+    "seller": "seller",
+    "buyer": "buyer",
+    "landlord": "landlord",
+    "tenant": "tenant",
+    "renter": "tenant",
+    "owner": "owner",
+    "customer": "customer",
+    "contractor": "contractor",
+    "client": "client",
+    "receiver": "receiver",
+    "payer": "payer",
+    "principal": "principal",
+    "agent": "agent",
+    "creditor": "creditor",
+    "debtor": "debtor",
+}
+PARTY_FIELDS = {
+    "full_name": "full_name",
+    "name": "full_name",
+    "passport": "passport",
+    "address": "address",
+    "details": "details",
+    "contacts": "contacts",
+}
+STANDALONE_FIELDS = {"signing_place": "signing_place"}
+
+_PARTY_KEY = re.compile(r"^([a-z]+)_(full_name|[a-z]+)$")
+
+
+def field_slot(key: str) -> Optional[str]:
+    """Semantic slot of a wizard question key, e.g. ``renter_full_name`` -> ``tenant:full_name``.
+
+    Only data that describes a party (names, passports, addresses, requisites) or the usual signing
+    city is reusable; amounts, dates and descriptions belong to one document and map to ``None``.
+    """
+
+    if key in STANDALONE_FIELDS:
+        return STANDALONE_FIELDS[key]
+    match = _PARTY_KEY.match(key)
+    if match is None:
+        return None
+    role = PARTY_ROLES.get(match.group(1))
+    field = PARTY_FIELDS.get(match.group(2))
+    if role is None or field is None:
+        return None
+    return f"{role}:{field}"
+
+
+class SavedFieldStore:
+    """Values a user has already entered, keyed by semantic slot, for prefilling later wizards.
+
+    One SQLite row per ``(user_id, slot)`` keeps the latest answer; rows not refreshed within
+    ``ttl`` are ignored and later dropped by :meth:`expire`.
+    """
+
+    def __init__(self, ttl: float = 180 * 24 * 60 * 60, db_path: Optional[Path] = None) -> None:
+        self.ttl = ttl
+        self.db_path = Path(db_path or _DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS saved_fields (
+                    user_id INTEGER NOT NULL,
+                    slot TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, slot)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _load(self, user_id: int) -> Dict[str, str]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT slot, value FROM saved_fields WHERE user_id = ? AND updated_at >= ?",
+                (user_id, time.time() - self.ttl),
+            ).fetchall()
+        return dict(rows)
+
+    def _remember(self, user_id: int, values: Dict[str, str]) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                """
+                INSERT INTO saved_fields (user_id, slot, value, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, slot) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """,
+                [(user_id, slot, value, now) for slot, value in values.items()],
+            )
+            conn.commit()
+
+    def _forget(self, user_id: int) -> int:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("DELETE FROM saved_fields WHERE user_id = ?", (user_id,))
+            conn.commit()
+            return cursor.rowcount
+
+    def _expire(self) -> int:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("DELETE FROM saved_fields WHERE updated_at < ?", (time.time() - self.ttl,))
+            conn.commit()
+            return cursor.rowcount
+
+    async def suggestions(self, user_id: int, keys: Iterable[str]) -> Dict[str, str]:
+        """Saved values for the given question keys (question key -> value), known slots only."""
+
+        slots = {key: field_slot(key) for key in keys}
+        if not any(slots.values()):
+            return {}
+        with SQLITE_SECONDS.time("saved_fields_load"):
+            saved = await asyncio.to_thread(self._load, user_id)
+        return {key: saved[slot] for key, slot in slots.items() if slot in saved}
+
+    async def remember(self, user_id: int, answers: Mapping[str, str]) -> None:
+        """Store reusable answers of a finished document (question key -> value)."""
+
+        values = {slot: value for key, value in answers.items() if (slot := field_slot(key)) and value}
+        if not values:
+            return
+        with SQLITE_SECONDS.time("saved_fields_store"):
+            await asyncio.to_thread(self._remember, user_id, values)
+
+    async def forget(self, user_id: int) -> int:
+        return await asyncio.to_thread(self._forget, user_id)
+
+    async def expire(self) -> int:
+        with SQLITE_SECONDS.time("saved_fields_expire"):
+            return await asyncio.to_thread(self._expire)
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .metrics import RENDER_QUEUE_SECONDS, RENDER_SECONDS
+
+INTERACTIVE = "interactive"
+RENDER = "render"
+
+_LATENCY_WINDOW = 2000
+_SERVICE_ALPHA = 0.2
+
+# Колбэк прогресса: (позиция в очереди, 0 — уже рендерится; оценка оставшегося времени в секундах).
+ProgressCallback = Callable[[int, float], Awaitable[None]]
+
+# Время, проведённое хендлером в ожидании рендера: вычитается из латентности interactive-лейна.
+render_wait: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("render_wait", default=None)
+
+
+class RenderRejected(Exception):
+    """Render was not admitted: the queue is full or low-priority work is being shed."""
+
+
+@dataclass
+class _RenderJob:
+    func: Callable[..., Any]
+    args: tuple
+    kwargs: Dict[str, Any]
+    high_priority: bool
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+
+
+class LatencyTracker:
+    def __init__(self, window: int = _LATENCY_WINDOW) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class RenderScheduler:
+    """Two lanes: interactive handlers run immediately, renders go through a bounded queue.
+
+    Pro users are served ``pro_weight`` times as often as free users while both are waiting.
+    Free-tier jobs are shed once their queue wait exceeds ``slo_seconds``.
+
+    A moving average of render time gives queued jobs a position and an ETA. Progress callbacks
+    run at most every ``progress_interval`` seconds per job, and less often when the queue is long,
+    so that all jobs together report no more than ``progress_rate`` times per second.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 2,
+        max_queue: int = 100,
+        slo_seconds: float = 20.0,
+        pro_weight: int = 3,
+        progress_interval: float = 3.0,
+        progress_rate: float = 10.0,
+        service_estimate: float = 2.0,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.slo_seconds = slo_seconds
+        self.pro_weight = max(1, pro_weight)
+        self.progress_interval = progress_interval
+        self.progress_rate = progress_rate
+        self.service_time = service_estimate
+        self._high: Deque[_RenderJob] = deque()
+        self._low: Deque[_RenderJob] = deque()
+        self._credits = self.pro_weight
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self.active = 0
+        self.shed = 0
+        self.rejected = 0
+        self.completed = 0
+        self.latency: Dict[str, LatencyTracker] = {INTERACTIVE: LatencyTracker(), RENDER: LatencyTracker()}
+        self.queue_wait = LatencyTracker()
+
+    @property
+    def queued(self) -> int:
+        return len(self._high) + len(self._low)
+
+    def _ensure_workers(self) -> None:
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def _oldest_wait(self) -> float:
+        waiting = [queue[0].enqueued_at for queue in (self._high, self._low) if queue]
+        return time.monotonic() - min(waiting) if waiting else 0.0
+
+    def observe(self, lane: str, seconds: float) -> None:
+        self.latency[lane].observe(seconds)
+
+    def _ahead(self, job: _RenderJob) -> int:
+        if job.high_priority:
+            index = self._high.index(job)
+            # На каждые pro_weight задач Pro планировщик берёт одну Free.
+            return index + min(len(self._low), index // self.pro_weight)
+        index = self._low.index(job)
+        return index + min(len(self._high), (index + 1) * self.pro_weight)
+
+    def estimate(self, job: _RenderJob) -> Tuple[int, float]:
+        """``(position, seconds left)``; position 0 means the job is already rendering."""
+
+        if job.started_at is not None:
+            return 0, max(0.0, self.service_time - (time.monotonic() - job.started_at))
+        ahead = self._ahead(job)
+        # Пока заняты все воркеры, очередь продвигается на concurrency задач за один рендер.
+        rounds = (ahead + self.active) // self.concurrency
+        return ahead + 1, (rounds + 1) * self.service_time
+
+    def _progress_delay(self) -> float:
+        return max(self.progress_interval, self.queued / self.progress_rate if self.progress_rate > 0 else 0.0)
+
+    async def _report_progress(self, job: _RenderJob, progress: ProgressCallback) -> None:
+        reported = False
+        try:
+            while True:
+                await asyncio.sleep(self._progress_delay())
+                if job.future.done():
+                    return
+                position, eta = self.estimate(job)
+                if position == 0 and not reported:
+                    # Рендер начался раньше первого отчёта — статус очереди не нужен.
+                    return
+                await progress(position, eta)
+                reported = True
+                if position == 0:
+                    return
+        except Exception:
+            logging.exception("Не удалось обновить статус очереди рендера")
+
+    async def submit(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        high_priority: bool = False,
+        progress: Optional[ProgressCallback] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Run ``func`` in a worker thread once admitted; raises ``RenderRejected`` if shed.
+
+        ``progress`` is called with the queue position and ETA while the job waits, and once more
+        with position 0 when it starts rendering after having been reported as queued.
+        """
+
+        self._ensure_workers()
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RenderRejected("render queue is full")
+        if not high_priority and self._oldest_wait() > self.slo_seconds:
+            self.shed += 1
+            raise RenderRejected("render queue latency exceeds SLO")
+
+        job = _RenderJob(
+            func=func,
+            args=args,
+            kwargs=kwargs,
+            high_priority=high_priority,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        (self._high if high_priority else self._low).append(job)
+        self._wakeup.set()
+        reporter = asyncio.create_task(self._report_progress(job, progress)) if progress is not None else None
+
+        started = time.monotonic()
+        try:
+            return await job.future
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            waited = render_wait.get()
+            if waited is not None:
+                waited[0] += time.monotonic() - started
+
+    def _next_job(self) -> Optional[_RenderJob]:
+        while self._low and self._is_stale(self._low[0]):
+            self._shed(self._low.popleft())
+        if self._high and (self._credits > 0 or not self._low):
+            self._credits -= 1
+            return self._high.popleft()
+        if self._low:
+            self._credits = self.pro_weight
+            return self._low.popleft()
+        return None
+
+    def _is_stale(self, job: _RenderJob) -> bool:
+        return time.monotonic() - job.enqueued_at > self.slo_seconds
+
+    def _shed(self, job: _RenderJob) -> None:
+        self.shed += 1
+        if not job.future.done():
+            job.future.set_exception(RenderRejected("render shed: queue latency exceeds SLO"))
+
+    async def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if job.future.cancelled():
+                continue
+            waited = time.monotonic() - job.enqueued_at
+            self.queue_wait.observe(waited)
+            RENDER_QUEUE_SECONDS.observe(waited)
+            self.active += 1
+            job.started_at = time.monotonic()
+            outcome = "ok"
+            try:
+                result = await asyncio.to_thread(job.func, *job.args, **job.kwargs)
+            except Exception as error:
+                outcome = "error"
+                if not job.future.done():
+                    job.future.set_exception(error)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.active -= 1
+                self.completed += 1
+                finished = time.monotonic()
+                self.service_time += _SERVICE_ALPHA * (finished - job.started_at - self.service_time)
+                elapsed = finished - job.enqueued_at
+                self.observe(RENDER, elapsed)
+                RENDER_SECONDS.observe(elapsed, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "service_time": round(self.service_time, 3),
+            "p99": {lane: round(tracker.percentile(99), 3) for lane, tracker in self.latency.items()},
+        }
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logging.info("Планировщик рендера остановлен: %s", self.stats())
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+_DEFAULT_TTL = 5 * 60  # 5 minutes
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task
+    started_at: float
+
+
+class SingleFlight:
+    """Runs at most one task per (user, operation); duplicates join it or are dropped."""
+
+    def __init__(self, ttl: float = _DEFAULT_TTL) -> None:
+        self.ttl = ttl
+        self._flights: Dict[Tuple[int, str], _Flight] = {}
+        self.started = 0
+        self.joined = 0
+        self.dropped = 0
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, flight in self._flights.items() if now - flight.started_at > self.ttl]
+        for key in expired:
+            # Зависшую задачу не отменяем, но больше не блокируем ею новые запросы.
+            self._flights.pop(key, None)
+
+    def is_running(self, user_id: int, operation: str) -> bool:
+        self._expire()
+        return (user_id, operation) in self._flights
+
+    async def run(
+        self,
+        user_id: int,
+        operation: str,
+        factory: Callable[[], Awaitable[Any]],
+        join: bool = False,
+    ) -> Tuple[bool, Any]:
+        """Return ``(True, result)`` for the leader, ``(False, result|None)`` for duplicates."""
+
+        self._expire()
+        key = (user_id, operation)
+        flight = self._flights.get(key)
+        if flight is not None:
+            if not join:
+                self.dropped += 1
+                return False, None
+            self.joined += 1
+            return False, await asyncio.shield(flight.task)
+
+        task = asyncio.ensure_future(factory())
+        flight = _Flight(task=task, started_at=time.monotonic())
+        self._flights[key] = flight
+
+        def _release(_: asyncio.Task) -> None:
+            if self._flights.get(key) is flight:
+                self._flights.pop(key, None)
+
+        task.add_done_callback(_release)
+        self.started += 1
+        return True, await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "joined": self.joined,
+            "dropped": self.dropped,
+            "avoided": self.joined + self.dropped,
+        }
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from .analytics import AnalyticsEntry, AnalyticsService
+from .storage import StorageService, UserProfile
+
+SNAPSHOT_PATH = Path(__file__).resolve().parent.parent / "data" / "state_snapshot.json.gz"
+_VERSION = 1
+
+
+def _dump_profiles(storage: StorageService) -> list:
+    return [
+        {
+            "user_id": profile.user_id,
+            "is_pro": profile.is_pro,
+            "documents_generated": profile.documents_generated,
+            "last_generation_date": profile.last_generation_date.isoformat() if profile.last_generation_date else None,
+            "history": list(profile.history or ()),
+        }
+        for profile in storage.user_profiles.values()
+    ]
+
+
+def _dump_fsm(fsm_storage: MemoryStorage) -> list:
+    return [
+        {
+            "key": [key.bot_id, key.chat_id, key.user_id, key.thread_id, key.destiny],
+            "state": record.state,
+            "data": record.data,
+        }
+        for key, record in fsm_storage.storage.items()
+        if record.state is not None or record.data
+    ]
+
+
+def save_snapshot(
+    path: Path,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    fsm_storage: Optional[MemoryStorage] = None,
+) -> Dict[str, int]:
+    """Write in-memory profiles, analytics, funnel counters and FSM state; returns item counts.
+
+    The file is written next to the target and renamed over it, so a crash mid-write never leaves
+    a truncated snapshot behind.
+    """
+
+    payload = {
+        "version": _VERSION,
+        "saved_at": datetime.utcnow().isoformat(),
+        "profiles": _dump_profiles(storage),
+        "document_counter": dict(storage.document_counter),
+        "events": [
+            [entry.event, entry.user_id, entry.payload, entry.created_at.isoformat()] for entry in analytics.events
+        ],
+        "errors": list(analytics.errors),
+        "totals": analytics.dump_totals(),
+        "funnel": analytics.funnel.dump(),
+        "fsm": _dump_fsm(fsm_storage) if fsm_storage is not None else [],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    with gzip.open(temporary, "wt", encoding="utf-8") as handle:
+        json.dump(payload, handle, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(temporary, path)
+    return {
+        "profiles": len(payload["profiles"]),
+        "events": len(payload["events"]),
+        "funnels": len(payload["funnel"]),
+        "fsm": len(payload["fsm"]),
+    }
+
+
+def load_snapshot(
+    path: Path,
+    storage: StorageService,
+    analytics: AnalyticsService,
+    fsm_storage: Optional[MemoryStorage] = None,
+) -> Optional[Dict[str, int]]:
+    """Restore a snapshot written by :func:`save_snapshot`; ``None`` if there is none or it is unreadable."""
+
+    if not path.exists():
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            payload: Dict[str, Any] = json.load(handle)
+    except (OSError, ValueError):
+        logging.exception("Не удалось прочитать снимок состояния %s", path)
+        return None
+    if payload.get("version") != _VERSION:
+        logging.warning("Снимок состояния %s другой версии, пропускаем", path)
+        return None
+
+    for item in payload["profiles"]:
+        last_date = item["last_generation_date"]
+        storage.user_profiles[item["user_id"]] = UserProfile(
+            user_id=item["user_id"],
+            is_pro=item["is_pro"],
+            documents_generated=item["documents_generated"],
+            last_generation_date=date.fromisoformat(last_date) if last_date else None,
+            history=item["history"],
+        )
+    for document, count in payload["document_counter"].items():
+        storage.document_counter[document] += count
+    analytics.restore(
+        [
+            AnalyticsEntry(event=event, user_id=user_id, payload=data, created_at=datetime.fromisoformat(created_at))
+            for event, user_id, data, created_at in payload["events"]
+        ],
+        payload["errors"],
+        payload.get("totals"),
+    )
+    analytics.funnel.restore(payload["funnel"])
+    if fsm_storage is not None:
+        for item in payload["fsm"]:
+            record = fsm_storage.storage[StorageKey(*item["key"])]
+            record.state = item["state"]
+            record.data = item["data"]
+    return {
+        "profiles": len(payload["profiles"]),
+        "events": len(payload["events"]),
+        "funnels": len(payload["funnel"]),
+        "fsm": len(payload["fsm"]),
+    }
@@ -7,6 +7,12 @@ from typing import Dict, List, Optional
 
 from ..config import Settings
 from .analytics import AnalyticsService
+from .artifacts import ArtifactArchive
+from .counters import SharedCounterStore
+from .document_store import DocumentContextStore
+from .download_tokens import DownloadTokens, derive_secret
+from .last_documents import GeneratedDocument, LastDocumentStore
+from .saved_fields import SavedFieldStore
 
 
 @dataclass
@@ -18,25 +24,51 @@ class UserProfile:
     history: List[str] | None = None
 
 
-@dataclass
-class GeneratedDocument:
-    code: str
-    title: str
-    template_name: str
-    context: Dict[str, str]
-
-
 class StorageService:
-    def __init__(self, settings: Settings, analytics: AnalyticsService) -> None:
+    def __init__(
+        self,
+        settings: Settings,
+        analytics: AnalyticsService,
+        counters: SharedCounterStore | None = None,
+    ) -> None:
         self.settings = settings
         self.analytics = analytics
+        self.counters = counters
         self.user_profiles: Dict[int, UserProfile] = {}
         self.document_counter: Dict[str, int] = defaultdict(int)
-        self._last_documents: Dict[int, GeneratedDocument] = {}
+        self._last_documents = LastDocumentStore(
+            max_entries=settings.last_documents_max_entries,
+            ttl=settings.last_documents_ttl,
+            compress=settings.last_documents_compress,
+            disk_ttl=settings.last_documents_disk_ttl_days * 24 * 60 * 60,
+            db_path=settings.data_path("last_documents.db"),
+        )
+        # Архив файлов и контексты скачивания общие для всех ботов процесса: файлы адресуются
+        # содержимым, а история и file_id разделены по пространству имён бота.
+        self.artifacts = ArtifactArchive(
+            max_bytes=settings.artifact_archive_max_mb * 1024 * 1024,
+            per_user=settings.artifact_archive_per_user,
+            namespace=settings.tenant,
+            db_path=settings.data_path("artifacts.db", shared=True),
+        )
+        download_ttl = settings.download_ttl_days * 24 * 60 * 60
+        self.contexts = DocumentContextStore(
+            ttl=download_ttl, db_path=settings.data_path("document_contexts.db", shared=True)
+        )
+        secret = settings.download_token_secret
+        self.download_tokens = DownloadTokens(
+            secret.encode("utf-8") if secret else derive_secret(settings.bot_token), ttl=download_ttl
+        )
+        self.saved_fields = SavedFieldStore(
+            ttl=settings.saved_fields_ttl_days * 24 * 60 * 60, db_path=settings.data_path("saved_fields.db")
+        )
+        self.usage_db_path = settings.data_path("usage_limits.db")
 
     def get_profile(self, user_id: int) -> UserProfile:
         if user_id not in self.user_profiles:
             self.user_profiles[user_id] = UserProfile(user_id=user_id, history=[])
+            if self.counters:
+                self.counters.incr("users", str(user_id))
         return self.user_profiles[user_id]
 
     def can_generate(self, user_id: int) -> bool:
@@ -52,22 +84,40 @@ class StorageService:
         profile.documents_generated += 1
         profile.history.append(document)
         self.document_counter[document] += 1
+        if self.counters:
+            self.counters.incr("documents", document)
         self.analytics.log_event("document_generated", user_id, {"document": document})
 
-    def remember_last_document(
+    async def remember_last_document(
         self, user_id: int, generated: GeneratedDocument
     ) -> None:
-        self._last_documents[user_id] = generated
+        await self._last_documents.put(user_id, generated)
 
-    def get_last_document(self, user_id: int) -> Optional[GeneratedDocument]:
-        return self._last_documents.get(user_id)
+    async def get_last_document(self, user_id: int) -> Optional[GeneratedDocument]:
+        return await self._last_documents.get(user_id)
 
-    def activate_pro(self, user_id: int) -> None:
-        profile = self.get_profile(user_id)
-        profile.is_pro = True
-        self.analytics.log_event("subscription_upgraded", user_id, {})
+    async def flush(self) -> int:
+        """Write resident last-document contexts to their disk tier; returns how many were written."""
+
+        return await self._last_documents.flush()
+
+    def apply_subscriptions(self, changes: Dict[int, bool], log_events: bool = True) -> None:
+        """Set ``is_pro`` from processed payment events; ``log_events=False`` when restoring state."""
+
+        for user_id, is_pro in changes.items():
+            profile = self.get_profile(user_id)
+            profile.is_pro = is_pro
+            if log_events:
+                event = "subscription_upgraded" if is_pro else "subscription_cancelled"
+                self.analytics.log_event(event, user_id, {})
 
     def stats(self) -> Dict[str, int]:
+        if self.counters:
+            # В режиме нескольких воркеров локальные словари видят только свою долю чатов.
+            return {
+                "users": self.counters.count("users"),
+                "generations": self.counters.total("documents"),
+            }
         total_users = len(self.user_profiles)
         total_generations = sum(self.document_counter.values())
         return {
@@ -76,4 +126,6 @@ class StorageService:
         }
 
     def top_documents(self, limit: int = 5) -> List[tuple[str, int]]:
+        if self.counters:
+            return self.counters.top("documents", limit)
         return sorted(self.document_counter.items(), key=lambda item: item[1], reverse=True)[:limit]
@@ -1,12 +1,10 @@
 ﻿from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 
-from ..config import settings
 
-
-async def is_subscribed(bot: Bot, user_id: int) -> bool:
+async def is_subscribed(bot: Bot, channel_id: int, user_id: int) -> bool:
     try:
-        member = await bot.get_chat_member(settings.main_channel_id, user_id)
+        member = await bot.get_chat_member(channel_id, user_id)
     except TelegramBadRequest:
         return False
 
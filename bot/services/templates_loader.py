@@ -1,8 +1,10 @@
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet
 
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
+_JINJA_MARKERS = ("{{", "{%", "{#")
+
 
 class TemplateLoader:
     def __init__(self, template_dir: Path) -> None:
@@ -13,7 +15,22 @@ class TemplateLoader:
             trim_blocks=True,
             lstrip_blocks=True,
         )
+        self._static_lines: Dict[str, FrozenSet[str]] = {}
 
     def render(self, template_name: str, context: Dict[str, Any]) -> str:
         template = self.env.get_template(template_name)
         return template.render(**context)
+
+    def static_lines(self, template_name: str) -> FrozenSet[str]:
+        """Template lines without variables or tags: rendered verbatim for every user."""
+
+        lines = self._static_lines.get(template_name)
+        if lines is None:
+            source, _, _ = self.env.loader.get_source(self.env, template_name)
+            lines = frozenset(
+                line.strip()
+                for line in source.splitlines()
+                if line.strip() and not any(marker in line for marker in _JINJA_MARKERS)
+            )
+            self._static_lines[template_name] = lines
+        return lines
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .scheduler import RenderRejected
+
+_SWEEP_EVERY = 1024
+
+
+class TokenBuckets:
+    """Per-key token buckets packed into two flat arrays.
+
+    A key costs one dict slot plus 12 bytes of array storage. Buckets that have refilled completely
+    carry no information, so they are periodically swept and their slots reused; memory tracks the
+    number of recently active users rather than everyone ever seen.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._slots: Dict[int, int] = {}
+        self._tokens = array("f")
+        self._updated = array("d")
+        self._free: List[int] = []
+        self._operations = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _slot(self, key: int, now: float) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+            self._tokens[slot] = self.burst
+            self._updated[slot] = now
+        else:
+            slot = len(self._tokens)
+            self._tokens.append(self.burst)
+            self._updated.append(now)
+        self._slots[key] = slot
+        return slot
+
+    def reserve(self, key: int, now: Optional[float] = None, max_delay: float = 0.0) -> Optional[float]:
+        """Take a token for ``key``.
+
+        Returns 0 when one is available, the wait in seconds when the next token arrives within
+        ``max_delay`` (it is reserved, so the caller must wait before acting), or ``None`` when denied.
+        """
+
+        now = time.monotonic() if now is None else now
+        self._operations += 1
+        if self._operations % _SWEEP_EVERY == 0:
+            self.sweep(now)
+        slot = self._slot(key, now)
+        tokens = min(self.burst, self._tokens[slot] + (now - self._updated[slot]) * self.rate)
+        self._updated[slot] = now
+        if tokens >= 1:
+            self._tokens[slot] = tokens - 1
+            return 0.0
+        wait = (1 - tokens) / self.rate if self.rate > 0 else float("inf")
+        if wait <= max_delay:
+            self._tokens[slot] = tokens - 1
+            return wait
+        self._tokens[slot] = tokens
+        return None
+
+    def refund(self, key: int) -> None:
+        """Return the token taken by the last successful :meth:`reserve` for ``key``."""
+
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._tokens[slot] = min(self.burst, self._tokens[slot] + 1)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Forget buckets that are full again; returns the number of released slots."""
+
+        now = time.monotonic() if now is None else now
+        full = [
+            key
+            for key, slot in self._slots.items()
+            if self._tokens[slot] + (now - self._updated[slot]) * self.rate >= self.burst
+        ]
+        for key in full:
+            self._free.append(self._slots.pop(key))
+        return len(full)
+
+
+class FloodGuard:
+    """Admission control for incoming updates: cheap and expensive per-user budgets.
+
+    Only admission lives here; how many renders run at once, in what order and what is shed under
+    load is up to :class:`~bot.services.scheduler.RenderScheduler`.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 8,
+        expensive_rate: float = 0.2,
+        expensive_burst: float = 3,
+        max_delay: float = 2.0,
+        notice_interval: float = 10.0,
+    ) -> None:
+        self.cheap = TokenBuckets(rate, burst)
+        self.expensive = TokenBuckets(expensive_rate, expensive_burst)
+        self.notices = TokenBuckets(1 / notice_interval if notice_interval > 0 else 0.0, 1)
+        self.max_delay = max_delay
+        self.passed = 0
+        self.delayed = 0
+        self.dropped = 0
+
+    def admit(self, user_id: int, expensive: bool) -> Optional[float]:
+        """Charge the user's budgets; returns the delay to apply before handling, or ``None`` to drop."""
+
+        now = time.monotonic()
+        wait = self.cheap.reserve(user_id, now, self.max_delay)
+        if wait is not None and expensive:
+            expensive_wait = self.expensive.reserve(user_id, now, self.max_delay)
+            if expensive_wait is None:
+                # Отброшенный апдейт не должен тратить и дешёвый бюджет.
+                self.cheap.refund(user_id)
+                wait = None
+            else:
+                wait = max(wait, expensive_wait)
+        if wait is None:
+            self.dropped += 1
+        elif wait > 0:
+            self.delayed += 1
+        return wait
+
+    def should_notify(self, user_id: int) -> bool:
+        return self.notices.reserve(user_id) is not None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self.cheap),
+            "passed": self.passed,
+            "delayed": self.delayed,
+            "dropped": self.dropped,
+        }
+
+
+@dataclass
+class RenderGate:
+    guard: FloodGuard
+    user_id: int
+    charged: bool
+
+
+# Бюджет текущего апдейта; задаёт FloodControlMiddleware (админы и выключенный антифлуд — без лимита).
+render_gate: contextvars.ContextVar[Optional[RenderGate]] = contextvars.ContextVar("render_gate", default=None)
+
+
+async def admit_render() -> None:
+    """Charge a render to the user's expensive budget unless the current update already paid it.
+
+    Covers renders started by updates admitted as cheap (a typed answer that completes the form, an
+    edited field); raises ``RenderRejected`` when the budget is spent.
+    """
+
+    gate = render_gate.get()
+    if gate is None or gate.charged:
+        return
+    wait = gate.guard.expensive.reserve(gate.user_id, max_delay=gate.guard.max_delay)
+    if wait is None:
+        gate.guard.dropped += 1
+        raise RenderRejected("expensive budget spent")
+    gate.charged = True
+    if wait > 0:
+        gate.guard.delayed += 1
+        await asyncio.sleep(wait)
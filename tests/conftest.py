@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# bot.config создаёт Settings при импорте; обязательным полям нужны значения.
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("MAIN_CHANNEL_ID", "-1")
+os.environ.setdefault("MAIN_CHANNEL_USERNAME", "channel")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,33 @@
+from bot.cluster import jump_hash, routing_key
+
+KEYS = range(-5000, 5000, 7)
+
+
+def test_jump_hash_stays_in_range():
+    for buckets in (1, 2, 5, 16):
+        assert all(0 <= jump_hash(key, buckets) < buckets for key in KEYS)
+
+
+def test_jump_hash_is_deterministic():
+    assert [jump_hash(key, 8) for key in KEYS] == [jump_hash(key, 8) for key in KEYS]
+
+
+def test_growing_the_pool_only_moves_keys_to_the_new_worker():
+    for buckets in (1, 3, 7):
+        for key in KEYS:
+            before, after = jump_hash(key, buckets), jump_hash(key, buckets + 1)
+            assert after in (before, buckets)
+
+
+def test_growing_the_pool_moves_about_its_share_of_keys():
+    moved = sum(jump_hash(key, 4) != jump_hash(key, 5) for key in KEYS)
+    assert 0.1 < moved / len(KEYS) < 0.3
+
+
+def test_routing_key_prefers_chat_over_user():
+    update = {"update_id": 1, "message": {"chat": {"id": -100}, "from": {"id": 42}}}
+    assert routing_key(update) == -100
+    callback = {"update_id": 2, "callback_query": {"from": {"id": 42}, "message": {"chat": {"id": 7}}}}
+    assert routing_key(callback) == 7
+    assert routing_key({"update_id": 3, "callback_query": {"from": {"id": 42}}}) == 42
+    assert routing_key({"update_id": 4}) == 4
@@ -0,0 +1,50 @@
+import base64
+
+from bot.services.download_tokens import CALLBACK_PREFIX, DownloadTokens, derive_secret
+
+KEY = bytes(range(16))
+
+
+def _tokens(ttl=3600):
+    return DownloadTokens(derive_secret("1:test"), ttl=ttl)
+
+
+def _flip(token: str, position: int) -> str:
+    body = token[len(CALLBACK_PREFIX) :]
+    raw = bytearray(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4)))
+    raw[position] ^= 0x01
+    return CALLBACK_PREFIX + base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode("ascii")
+
+
+def test_issued_token_verifies_for_its_owner_and_fits_callback_data():
+    tokens = _tokens()
+    for fmt in ("pdf", "docx"):
+        token = tokens.issue(42, fmt, KEY)
+        assert token.startswith(CALLBACK_PREFIX)
+        assert len(token.encode("utf-8")) <= 64
+        assert tokens.verify(token, 42) == (fmt, KEY)
+
+
+def test_other_user_and_expired_tokens_are_rejected():
+    assert _tokens().verify(_tokens().issue(42, "pdf", KEY), 43) is None
+    assert _tokens(ttl=-1).verify(_tokens(ttl=-1).issue(42, "pdf", KEY), 42) is None
+
+
+def test_any_flipped_bit_is_rejected():
+    tokens = _tokens()
+    token = tokens.issue(42, "docx", KEY)
+    # Формат, владелец, срок, ключ контекста и сама подпись.
+    for position in (0, 8, 12, 20, 29, 38):
+        assert tokens.verify(_flip(token, position), 42) is None
+
+
+def test_token_of_another_bot_is_rejected():
+    token = DownloadTokens(derive_secret("2:other")).issue(42, "pdf", KEY)
+    assert _tokens().verify(token, 42) is None
+
+
+def test_malformed_tokens_are_rejected():
+    tokens = _tokens()
+    token = tokens.issue(42, "pdf", KEY)
+    for data in ("", CALLBACK_PREFIX, CALLBACK_PREFIX + "!!!", token[:-4], token + "AAAA"):
+        assert tokens.verify(data, 42) is None
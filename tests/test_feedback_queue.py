@@ -0,0 +1,121 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+
+from bot.services import feedback_queue
+from bot.services.feedback_queue import FeedbackQueue
+
+
+class FlakyBot:
+    """Stands in for ``Bot``: the listed sends (1-based) fail, everything else is recorded."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = 0
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.calls += 1
+        if self.calls in self.failing:
+            raise RuntimeError("telegram is down")
+        self.sent.append((chat_id, text))
+
+
+def _rows(queue):
+    with closing(sqlite3.connect(queue.db_path)) as conn:
+        return conn.execute(
+            """
+            SELECT attempts, next_attempt_at, delivered_at IS NOT NULL, failed
+            FROM feedback_deliveries ORDER BY feedback_id
+            """
+        ).fetchall()
+
+
+def _make_due(queue):
+    with closing(sqlite3.connect(queue.db_path)) as conn:
+        conn.execute("UPDATE feedback_deliveries SET next_attempt_at = 0 WHERE delivered_at IS NULL")
+        conn.commit()
+
+
+def test_failed_delivery_backs_off_exponentially_then_gives_up(tmp_path):
+    queue = FeedbackQueue([10], send_rate=0, max_attempts=3, db_path=tmp_path / "feedback.db")
+    bot = FlakyBot(failing={1, 2, 3})
+
+    async def scenario():
+        await queue.enqueue(1, "user", "nda", "Отзыв")
+        delays = []
+        for _ in range(3):
+            started = time.time()
+            assert await queue.deliver_due(bot) == 0
+            delays.append(round(_rows(queue)[0][1] - started))
+            _make_due(queue)
+        return delays, await queue.deliver_due(bot)
+
+    delays, delivered_after_giving_up = asyncio.run(scenario())
+    assert delays == [5, 10, 20]
+    assert delivered_after_giving_up == 0
+    attempts, _, delivered, failed = _rows(queue)[0]
+    assert (attempts, delivered, failed) == (3, 0, 1)
+    assert bot.calls == 3
+
+
+def test_backoff_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(feedback_queue, "_MAX_BACKOFF", 30)
+    queue = FeedbackQueue([10], send_rate=0, max_attempts=10, db_path=tmp_path / "feedback.db")
+    bot = FlakyBot(failing=range(1, 10))
+
+    async def scenario():
+        await queue.enqueue(1, "user", "nda", "Отзыв")
+        delays = []
+        for _ in range(4):
+            started = time.time()
+            await queue.deliver_due(bot)
+            delays.append(round(_rows(queue)[0][1] - started))
+            _make_due(queue)
+        return delays
+
+    # Четвёртая попытка: 5 * 2**3 = 40 с, но не больше лимита.
+    assert asyncio.run(scenario()) == [5, 10, 20, 30]
+    with closing(sqlite3.connect(queue.db_path)) as conn:
+        assert conn.execute("SELECT last_error FROM feedback_deliveries").fetchone()[0] == "telegram is down"
+
+
+def test_retry_succeeds_and_is_counted(tmp_path):
+    queue = FeedbackQueue([10, 20], send_rate=0, db_path=tmp_path / "feedback.db")
+    bot = FlakyBot(failing={1})
+
+    async def scenario():
+        await queue.enqueue(1, "user", "nda", "Отзыв")
+        first = await queue.deliver_due(bot)
+        _make_due(queue)
+        second = await queue.deliver_due(bot)
+        return first, second, await queue.stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert (first, second) == (1, 1)
+    assert stats == {"pending": 0, "delivered": 2, "failed": 0, "retries": 1}
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [10, 20]
+
+
+def test_digest_retry_resends_only_the_unsent_part(tmp_path, monkeypatch):
+    monkeypatch.setattr(feedback_queue, "_MESSAGE_LIMIT", 300)
+    queue = FeedbackQueue([10], digest_interval=60, send_rate=0, db_path=tmp_path / "feedback.db")
+    bot = FlakyBot(failing={2})
+
+    async def scenario():
+        for user_id in range(6):
+            await queue.enqueue(user_id, f"user{user_id}", "nda", "Длинный отзыв " * 5)
+        with closing(sqlite3.connect(queue.db_path)) as conn:
+            conn.execute("UPDATE feedback SET created_at = created_at - 120")
+            conn.commit()
+        first = await queue.deliver_due(bot)
+        _make_due(queue)
+        second = await queue.deliver_due(bot)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert 0 < first < 6
+    assert first + second == 6
+    delivered_users = [line for _, text in bot.sent for line in text.splitlines() if line.startswith("<code>")]
+    assert len(delivered_users) == len(set(delivered_users)) == 6
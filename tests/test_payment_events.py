@@ -0,0 +1,103 @@
+import asyncio
+
+from bot.services.payment_events import (
+    SUBSCRIPTION_ACTIVATED,
+    SUBSCRIPTION_CANCELLED,
+    PaymentEvent,
+    PaymentInbox,
+)
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, changed):
+        self.calls.append(dict(changed))
+
+
+def _event(event_id, kind, user_id, occurred_at):
+    return PaymentEvent(event_id=event_id, kind=kind, user_id=user_id, occurred_at=occurred_at)
+
+
+def test_duplicate_delivery_is_stored_once(tmp_path):
+    inbox = PaymentInbox(db_path=tmp_path / "payments.db")
+    # Второй процесс с тем же файлом видит те же ID.
+    other = PaymentInbox(db_path=tmp_path / "payments.db")
+    apply = Recorder()
+
+    async def scenario():
+        event = _event("evt-1", SUBSCRIPTION_ACTIVATED, 7, 100.0)
+        stored = [await inbox.put(event), await inbox.put(event), await other.put(event)]
+        processed = await inbox.process_pending(apply)
+        return stored, processed, await inbox.stats(), await inbox.subscriptions()
+
+    stored, processed, stats, subscriptions = asyncio.run(scenario())
+    assert stored == [True, False, False]
+    assert processed == 1
+    assert (stats["received"], stats["duplicates"], stats["pending"]) == (1, 1, 0)
+    assert apply.calls == [{7: True}]
+    assert subscriptions == {7: True}
+
+
+def test_redelivery_after_processing_changes_nothing(tmp_path):
+    inbox = PaymentInbox(db_path=tmp_path / "payments.db")
+    apply = Recorder()
+
+    async def scenario():
+        event = _event("evt-1", SUBSCRIPTION_ACTIVATED, 7, 100.0)
+        await inbox.put(event)
+        await inbox.process_pending(apply)
+        again = await inbox.put(event)
+        return again, await inbox.process_pending(apply)
+
+    assert asyncio.run(scenario()) == (False, 0)
+    assert apply.calls == [{7: True}]
+
+
+def test_latest_event_per_user_wins_within_a_batch(tmp_path):
+    inbox = PaymentInbox(db_path=tmp_path / "payments.db")
+    apply = Recorder()
+
+    async def scenario():
+        await inbox.put(_event("a", SUBSCRIPTION_CANCELLED, 7, 300.0))
+        await inbox.put(_event("b", SUBSCRIPTION_ACTIVATED, 7, 200.0))
+        await inbox.put(_event("c", SUBSCRIPTION_ACTIVATED, 8, 100.0))
+        await inbox.put(_event("d", "invoice.paid", 9, 100.0))
+        processed = await inbox.process_pending(apply)
+        return processed, await inbox.subscriptions()
+
+    processed, subscriptions = asyncio.run(scenario())
+    assert processed == 4
+    # Первое записанное состояние пользователя передаётся всегда, даже отмена.
+    assert apply.calls == [{7: False, 8: True}]
+    assert subscriptions == {7: False, 8: True}
+
+
+def test_late_older_event_does_not_override_a_newer_state(tmp_path):
+    inbox = PaymentInbox(db_path=tmp_path / "payments.db")
+    apply = Recorder()
+
+    async def scenario():
+        await inbox.put(_event("new", SUBSCRIPTION_CANCELLED, 7, 200.0))
+        await inbox.put(_event("old-activation", SUBSCRIPTION_ACTIVATED, 7, 50.0))
+        await inbox.process_pending(apply)
+        await inbox.put(_event("late", SUBSCRIPTION_ACTIVATED, 7, 100.0))
+        await inbox.process_pending(apply)
+        return await inbox.subscriptions()
+
+    assert asyncio.run(scenario()) == {7: False}
+    assert apply.calls == [{7: False}]
+
+
+def test_batches_respect_batch_size(tmp_path):
+    inbox = PaymentInbox(batch_size=2, db_path=tmp_path / "payments.db")
+    apply = Recorder()
+
+    async def scenario():
+        for user_id in range(5):
+            await inbox.put(_event(f"evt-{user_id}", SUBSCRIPTION_ACTIVATED, user_id, 100.0))
+        return [await inbox.process_pending(apply) for _ in range(4)]
+
+    assert asyncio.run(scenario()) == [2, 2, 1, 0]
+    assert sorted(user_id for call in apply.calls for user_id in call) == [0, 1, 2, 3, 4]
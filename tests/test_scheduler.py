@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import pytest
+
+from bot.services.scheduler import RenderRejected, RenderScheduler
+
+
+def _blocker(gate: threading.Event) -> str:
+    gate.wait(5)
+    return "blocker"
+
+
+async def _occupy(scheduler: RenderScheduler, gate: threading.Event) -> asyncio.Task:
+    """Start a job that holds the only worker until ``gate`` is set."""
+
+    task = asyncio.create_task(scheduler.submit(_blocker, gate))
+    while not scheduler.active:
+        await asyncio.sleep(0.01)
+    return task
+
+
+def test_pro_jobs_are_served_pro_weight_times_per_free_job():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, pro_weight=2)
+        gate = threading.Event()
+        blocker = await _occupy(scheduler, gate)
+        order = []
+        jobs = [
+            asyncio.create_task(scheduler.submit(order.append, name, high_priority=name.startswith("pro")))
+            for name in ("free1", "free2", "pro1", "pro2", "pro3")
+        ]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(blocker, *jobs)
+        await scheduler.close()
+        return order
+
+    assert asyncio.run(scenario()) == ["pro1", "pro2", "free1", "pro3", "free2"]
+
+
+def test_full_queue_rejects_new_jobs():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, max_queue=1)
+        gate = threading.Event()
+        blocker = await _occupy(scheduler, gate)
+        queued = asyncio.create_task(scheduler.submit(str, 1))
+        await asyncio.sleep(0)
+        with pytest.raises(RenderRejected):
+            await scheduler.submit(str, 2, high_priority=True)
+        gate.set()
+        result = await queued
+        await blocker
+        await scheduler.close()
+        return result, scheduler.stats()["rejected"]
+
+    assert asyncio.run(scenario()) == ("1", 1)
+
+
+def test_free_jobs_are_shed_past_the_slo_but_pro_jobs_are_not():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, slo_seconds=0.05)
+        gate = threading.Event()
+        blocker = await _occupy(scheduler, gate)
+        stale = asyncio.create_task(scheduler.submit(str, "stale"))
+        await asyncio.sleep(0.1)
+        with pytest.raises(RenderRejected):
+            await scheduler.submit(str, "late")
+        pro = asyncio.create_task(scheduler.submit(str, "pro", high_priority=True))
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(stale, pro, return_exceptions=True)
+        await blocker
+        await scheduler.close()
+        return results, scheduler.stats()["shed"]
+
+    (stale, pro), shed = asyncio.run(scenario())
+    assert isinstance(stale, RenderRejected)
+    assert pro == "pro"
+    assert shed == 2
+
+
+def test_queued_job_gets_a_position_and_eta():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, service_estimate=2.0)
+        gate = threading.Event()
+        blocker = await _occupy(scheduler, gate)
+        reports = []
+
+        async def progress(position, eta):
+            reports.append((position, eta))
+
+        scheduler.progress_interval = 0.01
+        job = asyncio.create_task(scheduler.submit(str, "x", progress=progress))
+        while not reports:
+            await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(blocker, job)
+        await scheduler.close()
+        return reports[0]
+
+    assert asyncio.run(scenario()) == (1, 4.0)
@@ -0,0 +1,78 @@
+import asyncio
+
+from bot.services.single_flight import SingleFlight
+
+
+def test_duplicates_are_dropped_or_join_the_leader():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def render():
+            calls.append(1)
+            await release.wait()
+            return "pdf"
+
+        leader = asyncio.create_task(flights.run(1, "finalize", render))
+        await asyncio.sleep(0)
+        dropped = await flights.run(1, "finalize", render)
+        joiner = asyncio.create_task(flights.run(1, "finalize", render, join=True))
+        other_user = asyncio.create_task(flights.run(2, "finalize", render))
+        await asyncio.sleep(0)
+        release.set()
+        return flights, calls, dropped, await leader, await joiner, await other_user
+
+    flights, calls, dropped, leader, joiner, other_user = asyncio.run(scenario())
+    assert dropped == (False, None)
+    assert leader == (True, "pdf")
+    assert joiner == (False, "pdf")
+    assert other_user == (True, "pdf")
+    assert len(calls) == 2
+    assert flights.stats() == {"in_flight": 0, "started": 2, "joined": 1, "dropped": 1, "avoided": 2}
+
+
+def test_joiner_sees_the_leader_error():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise RuntimeError("render failed")
+
+        leader = asyncio.create_task(flights.run(1, "docx", failing))
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(flights.run(1, "docx", failing, join=True))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(leader, joiner, return_exceptions=True), flights.is_running(1, "docx")
+
+    results, running = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not running
+
+
+def test_stuck_flight_stops_blocking_after_ttl():
+    async def scenario():
+        flights = SingleFlight(ttl=0.05)
+        stuck = asyncio.Event()
+
+        async def hang():
+            await stuck.wait()
+
+        async def quick():
+            return "ok"
+
+        hung = asyncio.create_task(flights.run(1, "finalize", hang))
+        await asyncio.sleep(0)
+        blocked = await flights.run(1, "finalize", quick)
+        await asyncio.sleep(0.1)
+        retried = await flights.run(1, "finalize", quick)
+        stuck.set()
+        await hung
+        return blocked, retried
+
+    blocked, retried = asyncio.run(scenario())
+    assert blocked == (False, None)
+    assert retried == (True, "ok")
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from bot.services.scheduler import RenderRejected
+from bot.services.throttling import FloodGuard, RenderGate, TokenBuckets, admit_render, render_gate
+
+
+def test_burst_then_refill_at_rate():
+    buckets = TokenBuckets(rate=2.0, burst=3)
+    assert [buckets.reserve(1, now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.reserve(1, now=0.0) is None
+    # Через 0.5 с при 2 токенах в секунду накопился ровно один.
+    assert buckets.reserve(1, now=0.5) == 0.0
+    assert buckets.reserve(1, now=0.5) is None
+
+
+def test_refill_never_exceeds_burst():
+    buckets = TokenBuckets(rate=10.0, burst=2)
+    buckets.reserve(1, now=0.0)
+    assert [buckets.reserve(1, now=100.0) for _ in range(3)] == [0.0, 0.0, None]
+
+
+def test_short_wait_is_reserved_and_returned():
+    buckets = TokenBuckets(rate=1.0, burst=1)
+    assert buckets.reserve(1, now=0.0) == 0.0
+    assert buckets.reserve(1, now=0.25, max_delay=1.0) == pytest.approx(0.75)
+    # Зарезервированный токен уже занят: следующий ждёт ещё секунду.
+    assert buckets.reserve(1, now=0.25, max_delay=1.0) is None
+    assert buckets.reserve(1, now=0.25, max_delay=2.0) == pytest.approx(1.75)
+
+
+def test_keys_have_separate_buckets():
+    buckets = TokenBuckets(rate=1.0, burst=1)
+    assert buckets.reserve(1, now=0.0) == 0.0
+    assert buckets.reserve(2, now=0.0) == 0.0
+    assert buckets.reserve(1, now=0.0) is None
+
+
+def test_sweep_releases_full_buckets_and_reuses_slots():
+    buckets = TokenBuckets(rate=1.0, burst=2)
+    for key in range(5):
+        buckets.reserve(key, now=0.0)
+    assert len(buckets) == 5
+    assert buckets.sweep(now=0.5) == 0
+    assert buckets.sweep(now=1.0) == 5
+    assert len(buckets) == 0
+    buckets.reserve(99, now=1.0)
+    assert len(buckets._tokens) == 5
+
+
+def test_refund_returns_one_token_up_to_burst():
+    buckets = TokenBuckets(rate=0.0, burst=2)
+    buckets.reserve(1, now=0.0)
+    buckets.reserve(1, now=0.0)
+    buckets.refund(1)
+    assert buckets.reserve(1, now=0.0) == 0.0
+    buckets.refund(1)
+    buckets.refund(1)
+    buckets.refund(1)
+    assert [buckets.reserve(1, now=0.0) for _ in range(3)] == [0.0, 0.0, None]
+
+
+def test_expensive_denial_does_not_spend_the_cheap_budget():
+    guard = FloodGuard(rate=0.0, burst=3, expensive_rate=0.0, expensive_burst=1, max_delay=0)
+    assert guard.admit(1, expensive=True) == 0.0
+    assert guard.admit(1, expensive=True) is None
+    assert guard.admit(1, expensive=True) is None
+    assert [guard.admit(1, expensive=False) for _ in range(3)] == [0.0, 0.0, None]
+    assert guard.stats()["dropped"] == 3
+
+
+def test_render_is_charged_once_unless_the_update_already_paid():
+    async def scenario():
+        guard = FloodGuard(rate=1.0, burst=5, expensive_rate=0.0, expensive_burst=1, max_delay=0)
+        render_gate.set(RenderGate(guard, 1, charged=True))
+        await admit_render()
+        render_gate.set(RenderGate(guard, 1, charged=False))
+        await admit_render()
+        await admit_render()
+        render_gate.set(RenderGate(guard, 1, charged=False))
+        with pytest.raises(RenderRejected):
+            await admit_render()
+        render_gate.set(None)
+        await admit_render()
+        return guard.stats()["dropped"]
+
+    assert asyncio.run(scenario()) == 1